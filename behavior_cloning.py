@@ -0,0 +1,176 @@
+"""
+Behavior-cloning warm start of the PPO policy from recorded trajectories (trajectory_recorder.py).
+
+Before RL fine-tuning, the policy's mean action is regressed onto the recorded standardized
+actions (e.g. the RBC's charge-by-day/discharge-in-the-evening rule) and the value function
+onto the discounted returns of the recorded rewards, so PPO starts from the RBC's behaviour with
+a value function that already knows what that behaviour is worth. The observations go through the
+same layout, pipeline and VecNormalize statistics as in training; the statistics are initialized
+from the recording, so they are already meaningful when fine-tuning starts.
+"""
+import numpy as np
+import torch as th
+from stable_baselines3.common.vec_env import unwrap_vec_normalize
+import config
+from observation_pipeline import ObservationPipeline
+from trajectory_recorder import load_trajectories
+
+def discounted_returns(rewards, gamma: float):
+    """
+    Returns the discounted reward-to-go of every step of a (steps, ...) reward array.
+    """
+    returns = np.zeros(rewards.shape, dtype=np.float64)
+    running = np.zeros(rewards.shape[1:], dtype=np.float64)
+    for t in range(len(rewards) - 1, -1, -1):
+        running = rewards[t] + gamma*running
+        returns[t] = running
+    return returns
+
+def running_returns(rewards, gamma: float):
+    """
+    Returns the forward discounted sums VecNormalize scales rewards by (returns = returns*gamma + reward).
+    """
+    returns = np.zeros(rewards.shape, dtype=np.float64)
+    running = np.zeros(rewards.shape[1:], dtype=np.float64)
+    for t in range(len(rewards)):
+        running = running*gamma + rewards[t]
+        returns[t] = running
+    return returns
+
+def make_cloning_dataset(trajectory_dir, observation_names, features=None, cyclic_features=(), central_agent: bool = False):
+    """
+    Turns recorded trajectories into policy inputs and targets.
+
+    Args:
+        observation_names (list of str, optional): Observation layout of the policy (its building rows
+            for a central agent). None for a policy trained on the first building alone: its
+            observations, and only its samples, are used.
+        features, cyclic_features: Observation pipeline of the policy, see ObservationPipeline.
+        central_agent (bool): One sample per step with every building's observations and actions
+            flattened (DistrictEnvWrapper), instead of one sample per building and step.
+
+    Returns:
+        tuple: (observations, actions) with one row per sample, and the (steps, sequences) rewards,
+            one column per building (a single one for a central agent) in the order of the samples.
+            rewards is None if the recording has no rewards that match the policy's training env
+            (e.g. a central recording for a single-building policy, another reward function, or a
+            reward that couples the buildings, which a single-building env computes differently).
+    """
+    from custom_rewards import get_reward_function
+
+    observations, actions, rewards, metadata = load_trajectories(trajectory_dir)
+    first_building_only = observation_names is None and not central_agent
+    if observation_names is None:
+        observation_names = metadata['building_observation_names'][0]
+    missing = [name for name in observation_names if name not in metadata['observation_names']]
+    if missing:
+        raise ValueError(f"The trajectories in {trajectory_dir} have no {', '.join(missing)} observation(s)")
+
+    index = [metadata['observation_names'].index(name) for name in observation_names]
+    pipeline = ObservationPipeline(observation_names, features=features, cyclic_features=cyclic_features)
+    inputs = pipeline(observations[..., index])
+    steps, num_buildings = actions.shape[:2]
+
+    if metadata.get('reward_function') != config.REWARD_FUNCTION:
+        print(f"The trajectories were recorded with the '{metadata.get('reward_function')}' reward, the value function is not pretrained")
+        rewards = None
+    elif central_agent:
+        rewards = np.asarray(rewards).sum(axis=1, keepdims=True)
+    elif metadata['central_agent']:
+        rewards = None
+    elif num_buildings > 1 and not get_reward_function(metadata['reward_function']).independent_buildings:
+        print(f"The '{metadata['reward_function']}' reward of a building depends on the district it was recorded in, "
+              f"the value function is not pretrained")
+        rewards = None
+    else:
+        rewards = np.asarray(rewards)
+
+    if central_agent:
+        return inputs.reshape(steps, -1), np.asarray(actions).reshape(steps, -1), rewards
+    if first_building_only:
+        return inputs[:, 0], np.asarray(actions[:, 0]), None if rewards is None else rewards[:, :1]
+    # One sample per building and step, building by building
+    inputs = inputs.transpose(1, 0, 2).reshape(num_buildings*steps, -1)
+    actions = np.asarray(actions).transpose(1, 0, 2).reshape(num_buildings*steps, -1)
+    return inputs, actions, rewards
+
+def pretrain_policy(model, trajectory_dir=None, observation_names=None, features=None, cyclic_features=(), central_agent: bool = False,
+                    epochs: int = None, batch_size: int = None, learning_rate: float = None, log_std: float = None):
+    """
+    Behavior-clones model's policy (and fits its value function) from recorded trajectories.
+
+    If the model's environment is a VecNormalize, its observation (and reward) statistics are
+    set from the recording first and the policy is trained on the normalized observations.
+
+    Args:
+        model (PPO): The model to warm-start, before learn().
+        trajectory_dir (str, optional): Defaults to config.TRAJECTORY_DIR.
+        observation_names, features, cyclic_features, central_agent: The policy's observation layout, see make_cloning_dataset.
+        epochs, batch_size, learning_rate (optional): Default to config.PPO_BC_EPOCHS, PPO_BC_BATCH_SIZE and PPO_BC_LEARNING_RATE.
+        log_std (float, optional): Log standard deviation of the action distribution after cloning,
+            defaults to config.PPO_BC_LOG_STD (None keeps it).
+
+    Returns:
+        dict: The action and value losses of the last epoch.
+    """
+    trajectory_dir = config.TRAJECTORY_DIR if trajectory_dir is None else trajectory_dir
+    epochs = config.PPO_BC_EPOCHS if epochs is None else epochs
+    batch_size = config.PPO_BC_BATCH_SIZE if batch_size is None else batch_size
+    learning_rate = config.PPO_BC_LEARNING_RATE if learning_rate is None else learning_rate
+    log_std = config.PPO_BC_LOG_STD if log_std is None else log_std
+
+    inputs, actions, rewards = make_cloning_dataset(trajectory_dir, observation_names, features, cyclic_features, central_agent)
+    if inputs.shape[1:] != model.observation_space.shape:
+        raise ValueError(f"The policy expects {model.observation_space.shape[0]} observations, the trajectories give {inputs.shape[1]}")
+
+    vec_normalize = unwrap_vec_normalize(model.get_env())
+    if vec_normalize is not None and vec_normalize.norm_obs:
+        vec_normalize.obs_rms.mean = inputs.mean(axis=0).astype(np.float64)
+        vec_normalize.obs_rms.var = inputs.var(axis=0).astype(np.float64)
+        vec_normalize.obs_rms.count = float(len(inputs))
+        inputs = vec_normalize.normalize_obs(inputs)
+
+    values = None
+    if rewards is not None:
+        if vec_normalize is not None and vec_normalize.norm_reward:
+            vec_normalize.ret_rms.var = np.array(running_returns(rewards, vec_normalize.gamma).var())
+            vec_normalize.ret_rms.count = float(rewards.size)
+            rewards = vec_normalize.normalize_reward(rewards)
+        # Value targets in the order of the samples
+        values = discounted_returns(rewards, model.gamma).T.reshape(-1)
+
+    policy = model.policy
+    device = policy.device
+    inputs = th.as_tensor(np.asarray(inputs, dtype=np.float32), device=device)
+    actions = th.as_tensor(np.asarray(actions, dtype=np.float32), device=device)
+    values = None if values is None else th.as_tensor(values, dtype=th.float32, device=device)
+    optimizer = th.optim.Adam(policy.parameters(), lr=learning_rate)
+
+    policy.set_training_mode(True)
+    losses = {}
+    for epoch in range(epochs):
+        totals = {'action_loss': 0.0, 'value_loss': 0.0}
+        permutation = th.randperm(len(inputs), device=device)
+        for start in range(0, len(inputs), batch_size):
+            batch = permutation[start:start + batch_size]
+            mean_actions = policy.get_distribution(inputs[batch]).distribution.mean
+            loss = action_loss = th.nn.functional.mse_loss(mean_actions, actions[batch])
+            totals['action_loss'] += action_loss.item()*len(batch)
+            if values is not None:
+                value_loss = th.nn.functional.mse_loss(policy.predict_values(inputs[batch]).flatten(), values[batch])
+                loss = loss + value_loss
+                totals['value_loss'] += value_loss.item()*len(batch)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+        losses = {name: total/len(inputs) for name, total in totals.items()}
+        if epoch == 0 or (epoch + 1) % max(epochs//5, 1) == 0:
+            print(f"Behavior cloning epoch {epoch + 1}/{epochs}: action loss {losses['action_loss']:.4f}, value loss {losses['value_loss']:.4f}")
+    policy.set_training_mode(False)
+
+    if log_std is not None:
+        with th.no_grad():
+            policy.log_std.fill_(log_std)
+    return losses
@@ -0,0 +1,294 @@
+"""
+Performance benchmarks for the simulation, training and post-processing stages.
+
+    python benchmark.py                                   # all benchmarks, quick settings
+    python benchmark.py env kpis --output benchmarks      # a subset
+    python benchmark.py --compare benchmarks/<earlier>.json
+
+Measured on the bundled schema.json (buildings beyond the schema's are copies of Building_1
+backed by the bundled Building_1.csv):
+- env:  CityLearnEnv.step rate with SimpleRBC + TranslationLayer (and VectorizedRBC) for 1/9/N buildings;
+- ppo:  run_ppo_training samples/second for 1..K parallel environments;
+- kpis: KPI saving, summary recalculation and plot generation time versus episode length.
+
+Results are written to a JSON file named after the commit. --compare reports every result that
+is more than --tolerance worse than the earlier file and exits with status 1 if there is any.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import config
+from utils import load_schema, get_building_names
+
+BUNDLED_SCHEMA_FILE = Path(__file__).resolve().parent / 'schema.json'
+BUNDLED_BUILDING_FILE = Path(__file__).resolve().parent / 'Building_1.csv'
+
+def scaled_schema(schema_path, num_buildings: int):
+    """
+    Returns the schema with exactly num_buildings buildings: the first ones of the schema, then
+    copies of its first building reading the bundled Building_1.csv.
+    """
+    schema = load_schema(schema_path)
+    schema['root_directory'] = schema.get('root_directory') or str(Path(schema_path).parent.resolve())
+    names = get_building_names(schema)
+    buildings = {name: schema['buildings'][name] for name in names[:num_buildings]}
+
+    for i in range(len(buildings), num_buildings):
+        building = copy.deepcopy(schema['buildings'][names[0]])
+        building['energy_simulation'] = str(BUNDLED_BUILDING_FILE) # Absolute, so root_directory is ignored
+        buildings[f'Building_{i + 1}'] = building
+
+    schema['buildings'] = buildings
+    return schema
+
+def _result(value, unit, higher_is_better, **details):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better, **details}
+
+# --- Benchmarks ---
+
+def bench_env_step(schema_path, building_counts=(1, 9, 27), time_steps=168):
+    """
+    Steps CityLearnEnv with the per-building SimpleRBC and with the district-wide VectorizedRBC.
+    """
+    from citylearn.citylearn import CityLearnEnv
+    from rbc_agent import SimpleRBC, make_rbc
+    from translation_layer import TranslationLayer
+
+    results = {}
+    for num_buildings in building_counts:
+        schema = scaled_schema(schema_path, num_buildings)
+        start = time.perf_counter()
+        env = CityLearnEnv(schema, central_agent=False, episode_time_steps=time_steps)
+        results[f'env_construction/buildings={num_buildings}'] = _result(time.perf_counter() - start, 's', False)
+
+        translator = TranslationLayer(env.buildings)
+        simple_agents = [SimpleRBC(space) for space in env.action_space]
+        vectorized_agent = make_rbc(env)
+        controllers = {
+            'simple_rbc': lambda observations: translator.translate_actions(
+                [agent.predict(obs) for agent, obs in zip(simple_agents, observations)]),
+            'vectorized_rbc': lambda observations: translator.translate_batch(vectorized_agent.predict(observations)),
+        }
+
+        for name, controller in controllers.items():
+            observations, _ = env.reset()
+            steps = 0
+            start = time.perf_counter()
+            while not env.terminated:
+                observations, _, _, _, _ = env.step(controller(observations))
+                steps += 1
+            elapsed = time.perf_counter() - start
+            results[f'env_step/{name}/buildings={num_buildings}'] = _result(steps/elapsed, 'steps/s', True, steps=steps)
+            print(f"env_step {name}, {num_buildings} buildings: {steps/elapsed:.1f} steps/s")
+
+    return results
+
+def bench_ppo_training(schema_path, env_counts=(1, 2, 4), timesteps=2048):
+    """
+    Times run_ppo_training, including environment setup, for each number of parallel environments.
+    """
+    from ppo_agent import run_ppo_training
+    from sweep import apply_overrides
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        previous = apply_overrides({
+            'PPO_TRAINING_TIMESTEPS': timesteps,
+            'PPO_MODEL_PATH': str(Path(tmp_dir) / 'ppo_model.zip'),
+            'PPO_CHECKPOINT_DIR': str(Path(tmp_dir) / 'ppo_checkpoints'),
+            'PPO_RESUME': False, # Every environment count trains from scratch
+        })
+        try:
+            for num_envs in env_counts:
+                start = time.perf_counter()
+                agent = run_ppo_training(schema_path, num_envs=num_envs)
+                elapsed = time.perf_counter() - start
+                samples = agent.model.num_timesteps
+                results[f'ppo_training/num_envs={num_envs}'] = _result(samples/elapsed, 'samples/s', True, samples=samples)
+                print(f"ppo_training, {num_envs} env(s): {samples/elapsed:.1f} samples/s")
+        finally:
+            apply_overrides(previous)
+
+    return results
+
+def bench_kpi_postprocessing(schema_path, episode_lengths=(168, 720, 8760), storage_formats=('csv', 'parquet'), repeats=3):
+    """
+    Times saving the KPIs, recalculating the summary from the saved files, generating every plot
+    and regenerating the plots when nothing changed (best of repeats runs, these stages are short
+    enough to be noisy).
+
+    The KPI DataFrames come from the offline simulator, which produces the same frames as a
+    CityLearnEnv run in a fraction of the time.
+    """
+    from kpi_calculator import save_kpis, calculate_and_save_summary_kpis
+    from kpi_storage import get_storage
+    from offline_simulator import OfflineDistrict
+    from plot_kpis import generate_plots
+
+    results = {}
+    cwd = Path.cwd()
+    for length in episode_lengths:
+        district = OfflineDistrict(schema_path, episode_time_steps=length + 1)
+        simulation = district.simulate_battery(district.rbc_actions())
+        kpi_dfs = district.kpi_dataframes(simulation['soc'], simulation['energy_balance'])
+
+        for storage_format in storage_formats:
+            storage = get_storage(storage_format)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                kpi_dir = Path(tmp_dir) / 'calculated_kpis'
+                timings = {'save': [], 'summary': [], 'plots': [], 'plots_cached': []}
+
+                # generate_plots writes to gui/ in the working directory
+                previous_format = config.KPI_STORAGE_FORMAT
+                config.KPI_STORAGE_FORMAT = storage_format
+                os.chdir(tmp_dir)
+                try:
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        save_kpis(kpi_dfs, kpi_dir, storage=storage)
+                        timings['save'].append(time.perf_counter() - start)
+
+                        start = time.perf_counter()
+                        calculate_and_save_summary_kpis(kpi_dir, storage=storage)
+                        timings['summary'].append(time.perf_counter() - start)
+
+                        start = time.perf_counter()
+                        generate_plots(kpi_dir, force=True)
+                        timings['plots'].append(time.perf_counter() - start)
+
+                        start = time.perf_counter()
+                        generate_plots(kpi_dir)
+                        timings['plots_cached'].append(time.perf_counter() - start)
+                finally:
+                    os.chdir(cwd)
+                    config.KPI_STORAGE_FORMAT = previous_format
+
+            timings = {stage: min(elapsed) for stage, elapsed in timings.items()}
+            for stage, elapsed in timings.items():
+                results[f'kpis_{stage}/{storage_format}/steps={length}'] = _result(elapsed, 's', False)
+            print(f"kpis, {storage_format}, {length} steps: " + ', '.join(f'{stage} {elapsed:.2f} s' for stage, elapsed in timings.items()))
+
+    return results
+
+BENCHMARKS = {
+    'env': bench_env_step,
+    'ppo': bench_ppo_training,
+    'kpis': bench_kpi_postprocessing,
+}
+
+# ---------------------------
+
+def environment_info():
+    """
+    Returns the commit and the software/hardware the benchmarks ran on.
+    """
+    import citylearn
+    import pandas as pd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'citylearn': citylearn.__version__,
+    }
+
+def run_benchmarks(names=None, schema_path=None, output_dir='benchmarks', **kwargs):
+    """
+    Runs the selected benchmarks and writes their results to output_dir/<date>_<commit>.json.
+
+    Args:
+        names (list of str, optional): Keys of BENCHMARKS, defaults to all of them.
+        schema_path (str, optional): Defaults to the bundled schema.json.
+        **kwargs: Passed to the benchmark functions that accept them (e.g. building_counts).
+
+    Returns:
+        tuple: (results dict, path of the JSON file)
+    """
+    import inspect
+    schema_path = str(BUNDLED_SCHEMA_FILE) if schema_path is None else schema_path
+    names = list(BENCHMARKS) if not names else names
+
+    results = {}
+    for name in names:
+        function = BENCHMARKS[name]
+        parameters = inspect.signature(function).parameters
+        results.update(function(schema_path, **{key: value for key, value in kwargs.items() if key in parameters}))
+
+    info = environment_info()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = output_dir / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{info['commit'] or 'nocommit'}.json"
+    with open(output_file, 'w') as f:
+        json.dump({'info': info, 'results': results}, f, indent=2)
+    print(f"Benchmark results saved to {output_file}")
+    return results, output_file
+
+def compare_results(results: dict, baseline_file, tolerance: float = 0.1):
+    """
+    Prints the change of every result against an earlier results file.
+
+    Returns:
+        list of str: Names of the results that are more than tolerance worse than the baseline.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    print(f"\n--- Comparison with {baseline_file} ---")
+    for name in sorted(set(results) & set(baseline)):
+        current, previous = results[name]['value'], baseline[name]['value']
+        change = current/previous - 1.0 if previous else float('nan')
+        worse = -change if results[name]['higher_is_better'] else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = '  <-- REGRESSION'
+        print(f"{name:55s} {previous:12.4g} -> {current:12.4g} {results[name]['unit']:10s} ({100*change:+.1f}%){flag}")
+
+    print(f"{len(regressions)} regression(s) beyond {100*tolerance:.0f}%")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the performance benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--schema', default=None, help='Defaults to the bundled schema.json')
+    parser.add_argument('--output', default='benchmarks', help='Directory of the results JSON files')
+    parser.add_argument('--buildings', type=int, nargs='+', default=[1, 9, 27], help='Building counts for the env benchmark')
+    parser.add_argument('--time-steps', type=int, default=168, help='Episode length for the env benchmark')
+    parser.add_argument('--envs', type=int, nargs='+', default=[1, 2, 4], help='Parallel environment counts for the PPO benchmark')
+    parser.add_argument('--timesteps', type=int, default=2048, help='Training timesteps for the PPO benchmark')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[168, 720, 8760], help='Episode lengths for the KPI benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats of each KPI post-processing stage')
+    parser.add_argument('--compare', default=None, help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative slowdown reported as a regression')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results, _ = run_benchmarks(
+        args.benchmarks, schema_path=args.schema, output_dir=args.output,
+        building_counts=args.buildings, time_steps=args.time_steps,
+        env_counts=args.envs, timesteps=args.timesteps,
+        episode_lengths=args.lengths, repeats=args.repeats
+    )
+    if args.compare is not None and compare_results(results, args.compare, args.tolerance):
+        sys.exit(1)
@@ -5,17 +5,113 @@ This file contains the configuration parameters for the CityLearn simulation.
 
 # --- Simulation Parameters ---
 DATASET_NAME = 'citylearn_challenge_2020_climate_zone_1'
+SCHEMA_PATH = '/home/oli/Documents/Work/EC_RL/schema.json' # schema.json path or a CityLearn dataset name
 CENTRAL_AGENT = False
 EPISODE_TIME_STEPS = 1000 #8760 max
+SIMULATION_START_TIME_STEP = None # None = the schema's simulation_start_time_step
+SIMULATION_END_TIME_STEP = None # None = the schema's simulation_end_time_step
 BASE_OUTPUT_DIR = 'citylearn_output'
+DATASET_CACHE = True # Cache parsed data files and constructed environments (dataset_cache.py)
+DATASET_CACHE_DIR = '.dataset_cache'
 # ---------------------------
 
 # --- Agent Parameters ---
 AGENT_TYPE = 'RBC' # 'RBC' or 'PPO'
 # ---------------------------
 
+# --- RBC Parameters ---
+# Each value is either a scalar or a list with one value per building
+RBC_CHARGE_START_HOUR = 7 # Charge from this hour...
+RBC_DISCHARGE_START_HOUR = 16 # ...until this hour, then discharge...
+RBC_DISCHARGE_END_HOUR = 20 # ...until this hour
+RBC_CHARGE_ACTION = 1.0 # Standardized electrical storage action while charging
+RBC_DISCHARGE_ACTION = -1.0 # Standardized electrical storage action while discharging
+# ---------------------------
+
 # --- PPO Parameters ---
 PPO_TRAINING_TIMESTEPS = 10000
 PPO_MODEL_PATH = 'ppo_model.zip'
+PPO_NUM_ENVS = 1 # Number of parallel training environments (1 = single process DummyVecEnv)
+PPO_VEC_ENV_MODE = 'buildings' # 'buildings' (one env per building) or 'windows' (Building_1 split into episode windows)
+PPO_EVAL_MODE = 'single' # 'single' (first building only) or 'district' (every building, one batched prediction per step)
+PPO_CENTRAL_AGENT = False # One policy observing the whole district and acting for every building (evaluated in 'central' mode)
+REWARD_FUNCTION = 'grid_consumption' # Key in custom_rewards.REWARD_FUNCTIONS: 'grid_consumption', 'cost', 'carbon' or 'peak_penalty'
+REWARD_ELECTRICITY_PRICE = None # cost: fixed price per kWh (None = electricity_pricing observation, or kpi_calculator.ELECTRICITY_PRICE if the schema has no pricing data)
+REWARD_PEAK_WEIGHT = 1.0 # peak_penalty: penalty per kWh of district consumption above the peak
+REWARD_PEAK_THRESHOLD = None # peak_penalty: fixed peak in kWh (None = highest district consumption so far in the episode)
+PPO_OBSERVATION_FEATURES = None # Observations passed to the policy, in order (None = all active observations of the schema)
+PPO_CYCLIC_FEATURES = ['hour', 'month'] # Observations encoded as (sin, cos), see observation_pipeline.CYCLIC_PERIODS
+PPO_NORMALIZE_OBSERVATIONS = True # Scale observations with running mean/std statistics (VecNormalize), saved next to the model
+PPO_NORMALIZE_REWARD = True # Scale rewards by the running std of the discounted return during training
+PPO_NORMALIZE_CLIP = 10.0 # Clip normalized observations and rewards to +/- this value
+PPO_CHECKPOINT_DIR = 'ppo_checkpoints' # Directory of the training checkpoints and evaluation log
+PPO_CHECKPOINT_FREQ = 2048 # Timesteps between checkpoints (0 = only at the end of training)
+PPO_CHECKPOINT_KEEP = 3 # Number of most recent checkpoints kept (0 = all)
+PPO_RESUME = False # Resume training from the latest checkpoint in PPO_CHECKPOINT_DIR (it must come from the same settings), if there is one
+PPO_EVAL_FREQ = 0 # Timesteps between evaluation episodes run in a separate process (0 = no evaluation)
+PPO_BC_PRETRAIN = False # Behavior-clone the RBC from TRAJECTORY_DIR (recorded first if missing) before training from scratch
+PPO_BC_EPOCHS = 30 # Passes over the recorded trajectories
+PPO_BC_BATCH_SIZE = 256
+PPO_BC_LEARNING_RATE = 1e-3
+PPO_BC_LOG_STD = -1.0 # Log std of the action distribution after cloning, i.e. the exploration noise of fine-tuning (None = keep)
+RECORD_TRAJECTORIES = False # Record the RBC's (observation, action, reward) trajectories to TRAJECTORY_DIR (see trajectory_recorder.py)
+TRAJECTORY_DIR = 'trajectories' # Memory-mapped trajectory arrays, the behavior-cloning data
+PPO_EXPORT_NUMPY = True # Export the trained policy to <model>_policy.npz for NumPy inference (see numpy_policy.py)
+PPO_INFERENCE_BACKEND = 'numpy' # Evaluation policy: 'numpy' (exported .npz, no stable-baselines3) or 'sb3' (PPO.load)
 KPI_OUTPUT_DIR = 'calculated_kpis'
+KPI_SOURCE = 'env' # 'env' (in memory from env.buildings) or 'export' (CityLearn's rendered CSV files)
+SAVE_KPI_FILES = True # Write the KPI files (needed for plots)
+KPI_STORAGE_FORMAT = 'csv' # 'csv' (one file per KPI) or 'parquet' (single kpis.parquet per run, see kpi_storage.py)
+KPI_STREAMING = True # Accumulate the KPIs step by step (kpi_accumulator.py) instead of after the episode
+KPI_FLUSH_EVERY = 1000 # Streaming: append the KPI time series to disk every N steps (0 = summary only)
+KPI_LOG_EVERY = 0 # Streaming: print the running KPIs every N steps (0 = never)
+PROFILE_SIMULATION = True # Save per-phase wall times, steps/s and peak memory of the simulation loops to KPI_OUTPUT_DIR
+PROFILE_CPROFILE = False # Also save a cProfile of the simulation loops
+RENDER_EXPORTS = False # Let CityLearn export its CSV files on close() (required for KPI_SOURCE = 'export')
+# ---------------------------
+
+# --- Plot Parameters ---
+PLOT_OUTPUT_DIR = 'gui' # index.html and plots/ (one HTML file per figure sharing plots/plotly.min.js)
+PLOT_MAX_POINTS = 2000 # Time series longer than this are downsampled per line with LTTB (0 = plot every point)
+PLOT_MAX_WORKERS = None # Worker processes rendering the figures (None = one per CPU core, 1 = no workers)
+# ---------------------------
+
+# --- Run Registry Parameters ---
+RUN_REGISTRY = True # Index every run's settings, summary KPIs and KPI files in RUN_REGISTRY_PATH (see run_registry.py)
+RUN_REGISTRY_PATH = 'runs.sqlite' # SQLite database of the registered runs
+RUN_ARCHIVE = True # Copy each run's KPI files to RUN_ARCHIVE_DIR/<run_id>, since KPI_OUTPUT_DIR is overwritten by the next run
+RUN_ARCHIVE_DIR = 'runs' # Archived KPI files of the registered runs
+RUN_LABEL = None # Free-form name stored with the run (sweeps set it to the run directory)
+# ---------------------------
+
+# --- Controller Service Parameters ---
+SERVICE_HOST = '127.0.0.1' # Address the controller service listens on (see controller_service.py)
+SERVICE_PORT = 8765
+SERVICE_SOCKET_PATH = None # Serve on this Unix socket instead of HOST:PORT
+SERVICE_BATCH_WINDOW_MS = 1.0 # Requests arriving within this window after the first one are answered by one predict call
+SERVICE_MAX_BATCH_SIZE = 64 # Upper bound of a micro-batch
+# ---------------------------
+
+# --- Tariff Parameters ---
+TARIFF_FILE = 'tariffs.json' # What-if tariffs and carbon intensities priced by tariff_engine.py (None = baseline and schema only)
+TARIFF_BILLING_PERIOD = 'month' # Period of the tier thresholds and demand charges: 'month' or 'episode'
+# ---------------------------
+
+# --- Window Evaluation Parameters ---
+EVAL_NUM_WINDOWS = 12 # Windows the simulation period is split into by window_evaluation.py
+EVAL_MAX_WORKERS = None # None = one worker per CPU core
+# ---------------------------
+
+# --- Sweep Parameters ---
+SWEEP_OUTPUT_DIR = 'sweeps'
+SWEEP_MAX_WORKERS = None # None = one worker per CPU core
+# ---------------------------
+
+# --- Successive Halving Parameters ---
+HALVING_MIN_TIMESTEPS = 2048 # Training budget of the first rung (one PPO rollout)
+HALVING_ETA = 3 # Each rung keeps the best 1/ETA of the configurations and trains them ETA times longer, up to PPO_TRAINING_TIMESTEPS
+HALVING_EVAL_TIME_STEPS = 168 # Episode length the rungs are evaluated on (None = EPISODE_TIME_STEPS)
+HALVING_METRIC = 'total_cost' # Summary KPI the configurations are ranked by, lower is better
+HALVING_OUTPUT_DIR = 'halving'
+HALVING_MAX_WORKERS = None # None = one worker per CPU core
 # ---------------------------
@@ -0,0 +1,415 @@
+"""
+Local controller service: serves the actions of the configured controller (config.AGENT_TYPE)
+to an external building-management loop over HTTP on localhost or a Unix socket.
+
+    python controller_service.py                        # serve until interrupted
+    python controller_service.py --benchmark --clients 9 --requests 500
+
+Endpoints (JSON):
+- POST /predict {"building": "Building_1" (or its index), "observations": [...]}: the observation
+  vector of one building, in that building's observation layout (env.observation_names[i]).
+  Returns {"building", "standard_actions": [cooling, dhw, electrical], "actions": [...]}, where
+  actions holds the building's active actions in CityLearn's order (see TranslationLayer).
+- GET /health: the controller and the buildings it serves.
+- GET /stats: requests served, batch sizes and server-side latency percentiles.
+
+Requests arriving within config.SERVICE_BATCH_WINDOW_MS of each other are answered by a single
+controller predict call (micro-batching), so concurrent buildings share one policy evaluation.
+The --benchmark option runs fake clients (one connection per building) against an in-process
+server and reports the p50/p99 round-trip latency and the throughput.
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import config
+from translation_layer import TranslationLayer
+
+# --- Controllers ---
+
+class RBCController:
+    """
+    The RBC time-of-day rule for any subset of the buildings, with the per-building settings of make_rbc.
+    """
+    def __init__(self, env):
+        from rbc_agent import make_rbc
+        self.rbc = make_rbc(env)
+        self.hour_index = np.array([names.index('hour') for names in env.observation_names])
+
+    def predict(self, building_indices, observations):
+        """
+        Returns the (len(building_indices), 3) standardized actions of the given buildings.
+
+        Args:
+            building_indices (np.array): Building of every observation vector.
+            observations (list of np.array): One observation vector per request, in its building's layout.
+        """
+        from rbc_agent import rbc_electrical_action
+        hour = np.fromiter((obs[i] for obs, i in zip(observations, self.hour_index[building_indices])), dtype=float, count=len(observations))
+        actions = np.zeros((len(observations), 3))
+        actions[:, 2] = rbc_electrical_action(
+            hour, self.rbc.charge_start_hour[building_indices], self.rbc.discharge_start_hour[building_indices],
+            self.rbc.discharge_end_hour[building_indices], self.rbc.charge_action[building_indices],
+            self.rbc.discharge_action[building_indices]
+        )
+        return actions
+
+class PPOController:
+    """
+    The trained single-building PPO policy for any subset of the buildings, one batched prediction per call.
+    """
+    def __init__(self, env, model_path=None, schema_path=None):
+        from ppo_agent import ObservationBatcher, check_policy_observations, get_observation_pipeline_settings, \
+            get_policy_observation_names, load_policy
+        from observation_pipeline import ObservationPipeline
+
+        if config.PPO_CENTRAL_AGENT:
+            raise ValueError('A central agent needs the observations of every building at once, it cannot serve per-building requests.')
+        model_path = config.PPO_MODEL_PATH if model_path is None else model_path
+        schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+
+        observation_names = get_policy_observation_names(schema_path) or env.observation_names[0]
+        self.batchers = [ObservationBatcher([names], observation_names) for names in env.observation_names]
+        self.pipeline = ObservationPipeline(observation_names, **get_observation_pipeline_settings())
+        self.model, self.normalize_obs = load_policy(model_path)
+        check_policy_observations(self.model, len(self.pipeline.names))
+
+    def predict(self, building_indices, observations):
+        """
+        Returns the (len(building_indices), 3) standardized actions of the given buildings.
+        """
+        batch = np.concatenate([self.batchers[i]([obs]) for i, obs in zip(building_indices, observations)])
+        actions, _ = self.model.predict(self.normalize_obs(self.pipeline(batch)), deterministic=True)
+        return np.clip(actions, -1.0, 1.0)
+
+# Controllers selectable through config.AGENT_TYPE
+CONTROLLERS = {
+    'RBC': RBCController,
+    'PPO': PPOController,
+}
+
+def make_controller(env, agent_type: str = None):
+    """
+    Creates the controller registered under agent_type (defaults to config.AGENT_TYPE) for the env's buildings.
+    """
+    agent_type = config.AGENT_TYPE if agent_type is None else agent_type
+    if agent_type not in CONTROLLERS:
+        raise ValueError(f"Unknown AGENT_TYPE '{agent_type}'. Available: {', '.join(CONTROLLERS)}")
+    return CONTROLLERS[agent_type](env)
+
+# --- Statistics ---
+
+class LatencyStats:
+    """
+    Collects request latencies and reports their percentiles and the throughput.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.start = None
+        self.end = None
+
+    def add(self, start: float, end: float):
+        self.latencies.append(end - start)
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = end if self.end is None else max(self.end, end)
+
+    def summary(self):
+        if not self.latencies:
+            return {'requests': 0}
+        latencies = np.array(self.latencies)*1000.0
+        return {
+            'requests': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+            'throughput_rps': len(latencies)/max(self.end - self.start, 1e-9),
+        }
+
+# --- Service ---
+
+class ControllerService:
+    """
+    Answers observation requests with the controller's actions, micro-batching concurrent requests.
+    """
+    def __init__(self, env, controller, batch_window_ms: float = None, max_batch_size: int = None):
+        """
+        Args:
+            env (CityLearnEnv): Environment of the served buildings (names, observation layouts, actions).
+            controller: RBCController, PPOController or any object with predict(building_indices, observations).
+            batch_window_ms (float, optional): Defaults to config.SERVICE_BATCH_WINDOW_MS.
+            max_batch_size (int, optional): Defaults to config.SERVICE_MAX_BATCH_SIZE.
+        """
+        self.controller = controller
+        self.building_names = [b.name for b in env.buildings]
+        self.building_index = {name: i for i, name in enumerate(self.building_names)}
+        self.observation_sizes = [len(names) for names in env.observation_names]
+        self.action_mask = TranslationLayer(env.buildings).action_mask
+        self.batch_window = (config.SERVICE_BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms)/1000.0
+        self.max_batch_size = config.SERVICE_MAX_BATCH_SIZE if max_batch_size is None else max_batch_size
+        self.latency = LatencyStats()
+        self.batch_sizes = []
+        self._queue = None
+        self._batch_task = None
+
+    async def start(self, host: str = None, port: int = None, socket_path: str = None):
+        """
+        Starts the batching loop and the server (a Unix socket if socket_path is given).
+
+        Returns:
+            asyncio.Server: The listening server.
+        """
+        self._queue = asyncio.Queue()
+        self._batch_task = asyncio.create_task(self._batch_loop())
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self._handle_connection, path=socket_path)
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stop(self):
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            await asyncio.gather(self._batch_task, return_exceptions=True)
+            self._batch_task = None
+
+    async def predict(self, building, observations):
+        """
+        Queues one building's observations and returns its (standard_actions, actions) once its batch has run.
+        """
+        i = self.building_index.get(building, -1) if isinstance(building, str) else int(building)
+        if not 0 <= i < len(self.building_names):
+            raise ValueError(f"Unknown building {building}")
+        observations = np.asarray(observations, dtype=float)
+        if observations.shape != (self.observation_sizes[i],):
+            raise ValueError(f"{self.building_names[i]} has {self.observation_sizes[i]} observations, got {observations.size}")
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((i, observations, future))
+        result = await future
+        self.latency.add(start, time.perf_counter())
+        return i, result
+
+    async def _batch_loop(self):
+        """
+        Waits for a request, collects the requests arriving within the batch window and answers them with one predict call.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        building_indices = np.array([i for i, _, _ in batch], dtype=int)
+        try:
+            standard_actions = self.controller.predict(building_indices, [obs for _, obs, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batch_sizes.append(len(batch))
+        for (i, _, future), actions in zip(batch, standard_actions):
+            if not future.done():
+                future.set_result((actions.tolist(), actions[self.action_mask[i]].tolist()))
+
+    def stats(self):
+        return {
+            **self.latency.summary(),
+            'batches': len(self.batch_sizes),
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            'max_batch_size': max(self.batch_sizes, default=0),
+        }
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Serves the HTTP/1.1 requests of one (keep-alive) connection.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._route(method, path, body)
+                payload = json.dumps(response).encode()
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode() + payload
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        if method == 'POST' and path == '/predict':
+            try:
+                request = json.loads(body)
+                i, (standard_actions, actions) = await self.predict(request['building'], request['observations'])
+            except (KeyError, TypeError, ValueError) as e:
+                return '400 Bad Request', {'error': str(e)}
+            return '200 OK', {'building': self.building_names[i], 'standard_actions': standard_actions, 'actions': actions}
+        elif method == 'GET' and path == '/stats':
+            return '200 OK', self.stats()
+        elif method == 'GET' and path == '/health':
+            return '200 OK', {'controller': type(self.controller).__name__, 'buildings': self.building_names}
+        return '404 Not Found', {'error': f'No route {method} {path}'}
+
+# --- Fake client ---
+
+async def _open_connection(host, port, socket_path):
+    if socket_path is not None:
+        return await asyncio.open_unix_connection(socket_path)
+    return await asyncio.open_connection(host, port)
+
+async def http_request(reader, writer, method: str, path: str, payload=None):
+    """
+    Sends one request over an open keep-alive connection and returns the decoded JSON response.
+    """
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = (await reader.readline()).decode('latin-1').split(' ', 2)[1]
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    response = json.loads(await reader.readexactly(length))
+    if status != '200':
+        raise RuntimeError(f"{method} {path} failed ({status}): {response.get('error')}")
+    return response
+
+async def run_fake_clients(clients, num_requests: int, host: str = None, port: int = None, socket_path: str = None):
+    """
+    Simulates a building-management loop: one connection per client, all sending their building's
+    observations concurrently, each waiting for its answer before sending the next request.
+
+    Args:
+        clients (list of tuple): (building name, observation vector) sent by every client.
+        num_requests (int): Requests per client.
+
+    Returns:
+        dict: Client-side request count, p50/p99 round-trip latency (ms) and throughput (requests/s).
+    """
+    stats = LatencyStats()
+
+    async def client(building, building_observations):
+        reader, writer = await _open_connection(host, port, socket_path)
+        payload = {'building': building, 'observations': [float(value) for value in building_observations]}
+        try:
+            for _ in range(num_requests):
+                start = time.perf_counter()
+                await http_request(reader, writer, 'POST', '/predict', payload)
+                stats.add(start, time.perf_counter())
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client(building, obs) for building, obs in clients))
+    return stats.summary()
+
+# ---------------------------
+
+def make_service(schema_path=None):
+    """
+    Builds the environment of the served buildings and the service for config.AGENT_TYPE.
+
+    Returns:
+        tuple: (ControllerService, dict of each building's initial observations)
+    """
+    from dataset_cache import make_env
+    env = make_env(config.SCHEMA_PATH if schema_path is None else schema_path, central_agent=False)
+    observations, _ = env.reset()
+    service = ControllerService(env, make_controller(env))
+    return service, {b.name: obs for b, obs in zip(env.buildings, observations)}
+
+async def serve(schema_path=None, host: str = None, port: int = None, socket_path: str = None):
+    """
+    Runs the service until cancelled.
+    """
+    host = config.SERVICE_HOST if host is None else host
+    port = config.SERVICE_PORT if port is None else port
+    socket_path = config.SERVICE_SOCKET_PATH if socket_path is None else socket_path
+    service, _ = make_service(schema_path)
+    server = await service.start(host, port, socket_path)
+    print(f"{config.AGENT_TYPE} controller serving {len(service.building_names)} buildings on "
+          f"{socket_path if socket_path is not None else f'http://{host}:{port}'}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+async def benchmark(schema_path=None, num_clients: int = None, num_requests: int = 200, socket_path: str = None):
+    """
+    Runs the fake clients against an in-process service (port chosen by the OS) and prints the
+    client-side latency and throughput, and the server's batch statistics.
+
+    Args:
+        num_clients (int, optional): Concurrent clients, one per building (cycling through the
+            buildings if there are more clients than buildings). Defaults to one per building.
+
+    Returns:
+        dict: Client-side statistics and the service's statistics under 'server'.
+    """
+    service, observations = make_service(schema_path)
+    server = await service.start('127.0.0.1', 0, socket_path)
+    port = None if socket_path is not None else server.sockets[0].getsockname()[1]
+
+    names = list(observations)
+    num_clients = len(names) if num_clients is None else num_clients
+    clients = [(names[i % len(names)], observations[names[i % len(names)]]) for i in range(num_clients)]
+    try:
+        results = await run_fake_clients(clients, num_requests, '127.0.0.1', port, socket_path)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await service.stop()
+
+    results['server'] = service.stats()
+    print(f"{results['requests']} requests from {num_clients} clients: p50 {results['p50_ms']:.2f} ms, "
+          f"p99 {results['p99_ms']:.2f} ms, {results['throughput_rps']:.0f} requests/s, "
+          f"mean batch size {results['server']['mean_batch_size']:.1f}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the actions of config.AGENT_TYPE to external clients.')
+    parser.add_argument('--schema', default=None, help='Defaults to config.SCHEMA_PATH')
+    parser.add_argument('--host', default=None, help='Defaults to config.SERVICE_HOST')
+    parser.add_argument('--port', type=int, default=None, help='Defaults to config.SERVICE_PORT')
+    parser.add_argument('--socket', default=None, help='Unix socket path, defaults to config.SERVICE_SOCKET_PATH')
+    parser.add_argument('--benchmark', action='store_true', help='Run fake clients against an in-process service')
+    parser.add_argument('--clients', type=int, default=None, help='Benchmark: concurrent clients (default: one per building)')
+    parser.add_argument('--requests', type=int, default=200, help='Benchmark: requests per client')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        asyncio.run(benchmark(args.schema, args.clients, args.requests, args.socket))
+    else:
+        try:
+            asyncio.run(serve(args.schema, args.host, args.port, args.socket))
+        except KeyboardInterrupt:
+            pass
@@ -1,21 +1,187 @@
 # custom_rewards.py
 from citylearn.reward_function import RewardFunction
-from typing import List, Mapping, Union
+from operator import itemgetter
+from typing import Any, List, Mapping, Union
+import numpy as np
+import config
 
-class GridConsumptionReward(RewardFunction):
+class VectorizedReward(RewardFunction):
     """
-    A custom reward function that penalizes grid consumption.
-    The reward for each building is the negative of its net electricity consumption.
+    Base class of the rewards computed on arrays of all buildings' observations at once.
+
+    Subclasses list the observations they need in observation_keys and implement compute(), which
+    writes the per-building rewards into a reward array that is reused every step. CityLearn
+    passes one observation dict per building, so reading them is the only per-building Python
+    work. It is done with np.fromiter, the fastest way to read them (a temporary array per key),
+    and copied into one array per key allocated once for the number of buildings. calculate()
+    also returns a copy of the per-building rewards, since CityLearn keeps the rewards of every
+    step (a central agent gets a one-element list).
     """
+    observation_keys = ('net_electricity_consumption',)
+    # Whether a building's reward only depends on its own observations, i.e. is the same in a
+    # district env and in a single-building env of that building
+    independent_buildings = True
+
+    def __init__(self, env_metadata: Mapping[str, Any], **kwargs):
+        super().__init__(env_metadata, **kwargs)
+        self._getters = {key: itemgetter(key) for key in self.observation_keys}
+        self._reward = None
+        self._values = None
+
+    def _gather(self, observations: List[Mapping[str, Union[int, float]]]):
+        """
+        Fills the arrays of every observation key with the value of every building and returns them.
+        """
+        count = len(observations)
+        if self._reward is None or len(self._reward) != count:
+            self._reward = np.zeros(count)
+            self._values = {key: np.zeros(count) for key in self.observation_keys}
+        for key, getter in self._getters.items():
+            self._values[key][:] = np.fromiter(map(getter, observations), dtype=float, count=count)
+        return self._values
+
+    def compute(self, values: Mapping[str, np.ndarray], out: np.ndarray):
+        """
+        Writes the reward of every building into out.
+
+        Args:
+            values (dict of np.array): One array per observation key, one value per building.
+            out (np.array): Reward array to fill.
+        """
+        raise NotImplementedError
+
     def calculate(self, observations: List[Mapping[str, Union[int, float]]]) -> List[float]:
         """
-        Calculates the reward for each building.
+        Calculates the reward for each building (as an array), or their sum for a central agent.
         """
-        net_electricity_consumption = [o['net_electricity_consumption'] for o in observations]
-        reward = [-v for v in net_electricity_consumption]
+        self.compute(self._gather(observations), self._reward)
 
         if self.central_agent:
-            return [sum(reward)]
+            return [float(self._reward.sum())]
+        else:
+            return self._reward.copy() # The env keeps the rewards of every step
+
+class GridConsumptionReward(VectorizedReward):
+    """
+    A custom reward function that penalizes grid consumption.
+    The reward for each building is the negative of its net electricity consumption.
+    """
+    def compute(self, values, out):
+        np.negative(values['net_electricity_consumption'], out=out)
+
+class CostReward(VectorizedReward):
+    """
+    The negative electricity cost of each building: net consumption times the electricity_pricing
+    observation, or a fixed price. Exported energy is credited at the same price.
+    """
+    observation_keys = ('net_electricity_consumption', 'electricity_pricing')
+
+    def __init__(self, env_metadata: Mapping[str, Any], price: float = None, **kwargs):
+        """
+        Args:
+            price (float, optional): Fixed price per kWh instead of the electricity_pricing observation,
+                for schemas without pricing data (see get_reward_settings).
+        """
+        super().__init__(env_metadata, **kwargs)
+        self.price = price
+
+    def compute(self, values, out):
+        if self.price is None:
+            np.multiply(values['net_electricity_consumption'], values['electricity_pricing'], out=out)
+            np.negative(out, out=out)
         else:
-            return reward
+            np.multiply(values['net_electricity_consumption'], -self.price, out=out)
+
+class CarbonReward(VectorizedReward):
+    """
+    The negative carbon emissions of each building: grid imports times the carbon_intensity
+    observation. Exports do not offset emissions.
+    """
+    observation_keys = ('net_electricity_consumption', 'carbon_intensity')
+
+    def compute(self, values, out):
+        np.maximum(values['net_electricity_consumption'], 0.0, out=out)
+        np.multiply(out, values['carbon_intensity'], out=out)
+        np.negative(out, out=out)
+
+class PeakPenaltyReward(GridConsumptionReward):
+    """
+    The grid consumption reward minus a penalty on the district's net consumption above a peak.
+    The penalty is shared equally by the buildings, so a central agent receives it once.
+
+    The peak is peak_threshold if given, otherwise the highest district consumption so far in the
+    episode, i.e. every new peak is penalized. In a single-building env, the district is that building.
+    """
+    independent_buildings = False
+    def __init__(self, env_metadata: Mapping[str, Any], peak_weight: float = 1.0, peak_threshold: float = None, **kwargs):
+        """
+        Args:
+            peak_weight (float): Penalty per kWh above the peak.
+            peak_threshold (float, optional): Fixed peak in kWh, defaults to the running episode peak.
+        """
+        super().__init__(env_metadata, **kwargs)
+        self.peak_weight = peak_weight
+        self.peak_threshold = peak_threshold
+        self._peak = None
+
+    def reset(self):
+        self._peak = None
 
+    def compute(self, values, out):
+        super().compute(values, out)
+        district_consumption = -out.sum()
+        peak = self.peak_threshold if self.peak_threshold is not None else self._peak
+        if peak is not None and district_consumption > peak:
+            out -= self.peak_weight*(district_consumption - peak)/len(out)
+        self._peak = district_consumption if self._peak is None else max(self._peak, district_consumption)
+
+# Reward functions selectable through config.REWARD_FUNCTION
+REWARD_FUNCTIONS = {
+    'grid_consumption': GridConsumptionReward,
+    'cost': CostReward,
+    'carbon': CarbonReward,
+    'peak_penalty': PeakPenaltyReward,
+}
+
+def get_reward_function(name: str):
+    """
+    Returns the reward function class registered under the given name.
+    """
+    try:
+        return REWARD_FUNCTIONS[name]
+    except KeyError:
+        raise ValueError(f"Unknown reward function '{name}'. Available: {', '.join(REWARD_FUNCTIONS)}")
+
+def has_electricity_pricing(schema_path):
+    """
+    Returns whether any building of the schema has a pricing file with a non-zero price.
+    """
+    from pathlib import Path
+    from dataset_cache import read_data_file
+    from utils import get_building_names, load_schema
+
+    schema = load_schema(schema_path)
+    root_directory = Path(schema.get('root_directory') or Path(schema_path).parent)
+    files = {schema['buildings'][name].get('pricing') for name in get_building_names(schema)} - {None}
+    return any(np.any(read_data_file(root_directory / file)['electricity_pricing'].to_numpy() != 0) for file in files)
+
+def get_reward_settings(name: str = None, schema_path=None):
+    """
+    Returns the reward function class and its parameters from config as keyword arguments of
+    CityLearnEnv (reward_function, reward_function_kwargs).
+
+    The 'cost' reward uses config.REWARD_ELECTRICITY_PRICE if set. Otherwise it uses the
+    electricity_pricing observation, unless the schema (config.SCHEMA_PATH by default) has no
+    non-zero pricing data: then every reward would be 0, so the static kpi_calculator.ELECTRICITY_PRICE is used.
+    """
+    name = config.REWARD_FUNCTION if name is None else name
+    reward_function_kwargs = {}
+    if name == 'cost':
+        price = config.REWARD_ELECTRICITY_PRICE
+        if price is None and not has_electricity_pricing(config.SCHEMA_PATH if schema_path is None else schema_path):
+            from kpi_calculator import ELECTRICITY_PRICE
+            price = ELECTRICITY_PRICE
+        reward_function_kwargs = {'price': price}
+    elif name == 'peak_penalty':
+        reward_function_kwargs = {'peak_weight': config.REWARD_PEAK_WEIGHT, 'peak_threshold': config.REWARD_PEAK_THRESHOLD}
+    return {'reward_function': get_reward_function(name), 'reward_function_kwargs': reward_function_kwargs}
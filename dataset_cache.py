@@ -0,0 +1,146 @@
+"""
+On-disk cache for the parsed dataset files and constructed CityLearn environments.
+
+Building CityLearnEnv from a schema takes seconds (parsing the CSVs, converting them to lists,
+estimating the observation space), and a run builds several environments from the same schema.
+Two things are cached in config.DATASET_CACHE_DIR, keyed by the schema path and the modification
+times of the schema and every data file it references (and, for environments, of the modules of
+class arguments such as the reward function), so editing any of them invalidates the cache:
+
+- data files: every CSV parsed once into a .npy array that is opened memory-mapped afterwards
+  (read_data_file), shared by all processes of a sweep or a SubprocVecEnv;
+- environments: a pickled snapshot of the freshly constructed CityLearnEnv (make_env), which
+  loads in a fraction of the construction time.
+"""
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import citylearn
+from citylearn.citylearn import CityLearnEnv
+import config
+from utils import load_schema, get_building_names
+
+# Schema entries of a building that reference data files
+DATA_FILE_KEYS = ('energy_simulation', 'weather', 'carbon_intensity', 'pricing')
+
+def _file_signature(path: Path):
+    stat = path.stat()
+    return f'{path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}'
+
+def _digest(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+def _write_atomic(path: Path, write):
+    """
+    Writes through a temporary file so concurrent readers never see a partial file.
+    """
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def get_data_files(schema_path):
+    """
+    Returns the paths of the data files the schema's buildings reference.
+    """
+    schema = load_schema(schema_path)
+    root_directory = Path(schema.get('root_directory') or Path(schema_path).parent)
+    files = {
+        root_directory / schema['buildings'][name][key]
+        for name in get_building_names(schema) for key in DATA_FILE_KEYS
+        if schema['buildings'][name].get(key) is not None
+    }
+    return sorted(files)
+
+def dataset_key(schema_path):
+    """
+    Returns a key that changes whenever the schema or one of its data files changes.
+    """
+    schema_file = Path(schema_path)
+    schema_signature = _file_signature(schema_file) if schema_file.is_file() else schema_path
+    file_signatures = [_file_signature(path) for path in get_data_files(schema_path)]
+    return _digest(citylearn.__version__, schema_signature, *file_signatures)
+
+def read_data_file(path, cache_dir=None):
+    """
+    Reads a numeric data file as a DataFrame backed by a memory-mapped array.
+
+    The CSV is parsed once and stored as .npy next to its column names; files with
+    non-numeric columns are read with pd.read_csv every time.
+    """
+    path = Path(path)
+    if not config.DATASET_CACHE:
+        return pd.read_csv(path)
+
+    cache_dir = Path(config.DATASET_CACHE_DIR if cache_dir is None else cache_dir) / 'data'
+    cache_file = cache_dir / f'{path.stem}_{_digest(_file_signature(path))}.npy'
+    columns_file = cache_file.with_suffix('.json')
+
+    if not cache_file.exists() or not columns_file.exists():
+        df = pd.read_csv(path)
+        if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+            return df
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(cache_file, lambda f: np.save(f, df.to_numpy(dtype=float)))
+        _write_atomic(columns_file, lambda f: f.write(json.dumps(list(df.columns)).encode()))
+        return df
+
+    with open(columns_file) as f:
+        columns = json.load(f)
+    return pd.DataFrame(np.load(cache_file, mmap_mode='r'), columns=columns, copy=False)
+
+def make_env(schema_path, cache_dir=None, **kwargs):
+    """
+    Returns a new CityLearnEnv, loaded from a cached snapshot when one exists for the same
+    dataset and keyword arguments.
+
+    Args:
+        schema_path (str): Path to the schema file or a CityLearn dataset name.
+        cache_dir (str, optional): Defaults to config.DATASET_CACHE_DIR.
+        **kwargs: Passed to CityLearnEnv.
+
+    Returns:
+        CityLearnEnv: A freshly constructed (not yet reset) environment.
+    """
+    if kwargs.get('render_mode', 'none') == 'none':
+        # Nothing is rendered, so these don't have to split the cache
+        kwargs.pop('render_directory', None)
+        kwargs.pop('render_session_name', None)
+
+    if not config.DATASET_CACHE:
+        return CityLearnEnv(schema_path, **kwargs)
+
+    cache_dir = Path(config.DATASET_CACHE_DIR if cache_dir is None else cache_dir) / 'envs'
+    # Classes (e.g. the reward function) are pickled as instances, so their source is part of the key
+    arguments = sorted(
+        (name, repr(value), _file_signature(Path(inspect.getfile(value))) if inspect.isclass(value) else None)
+        for name, value in kwargs.items()
+    )
+    cache_file = cache_dir / f'env_{_digest(dataset_key(schema_path), arguments)}.pkl'
+
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable environment cache {cache_file.name}: {e}")
+
+    env = CityLearnEnv(schema_path, **kwargs)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(cache_file, lambda f: pickle.dump(env, f, protocol=pickle.HIGHEST_PROTOCOL))
+    return env
+
+def clear_cache(cache_dir=None):
+    """
+    Deletes all cached data files and environments.
+    """
+    import shutil
+    cache_dir = Path(config.DATASET_CACHE_DIR if cache_dir is None else cache_dir)
+    if cache_dir.exists():
+        shutil.rmtree(cache_dir)
+        print(f"Cleared dataset cache {cache_dir}")
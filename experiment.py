@@ -0,0 +1,78 @@
+"""
+Runs a single experiment (simulation and KPI calculation) with the current settings in config.
+The agent modules are imported on demand, so e.g. an RBC run never imports stable-baselines3.
+"""
+from pathlib import Path
+import config
+
+def run_experiment(schema_path=None):
+    """
+    Runs the agent selected by config.AGENT_TYPE and writes its KPIs to config.KPI_OUTPUT_DIR.
+
+    Returns:
+        dict: The summary KPIs of the run.
+    """
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+
+    if config.AGENT_TYPE == 'RBC':
+        return run_rbc(schema_path)
+    elif config.AGENT_TYPE == 'PPO':
+        from ppo_agent import run_ppo_training
+        run_ppo_training(schema_path=schema_path)
+        return evaluate_ppo(schema_path)
+    else:
+        raise ValueError(f"Unknown AGENT_TYPE '{config.AGENT_TYPE}'. Use 'RBC' or 'PPO'.")
+
+def register(summary, agent_type: str, schema_path):
+    """
+    Adds the run of agent_type on schema_path to the run registry (if config.RUN_REGISTRY) and
+    returns its summary KPIs.
+    """
+    if config.RUN_REGISTRY and summary is not None:
+        from run_registry import register_run
+        register_run(summary, agent_type, schema_path, config.KPI_OUTPUT_DIR)
+    return summary
+
+def run_rbc(schema_path=None):
+    """
+    Runs the RBC simulation and returns its summary KPIs.
+    """
+    from rbc_agent import run_rbc_simulation
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+    summary = run_rbc_simulation(
+        schema_path=schema_path,
+        episode_time_steps=config.EPISODE_TIME_STEPS,
+        central_agent=config.CENTRAL_AGENT,
+        simulation_start_time_step=config.SIMULATION_START_TIME_STEP,
+        simulation_end_time_step=config.SIMULATION_END_TIME_STEP
+    )
+    return register(summary, 'RBC', schema_path)
+
+def evaluate_ppo(schema_path=None, mode=None):
+    """
+    Evaluates the PPO model saved at config.PPO_MODEL_PATH and returns its summary KPIs.
+    mode is 'single', 'district' or 'central', see run_ppo_evaluation.
+    """
+    from ppo_agent import run_ppo_evaluation
+    from kpi_calculator import calculate_and_save_kpis
+    from kpi_accumulator import make_kpi_accumulator
+    from profiler import make_profiler
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+    output_dir = Path(config.BASE_OUTPUT_DIR)
+    kpi_output_dir = Path(config.KPI_OUTPUT_DIR)
+
+    accumulator = make_kpi_accumulator(kpi_output_dir) if config.KPI_STREAMING else None
+    profiler = make_profiler('ppo_evaluation')
+    eval_env = run_ppo_evaluation(schema_path=schema_path, accumulator=accumulator, profiler=profiler, mode=mode)
+
+    profiler.start()
+    with profiler.phase('kpi_postprocess'):
+        if accumulator is not None:
+            summary = accumulator.finish()
+        else:
+            # Calculate and save KPIs
+            summary = calculate_and_save_kpis(output_dir, kpi_output_dir, eval_env)
+    profiler.stop()
+
+    profiler.save(kpi_output_dir)
+    return register(summary, 'PPO', schema_path)
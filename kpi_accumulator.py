@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import config
+from kpi_calculator import ELECTRICITY_PRICE, KPI_NAMES
+from kpi_storage import get_storage
+from utils import make_timestamps
+
+class KPIAccumulator:
+    """
+    Streaming KPI calculation: running totals are updated after every env.step with O(1)
+    memory per building, so the KPIs are available mid-run and no end-of-episode export
+    has to be rendered or parsed.
+
+    Optionally the KPI time series are buffered and appended, flush_every steps at a time, to
+    the same files kpi_calculator.save_kpis writes through the kpi_storage backend.
+    """
+    def __init__(self, kpi_output_dir: Path = None, flush_every: int = 0, price: float = ELECTRICITY_PRICE, log_every: int = 0, storage=None):
+        """
+        Args:
+            kpi_output_dir (Path, optional): Where the summary (and flushed time series) are saved.
+                Nothing is written if None.
+            flush_every (int): Append the buffered time series to disk every N steps (0 = totals only).
+            price (float): Electricity price per kWh.
+            log_every (int): Print the running summary every N steps (0 = never).
+            storage (optional): A kpi_storage backend, defaults to the one set in config.KPI_STORAGE_FORMAT.
+        """
+        self.kpi_output_dir = None if kpi_output_dir is None else Path(kpi_output_dir)
+        self.flush_every = flush_every if self.kpi_output_dir is not None else 0
+        self.price = price
+        self.log_every = log_every
+        self.storage = get_storage() if storage is None else storage
+        self.steps = 0
+        self._initialized = False
+
+    def _initialize(self, env):
+        """
+        Allocates the running totals once the number of buildings is known.
+        """
+        n = len(env.buildings)
+        self.columns = [f'Building_{i+1}' for i in range(n)]
+        self.start_time_step = env.episode_tracker.episode_start_time_step
+        self.seconds_per_time_step = env.seconds_per_time_step
+
+        self.cost = np.zeros(n)
+        self.carbon_emissions = np.zeros(n)
+        self.pv_generation = np.zeros(n)
+        self.charged = np.zeros(n)
+        self.discharged = np.zeros(n)
+        self.max_consumption = -np.inf
+        self.max_load = -np.inf
+
+        # Current step values, one row per KPI in KPI_NAMES order
+        self._step_values = np.zeros((len(KPI_NAMES), n))
+        self._buffer = np.zeros((self.flush_every, len(KPI_NAMES), n)) if self.flush_every > 0 else None
+        self._buffered = 0
+        self._flushed = 0
+
+        if self.kpi_output_dir is not None:
+            self.kpi_output_dir.mkdir(parents=True, exist_ok=True)
+            for item in self.kpi_output_dir.iterdir():
+                if item.is_file():
+                    item.unlink()
+
+        self._initialized = True
+
+    def update(self, env):
+        """
+        Adds the time step that the last env.step() call simulated.
+        """
+        if not self._initialized:
+            self._initialize(env)
+
+        t = env.time_step - 1
+        grid_consumption, load, cost, carbon, pv, soc, action = self._step_values
+        for i, building in enumerate(env.buildings):
+            grid_consumption[i] = building.net_electricity_consumption[t]
+            load[i] = building.non_shiftable_load[t]
+            pv[i] = abs(building.solar_generation[t])
+            soc[i] = building.electrical_storage.soc[t]
+            action[i] = building.electrical_storage.energy_balance[t]
+            carbon[i] = building.carbon_intensity.carbon_intensity[t]
+
+        np.multiply(grid_consumption, self.price, out=cost)
+        np.multiply(grid_consumption, carbon, out=carbon)
+
+        self.cost += cost
+        self.carbon_emissions += carbon
+        self.pv_generation += pv
+        self.charged += np.maximum(action, 0.0)
+        self.discharged += np.minimum(action, 0.0)
+        self.max_consumption = max(self.max_consumption, grid_consumption.sum())
+        self.max_load = max(self.max_load, load.sum())
+        self.steps += 1
+
+        if self._buffer is not None:
+            self._buffer[self._buffered] = self._step_values
+            self._buffered += 1
+            if self._buffered == self.flush_every:
+                self.flush()
+
+        if self.log_every and self.steps % self.log_every == 0:
+            summary = self.summary()
+            print(f"Step {self.steps}: cost {summary['total_cost']:.2f}, carbon {summary['total_carbon_emissions']:.2f}, "
+                  f"peak {summary['max_consumption']:.2f} kWh")
+
+    def flush(self):
+        """
+        Appends the buffered time series to the KPI files.
+        """
+        if self._buffer is None or self._buffered == 0:
+            return
+
+        index = make_timestamps(self.start_time_step + self._flushed, self._buffered, self.seconds_per_time_step)
+        kpi_dfs = {
+            kpi_name: pd.DataFrame(self._buffer[:self._buffered, k], index=index, columns=self.columns)
+            for k, kpi_name in enumerate(KPI_NAMES)
+        }
+        self.storage.append(kpi_dfs, self.kpi_output_dir, header=self._flushed == 0)
+
+        self._flushed += self._buffered
+        self._buffered = 0
+
+    def summary(self):
+        """
+        Returns the summary KPIs so far, with the same keys as kpi_calculator.summarize_kpis.
+        """
+        summary_data = {
+            'total_cost': self.cost.sum(),
+            'total_carbon_emissions': self.carbon_emissions.sum(),
+            'max_consumption': self.max_consumption,
+            'max_load': self.max_load,
+            'total_pv_generation': self.pv_generation.sum(),
+        }
+        for building, charged, discharged in zip(self.columns, self.charged, self.discharged):
+            summary_data[f'{building}_charged'] = charged
+            summary_data[f'{building}_discharged'] = discharged
+        summary_data['total_charged'] = self.charged.sum()
+        summary_data['total_discharged'] = abs(self.discharged.sum())
+        return summary_data
+
+    def finish(self):
+        """
+        Flushes the remaining time series, saves the summary KPIs and returns them.
+        """
+        self.flush()
+        summary = self.summary()
+        if self.kpi_output_dir is not None:
+            self.storage.save_summary(summary, self.kpi_output_dir)
+            print(f"Streamed KPIs over {self.steps} steps saved to '{self.kpi_output_dir}'")
+        return summary
+
+
+def make_kpi_accumulator(kpi_output_dir: Path):
+    """
+    Creates a KPIAccumulator with the streaming settings from config. Like the non-streaming
+    path, it writes nothing (and leaves kpi_output_dir untouched) if config.SAVE_KPI_FILES is off.
+    """
+    return KPIAccumulator(
+        kpi_output_dir if config.SAVE_KPI_FILES else None,
+        flush_every=config.KPI_FLUSH_EVERY,
+        log_every=config.KPI_LOG_EVERY
+    )
@@ -1,11 +1,107 @@
 
+import re
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import config
+from utils import make_timestamps
+
+ELECTRICITY_PRICE = 0.33 # Static price per kWh
+
+# KPI DataFrames produced for every run, in order
+KPI_NAMES = (
+    'grid_consumption',
+    'load',
+    'cost',
+    'carbon_emissions',
+    'pv_generation',
+    'electrical_storage_soc',
+    'electrical_storage_action',
+)
+
+def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env, source: str = None, save: bool = None):
+    """
+    Calculates the final KPIs of a finished simulation and optionally saves them.
+
+    Args:
+        output_dir (Path): Directory with the CityLearn exports (only read when source is 'export').
+        kpi_output_dir (Path): Directory the KPI files are written to.
+        env (CityLearnEnv): The environment the simulation ran in.
+        source (str, optional): 'env' reads the time series from the live env.buildings,
+            'export' from the files CityLearn rendered on close(). Defaults to config.KPI_SOURCE.
+        save (bool, optional): Write the KPI files. Defaults to config.SAVE_KPI_FILES.
+
+    Returns:
+        dict: The summary KPIs, or None if the exported files could not be found.
+    """
+    source = config.KPI_SOURCE if source is None else source
+    save = config.SAVE_KPI_FILES if save is None else save
+
+    if source == 'env':
+        kpi_dfs = collect_kpis_from_env(env)
+    elif source == 'export':
+        kpi_dfs = read_exported_kpis(output_dir, env)
+    else:
+        raise ValueError(f"Unknown KPI source '{source}'. Use 'env' or 'export'.")
+
+    if kpi_dfs is None:
+        return None
+
+    summary = summarize_kpis(kpi_dfs)
+    if save:
+        save_kpis(kpi_dfs, kpi_output_dir, summary)
+    return summary
+
+
+def collect_kpis_from_env(env, price: float = ELECTRICITY_PRICE):
+    """
+    Builds the KPI DataFrames directly from the live env.buildings objects.
+
+    All KPIs are computed on a single (n_kpis, time_steps, n_buildings) array; the returned
+    DataFrames wrap slices of it. Like the CityLearn exports, the time series cover the
+    time steps the agent acted on.
+    """
+    steps = env.time_step
+    columns = [f'Building_{i+1}' for i in range(len(env.buildings))]
+    timestamps = make_timestamps(env.episode_tracker.episode_start_time_step, steps, env.seconds_per_time_step)
+
+    values = np.zeros((len(KPI_NAMES), steps, len(columns)))
+    grid_consumption, load, cost, carbon, pv, soc, action = values
+
+    for i, building in enumerate(env.buildings):
+        grid_consumption[:, i] = building.net_electricity_consumption[:steps]
+        load[:, i] = building.non_shiftable_load[:steps]
+        pv[:, i] = np.abs(building.solar_generation[:steps])
+        soc[:, i] = building.electrical_storage.soc[:steps]
+        action[:, i] = building.electrical_storage.energy_balance[:steps]
+        carbon[:, i] = building.carbon_intensity.carbon_intensity[:steps]
+
+    # Cost and carbon emissions
+    np.multiply(grid_consumption, price, out=cost)
+    np.multiply(grid_consumption, carbon, out=carbon)
+
+    return {name: pd.DataFrame(values[k], index=timestamps, columns=columns) for k, name in enumerate(KPI_NAMES)}
+
+
+def latest_exported_episode(output_dir: Path):
+    """
+    Returns the number of the last episode CityLearn exported to output_dir (0 if there is none).
+    """
+    episodes = [
+        int(match.group(1)) for path in Path(output_dir).glob('exported_data_building_1_ep*.csv')
+        if (match := re.fullmatch(r'exported_data_building_1_ep(\d+)\.csv', path.name))
+    ]
+    return max(episodes, default=0)
+
 
-def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env):
+def read_exported_kpis(output_dir: Path, env, episode: int = None):
     """
-    Reads the simulation output from CityLearn, calculates and saves the final KPIs.
+    Reads the simulation output files rendered by CityLearn and builds the KPI DataFrames.
+
+    Args:
+        episode (int, optional): Episode number of the exported files, defaults to the last one.
     """
+    episode = latest_exported_episode(output_dir) if episode is None else episode
     num_buildings = len(env.buildings)
     building_ids = [i + 1 for i in range(num_buildings)]
 
@@ -13,11 +109,11 @@ def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env):
     all_building_dfs = []
     for bid in building_ids:
         try:
-            df = pd.read_csv(output_dir / f'exported_data_building_{bid}_ep0.csv', index_col='timestamp')
+            df = pd.read_csv(output_dir / f'exported_data_building_{bid}_ep{episode}.csv', index_col='timestamp')
             all_building_dfs.append(df)
         except FileNotFoundError:
-            print(f"Could not find exported_data_building_{bid}_ep0.csv in {output_dir}")
-            return
+            print(f"Could not find exported_data_building_{bid}_ep{episode}.csv in {output_dir}")
+            return None
             
     # --- Prepare DataFrames for each KPI ---
     
@@ -35,7 +131,7 @@ def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env):
     all_battery_dfs = []
     for bid in building_ids:
         try:
-            df = pd.read_csv(output_dir / f'exported_data_building_{bid}_battery_ep0.csv', index_col='timestamp')
+            df = pd.read_csv(output_dir / f'exported_data_building_{bid}_battery_ep{episode}.csv', index_col='timestamp')
             all_battery_dfs.append(df)
         except FileNotFoundError:
             # Not all buildings have batteries
@@ -50,20 +146,18 @@ def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env):
     action_df = action_df.fillna(0)
 
     # Cost
-    price = 0.33 # Assuming static price for now
-    cost_df = grid_consumption_df.multiply(price)
+    cost_df = grid_consumption_df.multiply(ELECTRICITY_PRICE)
 
     # Carbon Emissions
     try:
-        community_df = pd.read_csv(output_dir / f'exported_data_community_ep0.csv', index_col='timestamp')
+        community_df = pd.read_csv(output_dir / f'exported_data_community_ep{episode}.csv', index_col='timestamp')
         carbon_intensity = community_df['Carbon Intensity-kg_CO2/kWh']
         carbon_df = grid_consumption_df.multiply(carbon_intensity, axis='index')
     except (FileNotFoundError, KeyError):
         print("Could not find carbon intensity data. Carbon emissions will not be calculated.")
         carbon_df = pd.DataFrame(index=grid_consumption_df.index)
 
-    # --- Save KPIs ---
-    kpi_dfs = {
+    return {
         'grid_consumption': grid_consumption_df,
         'load': load_df,
         'cost': cost_df,
@@ -73,6 +167,17 @@ def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env):
         'electrical_storage_action': action_df,
     }
 
+
+def save_kpis(kpi_dfs: dict, kpi_output_dir: Path, summary: dict = None, storage=None):
+    """
+    Saves the KPI DataFrames (one column per building), their totals and the summary KPIs.
+
+    Args:
+        storage (optional): A kpi_storage backend, defaults to the one set in config.KPI_STORAGE_FORMAT.
+    """
+    from kpi_storage import get_storage
+    storage = get_storage() if storage is None else storage
+
     # Create the KPI output directory if it doesn't exist
     kpi_output_dir.mkdir(parents=True, exist_ok=True)
     # Clear the directory
@@ -80,69 +185,57 @@ def calculate_and_save_kpis(output_dir: Path, kpi_output_dir: Path, env):
         if item.is_file():
             item.unlink()
 
-    for kpi_name, df in kpi_dfs.items():
-        if not df.empty:
-            df.to_csv(kpi_output_dir / f'{kpi_name}.csv', index_label='timestamp')
-            
-            # Save total KPI
-            total_df = pd.DataFrame(df.sum(axis=1), columns=[kpi_name])
-            total_df.to_csv(kpi_output_dir / f'total_{kpi_name}.csv', index_label='timestamp')
+    summary = summarize_kpis(kpi_dfs) if summary is None else summary
+    storage.save(kpi_dfs, kpi_output_dir, summary)
 
-    print(f"Custom KPIs processed and saved to: {kpi_output_dir}")
-    
-    calculate_and_save_summary_kpis(kpi_output_dir)
+    print(f"Custom KPIs and summary KPIs processed and saved to: {kpi_output_dir}")
 
 
-def calculate_and_save_summary_kpis(kpi_output_dir: Path):
+def summarize_kpis(kpi_dfs: dict):
     """
-    Calculates summary KPIs from the simulation results and saves them to a CSV file.
+    Calculates the summary KPIs from the KPI DataFrames.
     """
     summary_data = {}
 
     # Total Cost
-    total_cost_df = pd.read_csv(kpi_output_dir / 'total_cost.csv')
-    summary_data['total_cost'] = total_cost_df['cost'].sum()
+    summary_data['total_cost'] = kpi_dfs['cost'].to_numpy().sum()
 
     # Total Carbon Emissions
-    try:
-        total_carbon_df = pd.read_csv(kpi_output_dir / 'total_carbon_emissions.csv')
-        summary_data['total_carbon_emissions'] = total_carbon_df['carbon_emissions'].sum()
-    except FileNotFoundError:
-        summary_data['total_carbon_emissions'] = 0
+    carbon_df = kpi_dfs.get('carbon_emissions')
+    summary_data['total_carbon_emissions'] = carbon_df.to_numpy().sum() if carbon_df is not None and not carbon_df.empty else 0
 
     # Max Consumption
-    total_grid_consumption_df = pd.read_csv(kpi_output_dir / 'total_grid_consumption.csv')
-    summary_data['max_consumption'] = total_grid_consumption_df['grid_consumption'].max()
+    summary_data['max_consumption'] = kpi_dfs['grid_consumption'].to_numpy().sum(axis=1).max()
 
     # Max Load
-    total_load_df = pd.read_csv(kpi_output_dir / 'total_load.csv')
-    summary_data['max_load'] = total_load_df['load'].max()
+    summary_data['max_load'] = kpi_dfs['load'].to_numpy().sum(axis=1).max()
 
     # Total PV Generation
-    total_pv_generation_df = pd.read_csv(kpi_output_dir / 'total_pv_generation.csv')
-    summary_data['total_pv_generation'] = total_pv_generation_df['pv_generation'].sum()
+    summary_data['total_pv_generation'] = kpi_dfs['pv_generation'].to_numpy().sum()
 
     # Battery Charge/Discharge
-    electrical_storage_action_df = pd.read_csv(kpi_output_dir / 'electrical_storage_action.csv')
-    
-    total_charged = 0
-    total_discharged = 0
-
-    for building in electrical_storage_action_df.columns[1:]:
-        charged = electrical_storage_action_df[electrical_storage_action_df[building] > 0][building].sum()
-        discharged = electrical_storage_action_df[electrical_storage_action_df[building] < 0][building].sum()
-        
-        summary_data[f'{building}_charged'] = charged
-        summary_data[f'{building}_discharged'] = discharged
-        
-        total_charged += charged
-        total_discharged += discharged
-
-    summary_data['total_charged'] = total_charged
-    summary_data['total_discharged'] = abs(total_discharged)
-
-    # Create DataFrame and save to CSV
-    summary_df = pd.DataFrame([summary_data])
-    summary_df.to_csv(kpi_output_dir / 'summary_kpis.csv', index=False)
-
-    print("Summary KPIs calculated and saved to 'calculated_kpis/summary_kpis.csv'")
+    action = kpi_dfs['electrical_storage_action'].to_numpy(dtype=float)
+    charged = np.where(action > 0, action, 0.0).sum(axis=0)
+    discharged = np.where(action < 0, action, 0.0).sum(axis=0)
+
+    for building, building_charged, building_discharged in zip(kpi_dfs['electrical_storage_action'].columns, charged, discharged):
+        summary_data[f'{building}_charged'] = building_charged
+        summary_data[f'{building}_discharged'] = building_discharged
+
+    summary_data['total_charged'] = charged.sum()
+    summary_data['total_discharged'] = abs(discharged.sum())
+
+    return summary_data
+
+
+def calculate_and_save_summary_kpis(kpi_output_dir: Path, storage=None):
+    """
+    Calculates summary KPIs from KPI files saved earlier and saves them alongside.
+    """
+    from kpi_storage import get_storage
+    storage = get_storage() if storage is None else storage
+
+    kpi_dfs, _ = storage.load(kpi_output_dir)
+    storage.save_summary(summarize_kpis(kpi_dfs), kpi_output_dir)
+
+    print(f"Summary KPIs calculated and saved to '{kpi_output_dir}'")
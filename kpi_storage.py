@@ -0,0 +1,195 @@
+"""
+Storage backends for the KPI files of a run.
+
+'csv' writes the original layout ({kpi_name}.csv, total_{kpi_name}.csv and summary_kpis.csv).
+'parquet' writes one compressed file per run, kpis.parquet, with one '{kpi_name}/{building}'
+column per KPI and building; the summary KPIs and the run metadata are embedded in the file's
+key-value metadata. Totals are not stored, they are summed on load.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import config
+from kpi_calculator import KPI_NAMES
+
+def run_metadata():
+    """
+    Returns the settings of the current run that are stored alongside its KPIs.
+    """
+    return {
+        'agent_type': config.AGENT_TYPE,
+        'schema_path': str(config.SCHEMA_PATH),
+        'episode_time_steps': config.EPISODE_TIME_STEPS,
+        'reward_function': config.REWARD_FUNCTION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+class CSVStorage:
+    """
+    One CSV file per KPI, one per KPI total and one for the summary.
+    """
+    def save(self, kpi_dfs: dict, kpi_output_dir: Path, summary: dict, metadata: dict = None):
+        """
+        Writes the KPI DataFrames, their totals and the summary KPIs.
+        """
+        self.append(kpi_dfs, kpi_output_dir, header=True)
+        self.save_summary(summary, kpi_output_dir, metadata)
+
+    def append(self, kpi_dfs: dict, kpi_output_dir: Path, header: bool = False):
+        """
+        Appends a chunk of the KPI time series (header=True starts new files).
+        """
+        mode = 'w' if header else 'a'
+        for kpi_name, df in kpi_dfs.items():
+            if not df.empty:
+                df.to_csv(kpi_output_dir / f'{kpi_name}.csv', mode=mode, header=header, index_label='timestamp')
+
+                # Save total KPI
+                total_df = pd.DataFrame(df.sum(axis=1), columns=[kpi_name])
+                total_df.to_csv(kpi_output_dir / f'total_{kpi_name}.csv', mode=mode, header=header, index_label='timestamp')
+
+    def save_summary(self, summary: dict, kpi_output_dir: Path, metadata: dict = None):
+        """
+        Writes the summary KPIs (the CSV layout has no place for the run metadata).
+        """
+        pd.DataFrame([summary]).to_csv(kpi_output_dir / 'summary_kpis.csv', index=False)
+
+    def load(self, kpi_output_dir: Path):
+        """
+        Returns:
+            tuple: (dict of KPI DataFrames, summary dict or None)
+        """
+        kpi_dfs = {}
+        for kpi_name in KPI_NAMES:
+            try:
+                kpi_dfs[kpi_name] = pd.read_csv(kpi_output_dir / f'{kpi_name}.csv', index_col='timestamp')
+            except FileNotFoundError:
+                pass
+
+        summary_file = kpi_output_dir / 'summary_kpis.csv'
+        summary = pd.read_csv(summary_file).iloc[0].to_dict() if summary_file.exists() else None
+        return kpi_dfs, summary
+
+
+class ParquetStorage:
+    """
+    All KPIs of a run in a single zstd-compressed Parquet file.
+    """
+    file_name = 'kpis.parquet'
+    compression = 'zstd'
+
+    def __init__(self):
+        self._writer = None
+
+    @staticmethod
+    def _to_frame(kpi_dfs: dict):
+        """
+        Joins the KPI DataFrames into one wide frame with '{kpi_name}/{building}' columns.
+        """
+        frames = [df.add_prefix(f'{kpi_name}/') for kpi_name, df in kpi_dfs.items() if not df.empty]
+        frame = pd.concat(frames, axis=1).astype(float)
+        frame.index.name = 'timestamp'
+        return frame
+
+    @staticmethod
+    def _metadata(summary: dict, metadata: dict):
+        return {
+            b'kpi_summary': json.dumps(summary, default=float).encode(),
+            b'run_metadata': json.dumps(run_metadata() if metadata is None else metadata, default=str).encode(),
+        }
+
+    def save(self, kpi_dfs: dict, kpi_output_dir: Path, summary: dict, metadata: dict = None):
+        """
+        Writes the KPI DataFrames with the summary and run metadata embedded.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(self._to_frame(kpi_dfs))
+        table = table.replace_schema_metadata({**table.schema.metadata, **self._metadata(summary, metadata)})
+        pq.write_table(table, kpi_output_dir / self.file_name, compression=self.compression)
+
+    def append(self, kpi_dfs: dict, kpi_output_dir: Path, header: bool = False):
+        """
+        Writes a chunk of the KPI time series as a new row group (header=True starts a new file).
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(self._to_frame(kpi_dfs))
+        if header or self._writer is None:
+            self._close_writer()
+            self._writer = pq.ParquetWriter(kpi_output_dir / self.file_name, table.schema, compression=self.compression)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def save_summary(self, summary: dict, kpi_output_dir: Path, metadata: dict = None):
+        """
+        Embeds the summary KPIs and closes the file. Without appended time series, the summary
+        is added to an existing file or written to an empty one.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is not None:
+            self._writer.add_key_value_metadata(self._metadata(summary, metadata))
+            self._close_writer()
+            return
+
+        path = kpi_output_dir / self.file_name
+        table = pq.read_table(path) if path.exists() else pa.table({})
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **self._metadata(summary, metadata)})
+        pq.write_table(table, path, compression=self.compression)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def load(self, kpi_output_dir: Path):
+        """
+        Returns:
+            tuple: (dict of KPI DataFrames, summary dict or None)
+        """
+        import pyarrow.parquet as pq
+
+        path = kpi_output_dir / self.file_name
+        frame = pq.read_table(path).to_pandas()
+        kpi_dfs = {}
+        for kpi_name in KPI_NAMES:
+            prefix = f'{kpi_name}/'
+            columns = [column for column in frame.columns if column.startswith(prefix)]
+            if columns:
+                kpi_dfs[kpi_name] = frame[columns].rename(columns=lambda column: column[len(prefix):])
+
+        summary = (pq.read_metadata(path).metadata or {}).get(b'kpi_summary')
+        return kpi_dfs, None if summary is None else json.loads(summary)
+
+    def load_metadata(self, kpi_output_dir: Path):
+        """
+        Returns the run metadata embedded in the file, without reading the KPI columns.
+        """
+        import pyarrow.parquet as pq
+
+        metadata = pq.read_metadata(kpi_output_dir / self.file_name).metadata or {}
+        return json.loads(metadata.get(b'run_metadata', b'{}'))
+
+
+STORAGE_BACKENDS = {
+    'csv': CSVStorage,
+    'parquet': ParquetStorage,
+}
+
+def get_storage(name: str = None):
+    """
+    Returns a new instance of the storage backend registered under the given name.
+
+    Args:
+        name (str, optional): Key in STORAGE_BACKENDS, defaults to config.KPI_STORAGE_FORMAT.
+    """
+    name = config.KPI_STORAGE_FORMAT if name is None else name
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown KPI storage format '{name}'. Available: {', '.join(STORAGE_BACKENDS)}")
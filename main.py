@@ -1,46 +1,169 @@
-import citylearn.data
-from citylearn.citylearn import CityLearnEnv
-from utils import print_schema_details
+"""
+Command line entry point:
+
+    python main.py                 # run config.AGENT_TYPE and generate the plots
+    python main.py inspect [--datasets]
+    python main.py rbc
+    python main.py ppo-train [--num-envs N] [--resume]
+    python main.py ppo-eval [--mode district|central]
+    python main.py kpis
+    python main.py plots
+    python main.py runs [--compare RUN_ID ...]
+    python main.py serve [--benchmark]
+    python main.py tariffs [--tariffs FILE] [--billing-period month|episode]
+
+Every command imports only what it needs: CityLearn is only loaded by commands that build an
+environment, stable-baselines3 only by the PPO commands and plotly only by the plot command.
+"""
+import argparse
 import config
-from ppo_agent import run_ppo_training, run_ppo_evaluation
-from rbc_agent import run_rbc_simulation
-from plot_kpis import generate_plots
-from kpi_calculator import calculate_and_save_kpis
-from pathlib import Path
 
-SCHEMA_PATH = '/home/oli/Documents/Work/EC_RL/schema.json'
+# --- Commands ---
+
+def inspect(args):
+    """
+    Prints the schema details and, optionally, the available CityLearn datasets.
+    """
+    from dataset_cache import make_env
+    from utils import print_schema_details
+
+    print("--- Initializing CityLearn Environment for Schema Inspection ---")
+    print_schema_details(make_env(args.schema))
+
+    if args.datasets:
+        import citylearn.data
+        print("\n--- Available CityLearn Datasets ---")
+        available_datasets = citylearn.data.DataSet().get_dataset_names()
+        for name in sorted(available_datasets):
+            print(f"- {name}")
+        print("--- End of Available Datasets ---\n")
+
+def run(args):
+    """
+    Runs the agent selected by config.AGENT_TYPE, then generates the plots.
+    """
+    from experiment import run_experiment
+    run_experiment(args.schema)
+    plots(args)
+
+def rbc(args):
+    from experiment import run_rbc
+    run_rbc(args.schema)
+
+def ppo_train(args):
+    from ppo_agent import run_ppo_training
+    run_ppo_training(args.schema, num_envs=args.num_envs, resume=True if args.resume else None)
+
+def ppo_eval(args):
+    from experiment import evaluate_ppo
+    evaluate_ppo(args.schema, mode=args.mode)
+
+def kpis(args):
+    """
+    Recalculates the summary KPIs from the KPI files of the last run.
+    """
+    from pathlib import Path
+    from kpi_calculator import calculate_and_save_summary_kpis
+    calculate_and_save_summary_kpis(Path(config.KPI_OUTPUT_DIR))
+
+def plots(args):
+    from plot_kpis import generate_plots
+    generate_plots()
+    if config.RUN_REGISTRY:
+        from run_registry import write_comparison_page
+        write_comparison_page()
+
+def runs(args):
+    """
+    Lists the registered runs (or compares the given ones) and writes the run comparison page.
+    """
+    import pandas as pd
+    from run_registry import compare_runs, list_runs, write_comparison_page
+    with pd.option_context('display.width', 200, 'display.max_columns', 12):
+        if args.compare:
+            print(compare_runs(args.compare).to_string())
+        else:
+            print(list_runs(limit=args.limit or None).to_string())
+    write_comparison_page()
+
+def serve(args):
+    """
+    Serves the actions of config.AGENT_TYPE to external clients, or benchmarks the service with fake clients.
+    """
+    import asyncio
+    import controller_service
+    if args.benchmark:
+        asyncio.run(controller_service.benchmark(args.schema, args.clients, args.requests))
+    else:
+        try:
+            asyncio.run(controller_service.serve(args.schema, port=args.port))
+        except KeyboardInterrupt:
+            pass
+
+def tariffs(args):
+    """
+    Prices the last run under the what-if tariffs and carbon intensities (see tariff_engine.py).
+    """
+    import pandas as pd
+    from tariff_engine import run_tariff_analysis
+    costs, emissions = run_tariff_analysis(tariff_file=args.tariffs, schema_path=args.schema, billing_period=args.billing_period)
+    with pd.option_context('display.width', 200):
+        print(costs[['total', 'energy', 'tiers', 'demand']].to_string())
+        print(emissions[['total']].to_string())
+
+# ---------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run CityLearn simulations with RBC and PPO agents.')
+    parser.add_argument('--schema', default=config.SCHEMA_PATH, help='schema.json path or CityLearn dataset name')
+    parser.add_argument('--episode-time-steps', type=int, default=None, help='Overrides config.EPISODE_TIME_STEPS')
+    parser.set_defaults(command=run)
+    subparsers = parser.add_subparsers(title='commands')
+
+    inspect_parser = subparsers.add_parser('inspect', help='Print the schema details')
+    inspect_parser.add_argument('--datasets', action='store_true', help='Also list the available CityLearn datasets')
+    inspect_parser.set_defaults(command=inspect)
+
+    subparsers.add_parser('run', help='Run config.AGENT_TYPE and generate the plots (default)').set_defaults(command=run)
+    subparsers.add_parser('rbc', help='Run the RBC simulation').set_defaults(command=rbc)
+
+    train_parser = subparsers.add_parser('ppo-train', help='Train the PPO agent')
+    train_parser.add_argument('--num-envs', type=int, default=None, help='Overrides config.PPO_NUM_ENVS')
+    train_parser.add_argument('--resume', action='store_true', help='Continue from the latest checkpoint in config.PPO_CHECKPOINT_DIR')
+    train_parser.set_defaults(command=ppo_train)
+
+    eval_parser = subparsers.add_parser('ppo-eval', help='Evaluate the saved PPO model')
+    eval_parser.add_argument('--mode', choices=['single', 'district', 'central'], default=None, help='Overrides config.PPO_EVAL_MODE')
+    eval_parser.set_defaults(command=ppo_eval)
+    subparsers.add_parser('kpis', help='Recalculate the summary KPIs of the last run').set_defaults(command=kpis)
+    subparsers.add_parser('plots', help='Generate the KPI plots').set_defaults(command=plots)
+
+    runs_parser = subparsers.add_parser('runs', help='List or compare the registered runs')
+    runs_parser.add_argument('--compare', nargs='+', default=None, metavar='RUN_ID', help='Print the KPIs of these runs side by side')
+    runs_parser.add_argument('--limit', type=int, default=20, help='Number of runs listed (0 = all)')
+    runs_parser.set_defaults(command=runs)
 
-# --- Schema and Dataset Information ---
-print("--- Initializing CityLearn Environment for Schema Inspection ---")
-temp_env = CityLearnEnv(SCHEMA_PATH)
-print_schema_details(temp_env)
+    serve_parser = subparsers.add_parser('serve', help='Serve the controller actions over HTTP (see controller_service.py)')
+    serve_parser.add_argument('--port', type=int, default=None, help='Overrides config.SERVICE_PORT')
+    serve_parser.add_argument('--benchmark', action='store_true', help='Report latency and throughput with fake clients')
+    serve_parser.add_argument('--clients', type=int, default=None, help='Benchmark: concurrent clients (default: one per building)')
+    serve_parser.add_argument('--requests', type=int, default=200, help='Benchmark: requests per client')
+    serve_parser.set_defaults(command=serve)
 
-print("\n--- Available CityLearn Datasets ---")
-available_datasets = citylearn.data.DataSet().get_dataset_names()
-for name in sorted(available_datasets):
-    print(f"- {name}")
-print("--- End of Available Datasets ---\n")
-# ------------------------------------
+    tariffs_parser = subparsers.add_parser('tariffs', help='Price the last run under other tariffs and carbon intensities')
+    tariffs_parser.add_argument('--tariffs', default=None, help='Overrides config.TARIFF_FILE')
+    tariffs_parser.add_argument('--billing-period', default=None, choices=('month', 'episode'), help='Overrides config.TARIFF_BILLING_PERIOD')
+    tariffs_parser.set_defaults(command=tariffs)
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
     """
     This is the main script to run a CityLearn simulation.
     """
-    if config.AGENT_TYPE == 'RBC':
-        run_rbc_simulation(
-            schema_path=SCHEMA_PATH,
-            episode_time_steps=config.EPISODE_TIME_STEPS,
-            central_agent=config.CENTRAL_AGENT
-        )
-    elif config.AGENT_TYPE == 'PPO':
-        run_ppo_training(schema_path=SCHEMA_PATH)
-        eval_env = run_ppo_evaluation(schema_path=SCHEMA_PATH)
-        
-        # Calculate and save KPIs
-        output_dir = Path(config.BASE_OUTPUT_DIR)
-        kpi_output_dir = Path(config.KPI_OUTPUT_DIR)
-        calculate_and_save_kpis(output_dir, kpi_output_dir, eval_env)
+    args = parse_args(argv)
+    if args.episode_time_steps is not None:
+        config.EPISODE_TIME_STEPS = args.episode_time_steps
+    args.command(args)
 
 if __name__ == '__main__':
     main()
-    generate_plots()
\ No newline at end of file
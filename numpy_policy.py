@@ -0,0 +1,148 @@
+"""
+Inference of trained PPO policies with NumPy only.
+
+The policy network of an SB3 MlpPolicy is a small MLP, but PPO.load and model.predict go through
+stable-baselines3's model construction and tensor preprocessing on every call. export_policy
+writes the deterministic part of the policy to <model>_policy.npz:
+- the hidden layers of the policy network (weights, biases and activation);
+- the action layer (the mean of the Gaussian, i.e. the deterministic action) and action bounds;
+- the VecNormalize observation statistics saved next to the model, if any.
+
+NumpyPolicy loads that file and has the same predict interface as the SB3 model, for a single
+observation or a batch (e.g. one row per building). This module imports neither torch nor
+stable-baselines3, only exporting does.
+"""
+import os
+from pathlib import Path
+import numpy as np
+
+# Activations of the policy network, by torch module name
+ACTIVATIONS = {
+    'Tanh': np.tanh,
+    'ReLU': lambda x: np.maximum(x, 0.0),
+}
+
+def get_numpy_policy_path(model_path):
+    """
+    Returns the path of the NumPy export of a model, e.g. ppo_model_policy.npz.
+    """
+    model_path = Path(model_path)
+    return model_path.with_name(f'{model_path.stem}_policy.npz')
+
+def export_policy(model_path, output_path=None, model=None):
+    """
+    Exports the policy network and observation statistics of a saved PPO model to a .npz file.
+
+    Args:
+        model_path (str): Path of the saved PPO model.
+        output_path (str, optional): Defaults to get_numpy_policy_path(model_path).
+        model (PPO, optional): The already loaded model, saves loading it from model_path.
+
+    Returns:
+        Path: The path of the export.
+    """
+    import pickle
+    import torch as th
+    from gymnasium import spaces
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.torch_layers import FlattenExtractor
+    from ppo_agent import get_vec_normalize_path
+
+    output_path = get_numpy_policy_path(model_path) if output_path is None else Path(output_path)
+    model = PPO.load(model_path, device='cpu') if model is None else model
+    policy = model.policy
+    if policy.squash_output or not isinstance(policy.features_extractor, FlattenExtractor) or not isinstance(model.action_space, spaces.Box):
+        raise ValueError(f"Only MlpPolicy models with Box actions can be exported, got {type(policy).__name__}")
+
+    arrays = {}
+    layers = list(policy.mlp_extractor.policy_net)
+    linear_layers = [layer for layer in layers if isinstance(layer, th.nn.Linear)]
+    activations = [type(layer).__name__ for layer in layers if not isinstance(layer, th.nn.Linear)]
+    unknown = set(activations) - set(ACTIVATIONS)
+    if unknown or len(activations) != len(linear_layers):
+        raise ValueError(f"Unsupported policy network layers: {', '.join(type(layer).__name__ for layer in layers)}")
+
+    for i, layer in enumerate(linear_layers):
+        # Stored transposed, so a batch of row vectors is multiplied from the left
+        arrays[f'weight_{i}'] = layer.weight.detach().cpu().numpy().T.copy()
+        arrays[f'bias_{i}'] = layer.bias.detach().cpu().numpy()
+    arrays['activation'] = np.array(activations[0] if activations else 'Tanh')
+    arrays['action_weight'] = policy.action_net.weight.detach().cpu().numpy().T.copy()
+    arrays['action_bias'] = policy.action_net.bias.detach().cpu().numpy()
+    arrays['action_low'] = model.action_space.low.astype(np.float32)
+    arrays['action_high'] = model.action_space.high.astype(np.float32)
+    arrays['observation_size'] = np.array(model.observation_space.shape[0])
+
+    vec_normalize_path = get_vec_normalize_path(model_path)
+    if vec_normalize_path.exists():
+        with open(vec_normalize_path, 'rb') as f:
+            vec_normalize = pickle.load(f)
+        if vec_normalize.norm_obs:
+            arrays['obs_mean'] = vec_normalize.obs_rms.mean
+            arrays['obs_std'] = np.sqrt(vec_normalize.obs_rms.var + vec_normalize.epsilon)
+            arrays['obs_clip'] = np.array(vec_normalize.clip_obs)
+
+    tmp_path = output_path.with_name(f'{output_path.stem}.{os.getpid()}.tmp.npz')
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, output_path)
+    print(f"Policy exported to {output_path}")
+    return output_path
+
+class NumpyPolicy:
+    """
+    Deterministic PPO policy evaluated with NumPy, from a file written by export_policy.
+    """
+    def __init__(self, path):
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+
+        num_layers = sum(key.startswith('weight_') for key in arrays)
+        self.layers = [(arrays[f'weight_{i}'], arrays[f'bias_{i}']) for i in range(num_layers)]
+        self.activation = ACTIVATIONS[str(arrays['activation'])]
+        self.action_layer = (arrays['action_weight'], arrays['action_bias'])
+        self.action_low = arrays['action_low']
+        self.action_high = arrays['action_high']
+        self.observation_size = int(arrays['observation_size'])
+        self.obs_mean = arrays.get('obs_mean')
+        self.obs_std = arrays.get('obs_std')
+        self.obs_clip = float(arrays['obs_clip']) if 'obs_clip' in arrays else None
+
+    def normalize_obs(self, observations):
+        """
+        Scales observations with the exported VecNormalize statistics (unchanged if there are none).
+        """
+        if self.obs_mean is None:
+            return observations
+        return np.clip((observations - self.obs_mean)/self.obs_std, -self.obs_clip, self.obs_clip)
+
+    def predict(self, observations, deterministic: bool = True):
+        """
+        Returns the actions for an observation vector or a batch of them (one row each), like the
+        deterministic SB3 model.predict. The observations must already be normalized. Only the
+        deterministic action is exported, so deterministic=False raises a ValueError.
+
+        Returns:
+            tuple: (actions, None)
+        """
+        if not deterministic:
+            raise ValueError("NumpyPolicy only has the deterministic action, load the SB3 model to sample actions")
+        features = np.asarray(observations, dtype=np.float32)
+        if features.shape[-1] != self.observation_size:
+            raise ValueError(f"The policy expects {self.observation_size} observations, got {features.shape[-1]}")
+        for weight, bias in self.layers:
+            features = self.activation(features @ weight + bias)
+        actions = features @ self.action_layer[0] + self.action_layer[1]
+        return np.clip(actions, self.action_low, self.action_high), None
+
+def load_numpy_policy(model_path):
+    """
+    Returns the NumpyPolicy of a saved PPO model, exporting it first if there is no export yet or
+    the model (or its statistics) was saved after it.
+    """
+    from ppo_agent import get_vec_normalize_path
+
+    path = get_numpy_policy_path(model_path)
+    sources = [Path(model_path), get_vec_normalize_path(model_path)]
+    if not path.exists() or any(source.exists() and source.stat().st_mtime > path.stat().st_mtime for source in sources):
+        export_policy(model_path, path)
+    return NumpyPolicy(path)
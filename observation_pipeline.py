@@ -0,0 +1,73 @@
+"""
+Feature selection and cyclic encoding of the observations fed to the PPO policy.
+
+The raw CityLearn observation vector mixes calendar values (month 1-12, hour 1-24), physical
+quantities in very different units and forecasts that largely repeat the current values.
+ObservationPipeline keeps the configured features, in the configured order, and replaces
+calendar features by their sine and cosine so that e.g. hour 24 and hour 1 are neighbours.
+Scaling to zero mean and unit variance is done by VecNormalize on top (see ppo_agent.py).
+"""
+import numpy as np
+
+# Period of the observations that can be encoded cyclically
+CYCLIC_PERIODS = {
+    'hour': 24,
+    'month': 12,
+    'day_type': 7,
+}
+
+class ObservationPipeline:
+    """
+    Maps observation vectors (1-D) or batches (2-D, one row per building) in the input layout
+    onto the policy's features.
+    """
+    def __init__(self, input_names, features=None, cyclic_features=()):
+        """
+        Args:
+            input_names (list of str): Observation names of the input vectors.
+            features (list of str, optional): Observations to keep, in order. Defaults to all inputs.
+            cyclic_features (list of str): Kept observations encoded as (sin, cos), see CYCLIC_PERIODS.
+        """
+        features = list(input_names) if features is None else list(features)
+        unknown = [name for name in features if name not in input_names]
+        if unknown:
+            raise ValueError(f"Unknown observation(s) {', '.join(unknown)}. Available: {', '.join(input_names)}")
+        unknown = [name for name in cyclic_features if name not in CYCLIC_PERIODS]
+        if unknown:
+            raise ValueError(f"No cyclic encoding for {', '.join(unknown)}. Available: {', '.join(CYCLIC_PERIODS)}")
+
+        self.names = []
+        index, sin_columns, cos_columns, scale = [], [], [], []
+        for name in features:
+            if name in cyclic_features:
+                sin_columns.append(len(self.names))
+                cos_columns.append(len(self.names) + 1)
+                scale.append(2*np.pi/CYCLIC_PERIODS[name])
+                self.names.extend([f'{name}_sin', f'{name}_cos'])
+                index.extend([input_names.index(name)]*2)
+            else:
+                self.names.append(name)
+                index.append(input_names.index(name))
+
+        self._index = np.array(index, dtype=int)
+        self._sin_columns = np.array(sin_columns, dtype=int)
+        self._cos_columns = np.array(cos_columns, dtype=int)
+        self._scale = np.array(scale, dtype=np.float32)
+
+    def __call__(self, observations):
+        features = np.asarray(observations, dtype=np.float32)[..., self._index]
+        if len(self._scale) > 0:
+            features[..., self._sin_columns] = np.sin(features[..., self._sin_columns]*self._scale)
+            features[..., self._cos_columns] = np.cos(features[..., self._cos_columns]*self._scale)
+        return features
+
+    def bounds(self, low, high):
+        """
+        Returns the (low, high) bounds of the features given those of the inputs.
+        """
+        low = np.asarray(low, dtype=np.float32)[self._index]
+        high = np.asarray(high, dtype=np.float32)[self._index]
+        cyclic = np.concatenate([self._sin_columns, self._cos_columns])
+        low[cyclic] = -1.0
+        high[cyclic] = 1.0
+        return low, high
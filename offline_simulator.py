@@ -0,0 +1,371 @@
+"""
+Offline simulator for schedule-only controllers.
+
+Controllers such as SimpleRBC only look at the hour, so their actions for a whole episode
+are known in advance. This module replays the building time series from the schema's CSV
+files and reproduces CityLearn's Battery model with NumPy array code, vectorized over
+buildings and over controller parameter combinations. This is orders of magnitude faster
+than stepping CityLearnEnv and makes large RBC parameter sweeps practical.
+
+Assumptions: only the electrical storage is controlled (thermal storages stay idle), thermal
+demand is always met by the devices, and the time step is one hour.
+"""
+import itertools
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import config
+from kpi_calculator import ELECTRICITY_PRICE, save_kpis
+from rbc_agent import rbc_electrical_action
+from dataset_cache import read_data_file
+from utils import load_schema, get_building_names, make_timestamps
+
+ZERO_DIVISION_PLACEHOLDER = 0.000001 # Same guard value as CityLearn
+
+def _required(attributes, key, building_name, device):
+    """
+    Returns a device attribute that CityLearn would otherwise sample at random.
+    """
+    value = (attributes or {}).get(key)
+    if value is None:
+        raise ValueError(f"{building_name}: the offline simulator needs an explicit '{key}' for the {device}.")
+    return value
+
+def _heat_pump_cop(attributes, temperature, heating, building_name):
+    """
+    Carnot COP of a CityLearn HeatPump, limited to 20 like the environment does.
+    """
+    efficiency = _required(attributes, 'efficiency', building_name, 'heat pump')
+    if heating:
+        target = _required(attributes, 'target_heating_temperature', building_name, 'heat pump')
+        cop = efficiency*(target + 273.15)/(target - temperature)
+    else:
+        target = _required(attributes, 'target_cooling_temperature', building_name, 'heat pump')
+        cop = efficiency*(target + 273.15)/(temperature - target)
+    return np.where((cop < 0) | (cop > 20), 20.0, cop)
+
+def _device_electricity(device, demand, temperature, heating, building_name):
+    """
+    Electricity needed by a cooling/heating/dhw device to meet the given thermal demand.
+    """
+    if device is None:
+        return np.zeros_like(demand)
+    if device['type'].endswith('HeatPump'):
+        return demand/_heat_pump_cop(device.get('attributes'), temperature, heating, building_name)
+    return demand/_required(device.get('attributes'), 'efficiency', building_name, 'electric heater')
+
+def _pad_curve(curve, length):
+    """
+    Pads a [[x, y], ...] curve to a fixed number of points by repeating its last point.
+    """
+    curve = np.asarray(curve, dtype=float)
+    return np.concatenate([curve, np.repeat(curve[-1:], length - len(curve), axis=0)])
+
+def _interpolate(curves, x):
+    """
+    Piecewise linear interpolation of each building's curve, the way CityLearn's Battery does it.
+
+    Args:
+        curves (np.array): (n_buildings, n_points, 2) curve points.
+        x (np.array): (..., n_buildings) values to look up.
+    """
+    points_x, points_y = curves[..., 0], curves[..., 1]
+    idx = np.clip((x[..., None] > points_x).sum(axis=-1) - 1, 0, curves.shape[1] - 2)
+    x0 = np.take_along_axis(np.broadcast_to(points_x, idx.shape + (curves.shape[1],)), idx[..., None], -1)[..., 0]
+    x1 = np.take_along_axis(np.broadcast_to(points_x, idx.shape + (curves.shape[1],)), idx[..., None] + 1, -1)[..., 0]
+    y0 = np.take_along_axis(np.broadcast_to(points_y, idx.shape + (curves.shape[1],)), idx[..., None], -1)[..., 0]
+    y1 = np.take_along_axis(np.broadcast_to(points_y, idx.shape + (curves.shape[1],)), idx[..., None] + 1, -1)[..., 0]
+    return y0 + (x - x0)*(y1 - y0)/(x1 - x0)
+
+class OfflineDistrict:
+    """
+    Building time series and battery parameters of a schema, parsed once.
+
+    Like CityLearnEnv, an episode of N time steps applies N - 1 actions, so all time series
+    have episode_time_steps - 1 rows.
+    """
+    def __init__(self, schema_path, episode_time_steps=None, simulation_start_time_step=None):
+        schema = load_schema(schema_path)
+        root_directory = Path(schema.get('root_directory') or Path(schema_path).parent)
+
+        self.start_time_step = schema['simulation_start_time_step'] if simulation_start_time_step is None else simulation_start_time_step
+        episode_time_steps = episode_time_steps or schema['simulation_end_time_step'] - self.start_time_step + 1
+        self.time_steps = episode_time_steps - 1
+        self.seconds_per_time_step = schema['seconds_per_time_step']
+        self.building_names = get_building_names(schema)
+        window = slice(self.start_time_step, self.start_time_step + self.time_steps)
+
+        hour, load, base_consumption, pv, carbon_intensity = [], [], [], [], []
+        batteries, efficiency_curves, power_curves = [], [], []
+        csv_cache = {}
+
+        def read_csv(file_name):
+            if file_name not in csv_cache:
+                csv_cache[file_name] = read_data_file(root_directory / file_name)
+            return csv_cache[file_name]
+
+        for name in self.building_names:
+            building = schema['buildings'][name]
+            simulation = read_csv(building['energy_simulation']).iloc[window]
+            temperature = read_csv(building['weather'])['outdoor_dry_bulb_temperature'].to_numpy()[window]
+
+            cooling = _device_electricity(building.get('cooling_device'), simulation['cooling_demand'].to_numpy(), temperature, False, name)
+            heating = _device_electricity(building.get('heating_device'), simulation['heating_demand'].to_numpy(), temperature, True, name)
+            dhw = _device_electricity(building.get('dhw_device'), simulation['dhw_demand'].to_numpy(), temperature, True, name)
+            non_shiftable_load = simulation['non_shiftable_load'].to_numpy()
+
+            pv_power = ((building.get('pv') or {}).get('attributes') or {}).get('nominal_power') or 0.0
+            generation = pv_power*simulation['solar_generation'].to_numpy()/1000.0
+
+            hour.append(simulation['hour'].to_numpy())
+            load.append(non_shiftable_load)
+            pv.append(generation)
+            base_consumption.append(non_shiftable_load + cooling + heating + dhw - generation)
+
+            if building.get('carbon_intensity') is not None:
+                carbon_intensity.append(read_csv(building['carbon_intensity'])['carbon_intensity'].to_numpy()[window])
+            else:
+                carbon_intensity.append(np.zeros(self.time_steps))
+
+            storage = building.get('electrical_storage')
+            attributes = (storage or {}).get('attributes') or {}
+            if storage is None:
+                batteries.append((0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0))
+                efficiency_curves.append([[0.0, 1.0], [1.0, 1.0]])
+                power_curves.append([[0.0, 1.0], [1.0, 1.0]])
+            else:
+                depth_of_discharge = attributes.get('depth_of_discharge', 1.0)
+                batteries.append((
+                    _required(attributes, 'capacity', name, 'battery'),
+                    _required(attributes, 'nominal_power', name, 'battery'),
+                    _required(attributes, 'efficiency', name, 'battery'),
+                    _required(attributes, 'loss_coefficient', name, 'battery'),
+                    _required(attributes, 'capacity_loss_coefficient', name, 'battery'),
+                    depth_of_discharge,
+                    attributes.get('initial_soc', 1.0 - depth_of_discharge),
+                ))
+                efficiency_curves.append(_required(attributes, 'power_efficiency_curve', name, 'battery'))
+                power_curves.append(_required(attributes, 'capacity_power_curve', name, 'battery'))
+
+        # --- (time steps, buildings) time series ---
+        self.hour = hour[0].astype(float)
+        self.load = np.stack(load, axis=1)
+        self.pv_generation = np.stack(pv, axis=1)
+        self.base_consumption = np.stack(base_consumption, axis=1)
+        self.carbon_intensity = np.stack(carbon_intensity, axis=1)
+        self.timestamps = make_timestamps(self.start_time_step, self.time_steps, self.seconds_per_time_step)
+
+        # --- (buildings,) battery parameters ---
+        (self.capacity, self.nominal_power, self.efficiency, self.loss_coefficient,
+         self.capacity_loss_coefficient, self.depth_of_discharge, self.initial_soc) = np.array(batteries, dtype=float).T
+        points = max(len(c) for c in efficiency_curves + power_curves)
+        self.power_efficiency_curve = np.stack([_pad_curve(c, points) for c in efficiency_curves])
+        self.capacity_power_curve = np.stack([_pad_curve(c, points) for c in power_curves])
+
+    def simulate_battery(self, actions, record=True, price=ELECTRICITY_PRICE):
+        """
+        Simulates the electrical storage of every building for the whole episode.
+
+        Args:
+            actions: Standardized electrical storage actions, either a (time_steps, ..., n_buildings)
+                array or a callable returning the (..., n_buildings) actions of time step t. The
+                leading '...' dimensions are independent scenarios (e.g. parameter combinations).
+            record (bool): Keep the full SOC and energy balance time series.
+            price (float): Electricity price used for the cost summary.
+
+        Returns:
+            dict: 'summary' with per-scenario KPI totals and, if record is True, 'soc' and
+                'energy_balance' arrays of shape (time_steps, ..., n_buildings).
+        """
+        action_at = actions if callable(actions) else actions.__getitem__
+        shape = np.broadcast_shapes(np.shape(action_at(0)), self.capacity.shape)
+        hours = self.seconds_per_time_step/3600.0
+        safe_capacity = np.maximum(self.capacity, ZERO_DIVISION_PLACEHOLDER)
+        safe_nominal_power = np.maximum(self.nominal_power, ZERO_DIVISION_PLACEHOLDER)
+
+        soc = np.broadcast_to(self.initial_soc, shape).copy()
+        efficiency = np.broadcast_to(self.efficiency, shape).copy()
+        degraded_capacity = np.broadcast_to(self.capacity, shape).copy()
+
+        soc_history = np.zeros((self.time_steps,) + shape) if record else None
+        balance_history = np.zeros((self.time_steps,) + shape) if record else None
+        total_consumption = np.zeros(shape)
+        total_carbon = np.zeros(shape[:-1])
+        max_consumption = np.full(shape[:-1], -np.inf)
+        charged = np.zeros(shape)
+        discharged = np.zeros(shape)
+
+        for t in range(self.time_steps):
+            energy = action_at(t)*self.nominal_power*hours
+            energy_init = np.maximum(0.0, soc*self.capacity*(1.0 - self.loss_coefficient))
+            max_power = self.nominal_power*_interpolate(self.capacity_power_curve, energy_init/safe_capacity)
+            charging = energy >= 0
+
+            # Charging is limited by power, remaining (degraded) capacity and the requested energy
+            charge_energy = np.minimum.reduce(np.broadcast_arrays(max_power, self.nominal_power, degraded_capacity - energy_init, energy))
+            # Discharging is limited by power and depth of discharge (using the previous efficiency)
+            dod_limit = -np.maximum((soc - (1.0 - self.depth_of_discharge))*self.capacity*np.sqrt(efficiency), 0.0)
+            discharge_energy = np.maximum.reduce(np.broadcast_arrays(-max_power, dod_limit, energy))
+
+            efficiency = _interpolate(self.power_efficiency_curve, np.minimum(np.abs(energy), max_power)/safe_nominal_power)
+            round_trip_efficiency = np.sqrt(efficiency)
+            energy_final = np.where(
+                charging,
+                np.minimum(energy_init + charge_energy*round_trip_efficiency, self.capacity),
+                np.maximum(0.0, energy_init + discharge_energy/round_trip_efficiency)
+            )
+            delta = energy_final - energy_init
+            balance = np.where(delta >= 0, delta/round_trip_efficiency, delta*round_trip_efficiency)
+            soc = energy_final/safe_capacity
+            degraded_capacity = np.maximum(
+                degraded_capacity - self.capacity_loss_coefficient*self.capacity*np.abs(balance)/(2*np.maximum(degraded_capacity, ZERO_DIVISION_PLACEHOLDER)),
+                0.0
+            )
+
+            consumption = self.base_consumption[t] + balance
+            total_consumption += consumption
+            total_carbon += (consumption*self.carbon_intensity[t]).sum(axis=-1)
+            np.maximum(max_consumption, consumption.sum(axis=-1), out=max_consumption)
+            charged += np.maximum(balance, 0.0)
+            discharged += np.minimum(balance, 0.0)
+
+            if record:
+                soc_history[t] = soc
+                balance_history[t] = balance
+
+        summary = {
+            'total_cost': total_consumption.sum(axis=-1)*price,
+            'total_carbon_emissions': total_carbon,
+            'max_consumption': max_consumption,
+            'max_load': self.load.sum(axis=1).max(),
+            'total_pv_generation': self.pv_generation.sum(),
+        }
+        for i, name in enumerate(self.building_names):
+            summary[f'{name}_charged'] = charged[..., i]
+            summary[f'{name}_discharged'] = discharged[..., i]
+        summary['total_charged'] = charged.sum(axis=-1)
+        summary['total_discharged'] = np.abs(discharged.sum(axis=-1))
+
+        result = {'summary': summary}
+        if record:
+            result['soc'] = soc_history
+            result['energy_balance'] = balance_history
+        return result
+
+    def rbc_actions(self, charge_start_hour=7, discharge_start_hour=16, discharge_end_hour=20, charge_action=1.0, discharge_action=-1.0):
+        """
+        Returns a per-time-step action function for the RBC rule. Parameters may be scalars,
+        (n_buildings,) arrays or (n_scenarios, 1 or n_buildings) arrays.
+        """
+        parameters = [np.asarray(p, dtype=float) for p in (charge_start_hour, discharge_start_hour, discharge_end_hour, charge_action, discharge_action)]
+        shape = np.broadcast_shapes(self.capacity.shape, *[p.shape for p in parameters])
+        return lambda t: np.broadcast_to(rbc_electrical_action(self.hour[t], *parameters), shape)
+
+    def kpi_dataframes(self, soc, energy_balance, price=ELECTRICITY_PRICE):
+        """
+        Builds the KPI DataFrames in the layout kpi_calculator.save_kpis expects for one scenario.
+        """
+        columns = [f'Building_{i + 1}' for i in range(len(self.building_names))]
+        frame = lambda values: pd.DataFrame(values, index=self.timestamps, columns=columns)
+        grid_consumption = self.base_consumption + energy_balance
+        return {
+            'grid_consumption': frame(grid_consumption),
+            'load': frame(self.load),
+            'cost': frame(grid_consumption*price),
+            'carbon_emissions': frame(grid_consumption*self.carbon_intensity),
+            'pv_generation': frame(self.pv_generation),
+            'electrical_storage_soc': frame(soc),
+            'electrical_storage_action': frame(energy_balance),
+        }
+
+def run_offline_rbc_simulation(schema_path, episode_time_steps: int = None, kpi_output_dir: Path = None):
+    """
+    Offline equivalent of run_rbc_simulation using the RBC settings in config.
+    Writes the same KPI files as the environment-based run.
+    """
+    episode_time_steps = config.EPISODE_TIME_STEPS if episode_time_steps is None else episode_time_steps
+    kpi_output_dir = Path(config.KPI_OUTPUT_DIR) if kpi_output_dir is None else Path(kpi_output_dir)
+
+    district = OfflineDistrict(schema_path, episode_time_steps=episode_time_steps)
+    actions = district.rbc_actions(
+        config.RBC_CHARGE_START_HOUR, config.RBC_DISCHARGE_START_HOUR, config.RBC_DISCHARGE_END_HOUR,
+        config.RBC_CHARGE_ACTION, config.RBC_DISCHARGE_ACTION
+    )
+    result = district.simulate_battery(actions)
+    kpi_dfs = district.kpi_dataframes(result['soc'], result['energy_balance'])
+    save_kpis(kpi_dfs, kpi_output_dir)
+    print(f"Offline RBC simulation finished ({district.time_steps} steps, {len(district.building_names)} buildings).")
+    return kpi_dfs
+
+def sweep_rbc_parameters(schema_path, parameter_grid: dict, episode_time_steps: int = None, batch_size: int = 1024):
+    """
+    Evaluates every combination of RBC parameters offline and returns one summary row per combination.
+
+    Args:
+        schema_path (str): Path to the schema.json file or a CityLearn dataset name.
+        parameter_grid (dict): Lists of values keyed by VectorizedRBC parameter name, e.g.
+            {'charge_start_hour': [6, 7, 8], 'discharge_start_hour': [15, 16, 17]}.
+        episode_time_steps (int, optional): Episode length, defaults to config.EPISODE_TIME_STEPS.
+        batch_size (int): Number of combinations simulated together.
+
+    Returns:
+        pd.DataFrame: The parameters and summary KPIs of each combination.
+    """
+    episode_time_steps = config.EPISODE_TIME_STEPS if episode_time_steps is None else episode_time_steps
+    district = OfflineDistrict(schema_path, episode_time_steps=episode_time_steps)
+    names = list(parameter_grid)
+    combinations = np.array(list(itertools.product(*parameter_grid.values())), dtype=float).reshape(-1, len(names))
+    frames = []
+
+    for start in range(0, len(combinations), batch_size):
+        batch = combinations[start:start + batch_size]
+        parameters = {name: batch[:, [i]] for i, name in enumerate(names)}
+        summary = district.simulate_battery(district.rbc_actions(**parameters), record=False)['summary']
+        frame = pd.DataFrame(batch, columns=names)
+        for key, value in summary.items():
+            frame[key] = np.broadcast_to(value, len(batch))
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+def validate_against_env(schema_path, episode_time_steps: int = 1000):
+    """
+    Runs the RBC in CityLearnEnv and offline for the same episode and reports the largest
+    absolute differences per building in battery SOC, energy balance and net consumption.
+
+    The first time step's net consumption is excluded: CityLearnEnv accounts extra
+    non-shiftable load at time step 0 while initializing the episode.
+    """
+    from dataset_cache import make_env
+    from rbc_agent import make_rbc
+    from translation_layer import TranslationLayer
+
+    env = make_env(schema_path, central_agent=False, episode_time_steps=episode_time_steps)
+    agent = make_rbc(env)
+    translator = TranslationLayer(env.buildings)
+    observations, _ = env.reset()
+    while not env.terminated:
+        observations, _, _, _, _ = env.step(translator.translate_batch(agent.predict(observations)))
+
+    district = OfflineDistrict(schema_path, episode_time_steps=episode_time_steps, simulation_start_time_step=env.episode_tracker.episode_start_time_step)
+    result = district.simulate_battery(district.rbc_actions(
+        agent.charge_start_hour, agent.discharge_start_hour, agent.discharge_end_hour, agent.charge_action, agent.discharge_action
+    ))
+    steps = district.time_steps
+    env_soc = np.stack([b.electrical_storage.soc[:steps] for b in env.buildings], axis=1)
+    env_balance = np.stack([b.electrical_storage.energy_balance[:steps] for b in env.buildings], axis=1)
+    env_net = np.stack([b.net_electricity_consumption[:steps] for b in env.buildings], axis=1)
+    offline_net = district.base_consumption + result['energy_balance']
+
+    errors = pd.DataFrame({
+        'soc': np.abs(env_soc - result['soc']).max(axis=0),
+        'energy_balance': np.abs(env_balance - result['energy_balance']).max(axis=0),
+        'net_electricity_consumption': np.abs(env_net[1:] - offline_net[1:]).max(axis=0),
+    }, index=district.building_names)
+    print(f"--- Offline vs. CityLearnEnv: max absolute error over {steps} steps ---")
+    print(errors)
+    return errors
+
+if __name__ == '__main__':
+    import sys
+    validate_against_env(sys.argv[1] if len(sys.argv) > 1 else 'schema.json')
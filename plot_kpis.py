@@ -1,65 +1,201 @@
+"""
+Interactive KPI plots in config.PLOT_OUTPUT_DIR (index.html linking to one HTML file per figure).
+
+Plot generation is incremental: every figure is keyed by a hash of its data and the plot
+settings, recorded in plots/manifest.json, and only redrawn when the key changes. The figures
+reference one shared plotly.min.js in the plots directory instead of embedding the ~3.5 MB
+bundle each, time series longer than config.PLOT_MAX_POINTS are downsampled per trace
+(Largest-Triangle-Three-Buckets style, see lttb_indices), and the figures that do need drawing are rendered in parallel.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-import os
-import glob
+import config
+from kpi_storage import get_storage
 
-def generate_plots():
+# Bump to redraw every cached figure after changing how figures are drawn
+PLOT_VERSION = 2
+
+def lttb_indices(y, num_points: int):
     """
-    Reads all csv files from the calculated_kpis directory, generates interactive plots,
-    and creates an index.html file to view them.
+    Returns the indices of the num_points samples of y (evenly spaced in x) that keep the visual
+    shape of the series, selected Largest-Triangle-Three-Buckets style.
+
+    The first and last points are kept and every bucket in between contributes the point forming
+    the largest triangle with the averages of its neighbouring buckets. (LTTB proper uses the
+    point selected in the previous bucket instead of its average, which needs a Python loop over
+    the buckets; with the average, all buckets are evaluated at once.)
     """
-    # Create a directory to store the plots
-    if not os.path.exists('gui/plots'):
-        os.makedirs('gui/plots')
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(y)
+    if num_points >= n or num_points < 3:
+        return np.arange(n)
 
-    # Get all csv files from the calculated_kpis directory
-    path = 'calculated_kpis'
-    all_files = glob.glob(os.path.join(path, "*.csv"))
+    # Points 1..n-2 split into num_points - 2 buckets, as an index matrix padded to the largest bucket
+    edges = np.linspace(1, n - 1, num_points - 1).astype(int)
+    sizes = np.diff(edges)
+    index = edges[:-1, None] + np.arange(sizes.max())
+    valid = index < edges[1:, None]
+    index = np.where(valid, index, edges[:-1, None])
+    bucket_x = edges[:-1] + (sizes - 1)/2.0
+    bucket_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)/sizes
+
+    # Neighbours of every bucket: the previous and next bucket averages (first/last point at the ends)
+    previous_x = np.concatenate([[0.0], bucket_x[:-1]])
+    previous_y = np.concatenate([[y[0]], bucket_y[:-1]])
+    next_x = np.append(bucket_x[1:], n - 1.0)
+    next_y = np.append(bucket_y[1:], y[-1])
+
+    area = np.abs(
+        (previous_x - next_x)[:, None]*(y[index] - previous_y[:, None])
+        - (previous_x[:, None] - index)*(next_y - previous_y)[:, None]
+    )
+    area[~valid] = -1.0
+    selected = index[np.arange(len(index)), np.argmax(area, axis=1)]
+    return np.concatenate([[0], selected, [n - 1]])
+
+def _data_hash(data, *settings):
+    """
+    Returns a hash of a DataFrame or dict and the settings that affect its figure.
+    """
+    digest = hashlib.sha1(repr((PLOT_VERSION,) + settings).encode())
+    if isinstance(data, pd.DataFrame):
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        digest.update(repr(list(data.columns)).encode())
+    else:
+        digest.update(json.dumps(data, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+def summary_figure(name, summary: dict):
+    df = pd.DataFrame([summary])
+    fig = go.Figure(data=[go.Table(
+        header=dict(values=list(df.columns),
+                    fill_color='paleturquoise',
+                    align='left'),
+        cells=dict(values=[df[col] for col in df.columns],
+                   fill_color='lavender',
+                   align='left'))
+    ])
+    fig.update_layout(title_text=name)
+    return fig
+
+def line_figure(name, df: pd.DataFrame, max_points: int = 0):
+    """
+    One line per column of df against its timestamp index, each downsampled to max_points (0 = all).
+    """
+    timestamps = df.index.to_numpy()
+    fig = go.Figure()
+    for column in df.columns:
+        values = df[column].to_numpy()
+        index = lttb_indices(values, max_points) if max_points else slice(None)
+        fig.add_trace(go.Scatter(x=timestamps[index], y=values[index], mode='lines', name=str(column)))
+    fig.update_layout(title_text=name, xaxis_title=df.index.name or 'timestamp', legend_title_text='variable')
+    return fig
+
+def render_figure(kind: str, name: str, data, path, max_points: int = 0):
+    """
+    Draws one figure and writes it to path, referencing the shared plotly.min.js next to it.
+    Executed in worker processes.
+    """
+    fig = summary_figure(name, data) if kind == 'summary' else line_figure(name, data, max_points)
+    tmp_path = Path(f'{path}.{os.getpid()}.tmp')
+    fig.write_html(tmp_path, include_plotlyjs='directory', full_html=True)
+    os.replace(tmp_path, path)
+    return name
+
+def write_plotlyjs(plots_dir: Path):
+    """
+    Writes the shared plotly.js bundle once, before the figures are rendered concurrently.
+    """
+    bundle_path = plots_dir / 'plotly.min.js'
+    if not bundle_path.exists():
+        from plotly.offline import get_plotlyjs
+        tmp_path = plots_dir / f'plotly.min.js.{os.getpid()}.tmp'
+        tmp_path.write_text(get_plotlyjs(), encoding='utf-8')
+        os.replace(tmp_path, bundle_path)
+
+def generate_plots(kpi_dir=None, output_dir=None, force: bool = False, max_workers: int = None):
+    """
+    Reads the KPIs from the calculated_kpis directory (through the configured kpi_storage backend),
+    generates interactive plots, and creates an index.html file to view them.
+
+    Args:
+        kpi_dir (str, optional): Defaults to config.KPI_OUTPUT_DIR.
+        output_dir (str, optional): Defaults to config.PLOT_OUTPUT_DIR.
+        force (bool): Redraw every figure, even if its data has not changed.
+        max_workers (int, optional): Worker processes for rendering, defaults to config.PLOT_MAX_WORKERS.
+
+    Returns:
+        list of str: Names of the figures that were (re)drawn.
+    """
+    output_dir = Path(config.PLOT_OUTPUT_DIR if output_dir is None else output_dir)
+    plots_dir = output_dir / 'plots'
+    plots_dir.mkdir(parents=True, exist_ok=True)
+    max_workers = config.PLOT_MAX_WORKERS if max_workers is None else max_workers
+    max_points = config.PLOT_MAX_POINTS
+
+    # Load the KPIs of the last run
+    path = Path(config.KPI_OUTPUT_DIR if kpi_dir is None else kpi_dir)
+    kpi_dfs, summary = get_storage().load(path)
+
+    # Summary table, one line plot per KPI and per KPI total
+    figures = {}
+    if summary is not None:
+        figures['summary_kpis'] = ('summary', summary)
+    for kpi_name, df in kpi_dfs.items():
+        figures[kpi_name] = ('line', df)
+        figures[f'total_{kpi_name}'] = ('line', pd.DataFrame(df.sum(axis=1), columns=[kpi_name]))
+
+    # Figures whose data or settings changed since they were drawn
+    manifest_path = plots_dir / 'manifest.json'
+    manifest = {}
+    if manifest_path.exists() and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    keys = {name: _data_hash(data, kind, max_points) for name, (kind, data) in figures.items()}
+    stale = [name for name in figures if manifest.get(name) != keys[name] or not (plots_dir / f'{name}.html').exists()]
+
+    # Remove the figures of KPIs that are no longer there
+    for name in set(manifest) - set(figures):
+        (plots_dir / f'{name}.html').unlink(missing_ok=True)
+
+    if stale:
+        write_plotlyjs(plots_dir)
+        jobs = [(figures[name][0], name, figures[name][1], plots_dir / f'{name}.html', max_points) for name in stale]
+        if max_workers == 1 or len(jobs) == 1:
+            for job in jobs:
+                render_figure(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(render_figure, *zip(*jobs)))
+
+    with open(manifest_path, 'w') as f:
+        json.dump(keys, f, indent=2)
 
     # Create an index.html file to link to all the plots
-    with open('gui/index.html', 'w') as f:
+    with open(output_dir / 'index.html', 'w') as f:
         f.write('<html><head><title>KPI Plots</title></head><body>')
         f.write('<h1>KPI Plots</h1>')
+        if config.RUN_REGISTRY:
+            f.write('<p><a href="runs.html">Compare runs</a></p>')
         f.write('<ul>')
-
-        for file in all_files:
-            # Read the csv file
-            df = pd.read_csv(file)
-
-            # Get the file name without the extension
-            file_name = os.path.splitext(os.path.basename(file))[0]
-
-            plot_file_name = f'plots/{file_name}.html'
-
-            if file_name == 'summary_kpis':
-                # For summary_kpis, create a table
-                fig = go.Figure(data=[go.Table(
-                    header=dict(values=list(df.columns),
-                                fill_color='paleturquoise',
-                                align='left'),
-                    cells=dict(values=[df[col] for col in df.columns],
-                               fill_color='lavender',
-                               align='left'))
-                ])
-                fig.update_layout(title_text=file_name)
-                fig.write_html(f'gui/{plot_file_name}')
-            else:
-                # For other KPIs, create a line plot
-                if 'timestamp' in df.columns:
-                    fig = px.line(df, x='timestamp', y=df.columns[1:], title=file_name)
-                    fig.write_html(f'gui/{plot_file_name}')
-                else:
-                    print(f"Skipping {file_name}.csv as it does not contain a 'timestamp' column for line plotting.")
-                    continue # Skip adding to index.html if not plotted
-
-            # Add a link to the plot/table in the index.html file
-            f.write(f'<li><a href="{plot_file_name}">{file_name}</a></li>')
-
+        for name in figures:
+            f.write(f'<li><a href="plots/{name}.html">{name}</a></li>')
         f.write('</ul></body></html>')
 
-    print("Plots generated successfully in the 'gui/plots' directory.")
-    print("Open 'gui/index.html' in your browser to view the plots.")
+    print(f"Plots generated in '{plots_dir}' ({len(stale)} of {len(figures)} redrawn).")
+    print(f"Open '{output_dir / 'index.html'}' in your browser to view the plots.")
+    return stale
 
 if __name__ == '__main__':
-    generate_plots()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate the KPI plots of the last run.')
+    parser.add_argument('--force', action='store_true', help='Redraw every figure')
+    parser.add_argument('--workers', type=int, default=None, help='Overrides config.PLOT_MAX_WORKERS')
+    args = parser.parse_args()
+    generate_plots(force=args.force, max_workers=args.workers)
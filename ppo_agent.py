@@ -1,13 +1,16 @@
-import torch as th
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv
 import gymnasium as gym
 import numpy as np
-from citylearn.citylearn import CityLearnEnv
-from custom_rewards import GridConsumptionReward
+from dataset_cache import make_env
+from custom_rewards import get_reward_settings
 import config
+import json
+import pickle
 from pathlib import Path
-from utils import copy_output_files # Import copy_output_files
+from functools import partial
+from utils import copy_output_files, load_schema, get_building_names, get_observation_names, split_episode_windows
+from profiler import StepProfiler
+from translation_layer import TranslationLayer
+from observation_pipeline import ObservationPipeline
 
 class PPOAgent:
     """
@@ -16,42 +19,83 @@ class PPOAgent:
     def __init__(self, env):
         """
         Initializes the PPO agent.
+        Accepts a single environment or an already vectorized one (e.g. SubprocVecEnv).
         """
-        self.env = DummyVecEnv([lambda: env])
+        from stable_baselines3 import PPO
+        from stable_baselines3.common.vec_env import DummyVecEnv, VecEnv
+        self.env = env if isinstance(env, VecEnv) else DummyVecEnv([lambda: env])
         self.model = PPO("MlpPolicy", self.env, verbose=1)
+        self.normalize_obs = lambda obs: obs
 
-    def learn(self, total_timesteps):
+    def learn(self, total_timesteps, callback=None, reset_num_timesteps=True):
         """
         Trains the PPO model.
+        Pass reset_num_timesteps=False to continue counting from a restored checkpoint.
         """
-        self.model.learn(total_timesteps=total_timesteps)
+        self.model.learn(total_timesteps=total_timesteps, callback=callback, reset_num_timesteps=reset_num_timesteps)
 
     def predict(self, obs):
         """
         Returns an action for the given observation.
         """
-        action, _ = self.model.predict(obs, deterministic=True)
+        action, _ = self.model.predict(self.normalize_obs(obs), deterministic=True)
         return action
 
     def save(self, path):
         """
-        Saves the trained model.
+        Saves the trained model and, if the training env is normalized, its statistics.
         """
+        from stable_baselines3.common.vec_env import VecNormalize
         self.model.save(path)
+        if isinstance(self.env, VecNormalize):
+            self.env.save(get_vec_normalize_path(path))
 
     def load(self, path):
         """
-        Loads a trained model.
+        Loads a trained model and the observation statistics saved with it.
         """
+        from stable_baselines3 import PPO
         self.model = PPO.load(path, env=self.env)
+        self.normalize_obs = load_observation_normalizer(get_vec_normalize_path(path))
 
 class SingleBuildingEnvWrapper(gym.Wrapper):
-    def __init__(self, env):
+    def __init__(self, env, observation_names=None, features=None, cyclic_features=()):
+        """
+        Args:
+            env (CityLearnEnv): Environment reduced to a single building.
+            observation_names (list of str, optional): Fixed observation layout. Observations the
+                building does not have (e.g. no PV or DHW storage) are filled with zeros so that
+                buildings with different observation vectors can share one policy.
+            features (list of str, optional): Observations passed to the policy, see ObservationPipeline.
+            cyclic_features (list of str): Observations encoded as (sin, cos).
+        """
         super().__init__(env)
         # The action space is the standardized 3-element action
         self.action_space = gym.spaces.Box(low=-1.0, high=1.0, shape=(3,), dtype=np.float32)
         # The observation space is the single building's observation space
         self.observation_space = env.observation_space[0]
+        self._observation_index = None
+
+        if observation_names is not None:
+            building_observation_names = env.observation_names[0]
+            self._observation_index = np.array([
+                building_observation_names.index(name) if name in building_observation_names else -1
+                for name in observation_names
+            ])
+            self._observation_mask = self._observation_index >= 0
+            self.observation_space = gym.spaces.Box(
+                low=np.where(self._observation_mask, self.observation_space.low[self._observation_index], 0.0).astype(np.float32),
+                high=np.where(self._observation_mask, self.observation_space.high[self._observation_index], 0.0).astype(np.float32),
+                dtype=np.float32
+            )
+
+        self.pipeline = None
+        if features is not None or cyclic_features:
+            layout = env.observation_names[0] if observation_names is None else observation_names
+            self.pipeline = ObservationPipeline(layout, features=features, cyclic_features=cyclic_features)
+            low, high = self.pipeline.bounds(self.observation_space.low, self.observation_space.high)
+            self.observation_space = gym.spaces.Box(low=low, high=high, dtype=np.float32)
+
         self.building_metadata = self.env.buildings[0].action_metadata
         # Store reference to unwrapped environment
         self._base_env = env
@@ -73,11 +117,22 @@ class SingleBuildingEnvWrapper(gym.Wrapper):
         obs, reward, terminated, truncated, info = self.env.step([np.array(building_action)])
         
         # Return the single observation, reward, etc.
-        return obs[0], reward[0], terminated, truncated, info
+        return self._map_observation(obs[0]), reward[0], terminated, truncated, info
 
     def reset(self, **kwargs):
         obs, info = self.env.reset(**kwargs)
-        return obs[0], info
+        return self._map_observation(obs[0]), info
+
+    def _map_observation(self, obs):
+        """
+        Maps the building observation onto the fixed observation layout and the policy's features, if set.
+        """
+        if self._observation_index is not None:
+            obs = np.asarray(obs, dtype=np.float32)
+            obs = np.where(self._observation_mask, obs[self._observation_index], 0.0).astype(np.float32)
+        if self.pipeline is not None:
+            obs = self.pipeline(obs)
+        return obs
 
     @property
     def terminated(self):
@@ -94,40 +149,446 @@ class SingleBuildingEnvWrapper(gym.Wrapper):
             return self._base_env.close()
         return self.env.close()
 
-def run_ppo_training(schema_path):
+class ObservationBatcher:
     """
-    Trains a PPO agent.
+    Stacks the observations of all buildings into one (n_buildings, n_observations) batch in a
+    fixed observation layout, zero-filling observations a building does not have.
     """
-    # --- Training ---
-    # Create a single-building environment for training
-    train_env = CityLearnEnv(
+    def __init__(self, building_observation_names, observation_names, shared_observations=None):
+        """
+        Args:
+            building_observation_names (list of list of str): Observation names of every building.
+            observation_names (list of str): Layout of a row of the batch.
+            shared_observations (list of str, optional): For a central-agent environment, whose single
+                observation vector holds the shared observations (env.shared_observations) only once.
+        """
+        if shared_observations is None:
+            offsets = np.cumsum([0] + [len(names) for names in building_observation_names])
+            positions = [list(range(offset, offset + len(names))) for offset, names in zip(offsets, building_observation_names)]
+        else:
+            positions = central_observation_positions(building_observation_names, shared_observations)
+
+        index = np.array([
+            [building_positions[names.index(name)] if name in names else -1 for name in observation_names]
+            for building_positions, names in zip(positions, building_observation_names)
+        ], dtype=int).reshape(len(building_observation_names), len(observation_names))
+        self._mask = index >= 0
+        self._index = np.where(self._mask, index, 0)
+
+    def __call__(self, observations):
+        flat = np.concatenate([np.asarray(obs, dtype=np.float32) for obs in observations])
+        return np.where(self._mask, flat[self._index], np.float32(0.0))
+
+def central_observation_positions(building_observation_names, shared_observations):
+    """
+    Returns, for every building, the positions of its observations in the observation vector of a
+    central-agent CityLearnEnv, where a shared observation only appears where it is first seen.
+    """
+    positions, first_positions, position = [], {}, 0
+    for i, names in enumerate(building_observation_names):
+        building_positions = []
+        for name in names:
+            if i == 0 or name not in shared_observations or name not in first_positions:
+                if name in shared_observations:
+                    first_positions.setdefault(name, position)
+                building_positions.append(position)
+                position += 1
+            else:
+                building_positions.append(first_positions[name])
+        positions.append(building_positions)
+    return positions
+
+class DistrictEnvWrapper(gym.Wrapper):
+    """
+    Exposes a central-agent CityLearnEnv as one agent controlling every building.
+
+    The observation is the (n_buildings, n_features) batch of all buildings' observations in a
+    shared layout, passed through the observation pipeline and flattened. The action is the
+    flattened (n_buildings, 3) matrix of standardized actions, mapped onto each building's actions
+    by the TranslationLayer; the reward is the environment's single central reward.
+    """
+    def __init__(self, env, observation_names, features=None, cyclic_features=()):
+        """
+        Args:
+            env (CityLearnEnv): Environment created with central_agent=True.
+            observation_names (list of str): Shared observation layout of a building row, e.g. the
+                schema's active observations (utils.get_observation_names).
+            features, cyclic_features: Observation pipeline, see ObservationPipeline.
+        """
+        super().__init__(env)
+        if not env.central_agent:
+            raise ValueError('DistrictEnvWrapper needs a CityLearnEnv created with central_agent=True.')
+
+        building_observation_names = [list(b.observations().keys()) for b in env.buildings]
+        self.num_buildings = len(env.buildings)
+        self.batcher = ObservationBatcher(building_observation_names, observation_names, shared_observations=env.shared_observations)
+        self.pipeline = ObservationPipeline(observation_names, features=features, cyclic_features=cyclic_features)
+        self.translator = TranslationLayer(env.buildings)
+
+        # Bounds of every building row, zero where the building does not have the observation
+        low = self.batcher(env.observation_space[0].low[None, :])
+        high = self.batcher(env.observation_space[0].high[None, :])
+        low, high = zip(*(self.pipeline.bounds(l, h) for l, h in zip(low, high)))
+        self.observation_space = gym.spaces.Box(low=np.concatenate(low), high=np.concatenate(high), dtype=np.float32)
+        self.action_space = gym.spaces.Box(low=-1.0, high=1.0, shape=(self.num_buildings*3,), dtype=np.float32)
+        self._base_env = env
+
+    def step(self, action):
+        actions = np.clip(np.asarray(action, dtype=np.float32).reshape(self.num_buildings, 3), -1.0, 1.0)
+        obs, reward, terminated, truncated, info = self.env.step(self.translator.translate_central(actions))
+        return self._map_observation(obs), reward[0], terminated, truncated, info
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        return self._map_observation(obs), info
+
+    def _map_observation(self, obs):
+        return self.pipeline(self.batcher(obs)).reshape(-1)
+
+    @property
+    def terminated(self):
+        return self._base_env.terminated
+
+    def close(self):
+        return self._base_env.close()
+
+class DistrictPPOPolicy:
+    """
+    Controls every building of a district with one trained single-building policy, using a
+    single batched model.predict call per time step.
+    """
+    def __init__(self, model_path, env, observation_names=None, features=None, cyclic_features=()):
+        """
+        Args:
+            model_path (str): Path of the saved PPO model.
+            env (CityLearnEnv): The district environment (all buildings).
+            observation_names (list of str, optional): Observation layout the policy was trained on,
+                defaults to the first building's observations (a policy trained on Building_1 alone).
+            features, cyclic_features: Observation pipeline the policy was trained with, see ObservationPipeline.
+        """
+        self.model, self.normalize_obs = load_policy(model_path)
+        observation_names = env.observation_names[0] if observation_names is None else observation_names
+        self.batcher = ObservationBatcher(env.observation_names, observation_names)
+        self.pipeline = ObservationPipeline(observation_names, features=features, cyclic_features=cyclic_features)
+        check_policy_observations(self.model, len(self.pipeline.names))
+
+    def predict(self, observations):
+        """
+        Returns an (n_buildings, 3) array of standardized actions.
+        """
+        observations = self.normalize_obs(self.pipeline(self.batcher(observations)))
+        actions, _ = self.model.predict(observations, deterministic=True)
+        return np.clip(actions, -1.0, 1.0)
+
+class PolicyAgent:
+    """
+    Runs a saved policy on the observations of an evaluation env (SingleBuildingEnvWrapper or
+    DistrictEnvWrapper), without creating a PPO model for training.
+    """
+    def __init__(self, model_path, env):
+        self.model, self.normalize_obs = load_policy(model_path)
+        check_policy_observations(self.model, env.observation_space.shape[0])
+
+    def predict(self, obs):
+        """
+        Returns an action for the given observation.
+        """
+        action, _ = self.model.predict(self.normalize_obs(obs), deterministic=True)
+        return action
+
+def load_policy(model_path, backend: str = None):
+    """
+    Loads a saved policy for inference.
+
+    Args:
+        model_path (str): Path of the saved PPO model.
+        backend (str, optional): 'numpy' (exported with numpy_policy.export_policy, exported first if
+            needed) or 'sb3' (PPO.load). Defaults to config.PPO_INFERENCE_BACKEND.
+
+    Returns:
+        tuple: (model with predict(observations, deterministic), function normalizing observations)
+    """
+    backend = config.PPO_INFERENCE_BACKEND if backend is None else backend
+    if backend == 'numpy':
+        from numpy_policy import load_numpy_policy
+        model = load_numpy_policy(model_path)
+        return model, model.normalize_obs
+    elif backend == 'sb3':
+        from stable_baselines3 import PPO
+        return PPO.load(model_path), load_observation_normalizer(get_vec_normalize_path(model_path))
+    else:
+        raise ValueError(f"Unknown PPO_INFERENCE_BACKEND '{backend}'. Use 'numpy' or 'sb3'.")
+
+def check_policy_observations(model, num_observations: int):
+    """
+    Raises a ValueError if the policy (SB3 or NumPy) was trained on a different number of observations.
+    """
+    expected = model.observation_size if hasattr(model, 'observation_size') else model.observation_space.shape[0]
+    if expected != num_observations:
+        raise ValueError(f"The policy expects {expected} observations, the observation pipeline produces {num_observations}.")
+
+def get_vec_normalize_path(model_path):
+    """
+    Returns the path of the normalization statistics saved next to a model, e.g. ppo_model_vec_normalize.pkl.
+    """
+    model_path = Path(model_path)
+    return model_path.with_name(f'{model_path.stem}_vec_normalize.pkl')
+
+def load_observation_normalizer(path):
+    """
+    Returns a function that normalizes observations with the VecNormalize statistics saved at
+    path, or leaves them unchanged if there are none (the model was trained without normalization).
+    """
+    path = Path(path)
+    if not path.exists():
+        return lambda obs: obs
+    with open(path, 'rb') as f:
+        vec_normalize = pickle.load(f) # Saved without its environment
+    return vec_normalize.normalize_obs if vec_normalize.norm_obs else (lambda obs: obs)
+
+def get_observation_pipeline_settings():
+    """
+    Returns the observation pipeline settings from config as keyword arguments of SingleBuildingEnvWrapper.
+    """
+    return {
+        'features': config.PPO_OBSERVATION_FEATURES,
+        'cyclic_features': tuple(config.PPO_CYCLIC_FEATURES),
+    }
+
+def make_training_env(schema_path, building_index=0, simulation_start_time_step=None, simulation_end_time_step=None, observation_names=None,
+                      reward_function=None, reward_function_kwargs=None, features=None, cyclic_features=(), episode_time_steps=None,
+                      central_agent=False):
+    """
+    Creates a single-building training environment, or a whole-district one for a central agent.
+
+    Args:
+        schema_path (str): Path to the schema.json file or a CityLearn dataset name.
+        building_index (int): Index of the building to train on (ignored for a central agent).
+        simulation_start_time_step (int, optional): First time step of the episode window.
+        simulation_end_time_step (int, optional): Last time step of the episode window.
+        observation_names (list of str, optional): Shared observation layout, see SingleBuildingEnvWrapper.
+        reward_function (type, optional): Reward function class, defaults to config.REWARD_FUNCTION.
+            Passed explicitly because worker processes do not see config changes made at runtime.
+        reward_function_kwargs (dict, optional): Parameters of the reward function, see get_reward_settings.
+        features, cyclic_features: Observation pipeline, see get_observation_pipeline_settings (passed
+            explicitly for the same reason).
+        episode_time_steps (int, optional): Episode length, defaults to the whole simulation period.
+        central_agent (bool): Control every building with one policy through DistrictEnvWrapper; the
+            reward is the district sum of the reward function (its central_agent path).
+    """
+    if reward_function is None:
+        reward_function, reward_function_kwargs = get_reward_settings(schema_path=schema_path).values()
+
+    env = make_env(
         schema_path,
-        central_agent=False, # Must be false for custom reward
-        reward_function=GridConsumptionReward
+        central_agent=central_agent, # A single-building agent needs the per-building rewards
+        reward_function=reward_function,
+        reward_function_kwargs=reward_function_kwargs,
+        simulation_start_time_step=simulation_start_time_step,
+        simulation_end_time_step=simulation_end_time_step,
+        episode_time_steps=episode_time_steps
     )
-    # Select the first building for training
-    train_env.buildings = [train_env.buildings[0]]
-    train_env = SingleBuildingEnvWrapper(train_env)
+    if central_agent:
+        observation_names = get_observation_names(load_schema(schema_path)) if observation_names is None else observation_names
+        return DistrictEnvWrapper(env, observation_names, features=features, cyclic_features=cyclic_features)
+
+    env.buildings = [env.buildings[building_index]]
+    return SingleBuildingEnvWrapper(env, observation_names=observation_names, features=features, cyclic_features=cyclic_features)
+
+def get_policy_observation_names(schema_path):
+    """
+    Returns the shared observation layout used by the policy, or None when it is
+    trained on the raw observations of a single building.
+    """
+    if config.PPO_CENTRAL_AGENT or (config.PPO_NUM_ENVS > 1 and config.PPO_VEC_ENV_MODE == 'buildings'):
+        return get_observation_names(load_schema(schema_path))
+    return None
+
+def make_training_vec_env(schema_path, num_envs: int, mode: str = 'buildings'):
+    """
+    Creates the vectorized training environment.
+
+    With num_envs == 1 this is the original single-building DummyVecEnv. Otherwise
+    num_envs SingleBuildingEnvWrapper instances are stepped in worker processes:
+    - 'buildings': environment i trains on building i (cycling through the schema's buildings). All
+      observations are mapped onto the schema's observation layout so the buildings share one policy.
+    - 'windows': every environment trains on the first building, each on its own slice of the simulation period.
+    With config.PPO_CENTRAL_AGENT every environment is the whole district (DistrictEnvWrapper), which
+    only combines with 'windows'.
 
-    # Create and train the PPO agent
+    The observations pass through the pipeline from config (feature selection and cyclic
+    encoding) and, if config.PPO_NORMALIZE_OBSERVATIONS or PPO_NORMALIZE_REWARD is set, VecNormalize.
+    """
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecNormalize
+    pipeline_settings = {**get_reward_settings(schema_path=schema_path), **get_observation_pipeline_settings()}
+    if config.PPO_CENTRAL_AGENT:
+        pipeline_settings['central_agent'] = True
+        if num_envs > 1 and mode != 'windows':
+            raise ValueError("A central agent controls every building, use PPO_VEC_ENV_MODE 'windows' to train it on several environments.")
+
+    if num_envs <= 1:
+        vec_env = DummyVecEnv([partial(make_training_env, schema_path, **pipeline_settings)])
+    else:
+        schema = load_schema(schema_path)
+
+        if mode == 'buildings':
+            num_buildings = len(get_building_names(schema))
+            observation_names = get_observation_names(schema)
+            env_fns = [
+                partial(make_training_env, schema_path, building_index=i % num_buildings, observation_names=observation_names,
+                        **pipeline_settings)
+                for i in range(num_envs)
+            ]
+        elif mode == 'windows':
+            windows = split_episode_windows(schema['simulation_start_time_step'], schema['simulation_end_time_step'], num_envs)
+            env_fns = [
+                partial(make_training_env, schema_path, simulation_start_time_step=start, simulation_end_time_step=end,
+                        **pipeline_settings)
+                for start, end in windows
+            ]
+        else:
+            raise ValueError(f"Unknown PPO_VEC_ENV_MODE '{mode}'. Use 'buildings' or 'windows'.")
+
+        vec_env = SubprocVecEnv(env_fns)
+
+    if config.PPO_NORMALIZE_OBSERVATIONS or config.PPO_NORMALIZE_REWARD:
+        vec_env = VecNormalize(
+            vec_env,
+            norm_obs=config.PPO_NORMALIZE_OBSERVATIONS,
+            norm_reward=config.PPO_NORMALIZE_REWARD,
+            clip_obs=config.PPO_NORMALIZE_CLIP,
+            clip_reward=config.PPO_NORMALIZE_CLIP
+        )
+    return vec_env
+
+def get_training_settings(schema_path, num_envs: int):
+    """
+    Returns the settings a training run depends on, saved with its checkpoints.
+    """
+    return {
+        'schema_path': str(schema_path),
+        'episode_time_steps': config.EPISODE_TIME_STEPS,
+        'simulation_start_time_step': config.SIMULATION_START_TIME_STEP,
+        'simulation_end_time_step': config.SIMULATION_END_TIME_STEP,
+        'reward_function': config.REWARD_FUNCTION,
+        'reward_function_kwargs': get_reward_settings(schema_path=schema_path)['reward_function_kwargs'],
+        'num_envs': num_envs,
+        'vec_env_mode': config.PPO_VEC_ENV_MODE,
+        'central_agent': config.PPO_CENTRAL_AGENT,
+        'observation_features': config.PPO_OBSERVATION_FEATURES,
+        'cyclic_features': list(config.PPO_CYCLIC_FEATURES),
+        'normalize': [config.PPO_NORMALIZE_OBSERVATIONS, config.PPO_NORMALIZE_REWARD, config.PPO_NORMALIZE_CLIP],
+    }
+
+def make_training_callbacks(schema_path, settings: dict = None):
+    """
+    Creates the checkpoint and (if config.PPO_EVAL_FREQ > 0) asynchronous evaluation callbacks.
+    settings are saved with every checkpoint, see get_training_settings.
+    """
+    from ppo_callbacks import AsyncEvalCallback, CheckpointCallback
+
+    callbacks = [CheckpointCallback(config.PPO_CHECKPOINT_DIR, config.PPO_CHECKPOINT_FREQ, keep=config.PPO_CHECKPOINT_KEEP, settings=settings)]
+    if config.PPO_EVAL_FREQ > 0:
+        callbacks.append(AsyncEvalCallback(
+            schema_path, config.PPO_CHECKPOINT_DIR, config.PPO_EVAL_FREQ,
+            observation_names=get_policy_observation_names(schema_path),
+            episode_time_steps=config.EPISODE_TIME_STEPS,
+            central_agent=config.PPO_CENTRAL_AGENT,
+            **get_reward_settings(schema_path=schema_path),
+            **get_observation_pipeline_settings()
+        ))
+    return callbacks
+
+def run_ppo_training(schema_path, num_envs: int = None, resume: bool = None):
+    """
+    Trains a PPO agent, checkpointing to config.PPO_CHECKPOINT_DIR as it goes.
+
+    Args:
+        num_envs (int, optional): Defaults to config.PPO_NUM_ENVS.
+        resume (bool, optional): Continue from the latest checkpoint until config.PPO_TRAINING_TIMESTEPS
+            timesteps in total. Defaults to config.PPO_RESUME. Raises a ValueError if the checkpoint
+            was trained with other settings (see get_training_settings).
+
+    Returns:
+        PPOAgent: The trained agent (also saved to config.PPO_MODEL_PATH).
+    """
+    from ppo_callbacks import checkpoint_settings, latest_checkpoint, load_checkpoint
+
+    num_envs = config.PPO_NUM_ENVS if num_envs is None else num_envs
+    resume = config.PPO_RESUME if resume is None else resume
+
+    # --- Training ---
+    train_env = make_training_vec_env(schema_path, num_envs, config.PPO_VEC_ENV_MODE)
+    print(f"Training {'central ' if config.PPO_CENTRAL_AGENT else ''}PPO on {train_env.num_envs} environment(s) "
+          f"(mode: {config.PPO_VEC_ENV_MODE if num_envs > 1 else 'single'})")
+
+    # Create the PPO agent, restoring the latest checkpoint when resuming
     agent = PPOAgent(train_env)
-    agent.learn(total_timesteps=config.PPO_TRAINING_TIMESTEPS)
+    settings = json.loads(json.dumps(get_training_settings(schema_path, num_envs)))
+    checkpoint = latest_checkpoint(config.PPO_CHECKPOINT_DIR) if resume else None
+    if checkpoint is not None:
+        saved_settings = checkpoint_settings(checkpoint)
+        if saved_settings is None:
+            print(f"Warning: {checkpoint} has no saved settings, it cannot be checked against the current ones")
+        elif saved_settings != settings:
+            changed = [key for key in settings if saved_settings.get(key) != settings[key]]
+            train_env.close()
+            raise ValueError(f"{checkpoint} was trained with other settings ({', '.join(changed)}). "
+                             f"Train without resuming or use another PPO_CHECKPOINT_DIR.")
+        agent.model = load_checkpoint(checkpoint, train_env)
+        print(f"Resuming from {checkpoint} at {agent.model.num_timesteps} timesteps")
+    elif config.PPO_BC_PRETRAIN:
+        # Warm start: clone the RBC before fine-tuning with RL
+        from behavior_cloning import pretrain_policy
+        from trajectory_recorder import ensure_rbc_trajectories
+        pretrain_policy(
+            agent.model, ensure_rbc_trajectories(schema_path),
+            observation_names=get_policy_observation_names(schema_path),
+            central_agent=config.PPO_CENTRAL_AGENT,
+            **get_observation_pipeline_settings()
+        )
+
+    remaining_timesteps = config.PPO_TRAINING_TIMESTEPS - agent.model.num_timesteps
+    if remaining_timesteps > 0:
+        agent.learn(
+            total_timesteps=remaining_timesteps,
+            callback=make_training_callbacks(schema_path, settings),
+            reset_num_timesteps=checkpoint is None
+        )
+    else:
+        print(f"Checkpoint already has {agent.model.num_timesteps} of {config.PPO_TRAINING_TIMESTEPS} timesteps, nothing to train")
     agent.save(config.PPO_MODEL_PATH)
+    if config.PPO_EXPORT_NUMPY:
+        from numpy_policy import export_policy
+        export_policy(config.PPO_MODEL_PATH, model=agent.model)
 
     # Close training environment
     train_env.close()
 
     print("PPO training finished.")
+    return agent
 
     
 
-def run_ppo_evaluation(schema_path):
+def run_ppo_evaluation(schema_path, accumulator=None, profiler=None, mode: str = None):
     """
     Evaluates a trained PPO agent.
+
+    Args:
+        schema_path (str): Path to the schema file.
+        mode (str, optional): 'single' evaluates on the first building, 'district' runs the policy for
+            every building with one batched prediction per step, 'central' runs a central agent
+            (config.PPO_CENTRAL_AGENT) on the district. Defaults to 'central' for a central agent,
+            config.PPO_EVAL_MODE otherwise.
+        accumulator (KPIAccumulator, optional): Updated with the evaluation env after every step.
+        profiler (StepProfiler, optional): Times the phases of the evaluation loop; it runs from
+            env.reset() until the environment is closed.
     """
-    print("\n--- PPO Evaluation ---")
+    profiler = StepProfiler(enabled=False) if profiler is None else profiler
+    if mode is None:
+        mode = 'central' if config.PPO_CENTRAL_AGENT else config.PPO_EVAL_MODE
+    print(f"\n--- PPO Evaluation ({mode}) ---")
 
-    # Create a single-building environment for evaluation
     output_dir = Path(config.BASE_OUTPUT_DIR) # Base output directory
     
     # Clear output directory before evaluation
@@ -140,35 +601,64 @@ def run_ppo_evaluation(schema_path):
                 shutil.rmtree(item)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    eval_env = CityLearnEnv(
+    eval_env = make_env(
         schema_path,
-        central_agent=False,
+        central_agent=mode == 'central',
         episode_time_steps=config.EPISODE_TIME_STEPS,  # CRITICAL: Set episode length
-        reward_function=GridConsumptionReward,
-        render_mode='end', # Ensure render_mode is set to 'end'
+        simulation_start_time_step=config.SIMULATION_START_TIME_STEP,
+        simulation_end_time_step=config.SIMULATION_END_TIME_STEP,
+        **get_reward_settings(schema_path=schema_path),
+        render_mode='end' if config.RENDER_EXPORTS else 'none',
         render_directory=Path.cwd() / output_dir, # Files go directly here
         render_session_name='' # Empty string = no subdirectory
     )
 
-    eval_env.buildings = [eval_env.buildings[0]]
-    
     # Keep reference to base environment before wrapping
     base_eval_env = eval_env
-    eval_env = SingleBuildingEnvWrapper(eval_env)
+    translator = None
+
+    if mode == 'district':
+        # One policy for all buildings, standardized actions go through the translation layer
+        agent = DistrictPPOPolicy(config.PPO_MODEL_PATH, eval_env, observation_names=get_policy_observation_names(schema_path),
+                                  **get_observation_pipeline_settings())
+        translator = TranslationLayer(eval_env.buildings)
+    elif mode == 'single':
+        # Single-building environment
+        eval_env.buildings = [eval_env.buildings[0]]
+        eval_env = SingleBuildingEnvWrapper(eval_env, observation_names=get_policy_observation_names(schema_path),
+                                            **get_observation_pipeline_settings())
 
-    # Load the trained PPO agent
-    agent = PPOAgent(eval_env)
-    agent.load(config.PPO_MODEL_PATH)
+        # Load the trained policy
+        agent = PolicyAgent(config.PPO_MODEL_PATH, eval_env)
+    elif mode == 'central':
+        # One policy observing the district, its (n_buildings, 3) actions are translated by the wrapper
+        eval_env = DistrictEnvWrapper(eval_env, get_policy_observation_names(schema_path), **get_observation_pipeline_settings())
+        agent = PolicyAgent(config.PPO_MODEL_PATH, eval_env)
+    else:
+        raise ValueError(f"Unknown PPO_EVAL_MODE '{mode}'. Use 'single', 'district' or 'central'.")
     
     # Run evaluation simulation - CRITICAL: Run until environment terminates naturally
-    observations = eval_env.reset()[0]
+    profiler.start()
+    with profiler.phase('reset'):
+        observations = eval_env.reset()[0]
 
     step_count = 0
     # Use the same pattern as RBC: run until the environment is terminated
     while not eval_env.terminated:
-        actions = agent.predict(observations)
-        observations, rewards, terminated, truncated, info = eval_env.step(actions)
+        with profiler.phase('predict'):
+            actions = agent.predict(observations)
+        if translator is not None:
+            with profiler.phase('translate'):
+                actions = translator.translate_batch(actions)
+        with profiler.phase('env_step'):
+            observations, rewards, terminated, truncated, info = eval_env.step(actions)
         step_count += 1
+
+        if accumulator is not None:
+            with profiler.phase('kpi_update'):
+                accumulator.update(base_eval_env)
+
+        profiler.step()
         
         # Safety check to prevent infinite loop
         if step_count >= config.EPISODE_TIME_STEPS:
@@ -179,11 +669,13 @@ def run_ppo_evaluation(schema_path):
     print(f"Episode terminated: {eval_env.terminated}")
     
     # CRITICAL: Close the environment to trigger rendering
-    eval_env.close()
+    with profiler.phase('close_and_render'):
+        eval_env.close()
+    profiler.stop()
     
     # CityLearn might create a timestamp subdirectory even with render_session_name=''
     # So we need to move files from any subdirectories to the main output_dir
-    if output_dir.exists():
+    if config.RENDER_EXPORTS and output_dir.exists():
         for subdir in output_dir.iterdir():
             if subdir.is_dir():
                 # Found a subdirectory (likely timestamp-based)
@@ -0,0 +1,312 @@
+"""
+Checkpointing and periodic evaluation for PPO training.
+
+A checkpoint is a directory config.PPO_CHECKPOINT_DIR/step_<num_timesteps> holding everything
+needed to continue training where it stopped:
+- model.zip: policy weights, optimizer state and the timestep counter (PPO.save);
+- vec_normalize.pkl: the running observation/reward statistics, if the env is a VecNormalize;
+- rng_state.pkl: the Python, NumPy and torch random number generator states;
+- settings.json: the training settings (see ppo_agent.get_training_settings), so training only
+  resumes from checkpoints of the same setup.
+
+Checkpoints are written at the start of a rollout, i.e. right after a policy update, so the
+weights always match the timestep counter. The environments themselves are not saved: a resumed
+run starts new episodes.
+"""
+import json
+import os
+import pickle
+import random
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import torch as th
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import unwrap_vec_normalize
+
+CHECKPOINT_PATTERN = re.compile(r'^step_(\d+)$')
+
+# --- Checkpoints ---
+
+def get_rng_state():
+    """
+    Returns the state of every random number generator used during training.
+    """
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': th.get_rng_state(),
+        'cuda': th.cuda.get_rng_state_all() if th.cuda.is_available() else None,
+    }
+
+def set_rng_state(state: dict):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    th.set_rng_state(state['torch'])
+    if state.get('cuda') is not None and th.cuda.is_available():
+        th.cuda.set_rng_state_all(state['cuda'])
+
+def save_checkpoint(model, checkpoint_dir, keep: int = None, settings: dict = None):
+    """
+    Saves a checkpoint of the model (and the training settings, if given) and deletes all but the
+    newest keep checkpoints.
+
+    The checkpoint is written to a temporary directory and renamed when complete, so an
+    interrupted save never leaves a partial checkpoint behind.
+
+    Returns:
+        Path: The checkpoint directory.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    path = checkpoint_dir / f'step_{model.num_timesteps:09d}'
+    tmp_path = checkpoint_dir / f'.{path.name}.{os.getpid()}.tmp'
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    model.save(tmp_path / 'model.zip')
+    vec_normalize = unwrap_vec_normalize(model.get_env())
+    if vec_normalize is not None:
+        vec_normalize.save(tmp_path / 'vec_normalize.pkl')
+    with open(tmp_path / 'rng_state.pkl', 'wb') as f:
+        pickle.dump(get_rng_state(), f)
+    if settings is not None:
+        with open(tmp_path / 'settings.json', 'w') as f:
+            json.dump(settings, f, indent=2)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+    if keep:
+        for old_path in list_checkpoints(checkpoint_dir)[:-keep]:
+            shutil.rmtree(old_path)
+    return path
+
+def list_checkpoints(checkpoint_dir):
+    """
+    Returns the complete checkpoints in checkpoint_dir, oldest first.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    if not checkpoint_dir.exists():
+        return []
+    paths = [
+        path for path in checkpoint_dir.iterdir()
+        if path.is_dir() and CHECKPOINT_PATTERN.match(path.name) and (path / 'model.zip').exists()
+    ]
+    return sorted(paths, key=lambda path: int(CHECKPOINT_PATTERN.match(path.name).group(1)))
+
+def latest_checkpoint(checkpoint_dir):
+    """
+    Returns the newest checkpoint in checkpoint_dir, or None if there is none.
+    """
+    checkpoints = list_checkpoints(checkpoint_dir)
+    return checkpoints[-1] if checkpoints else None
+
+def checkpoint_settings(path):
+    """
+    Returns the training settings saved with a checkpoint, or None if it has none.
+    """
+    path = Path(path) / 'settings.json'
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def load_checkpoint(path, env):
+    """
+    Restores a model from a checkpoint onto the given (vectorized) training environment.
+
+    If the checkpoint has VecNormalize statistics and env is a VecNormalize, its statistics are
+    replaced by the saved ones.
+
+    Returns:
+        PPO: The restored model, with num_timesteps set to the checkpoint's.
+    """
+    path = Path(path)
+    vec_normalize = unwrap_vec_normalize(env)
+    if vec_normalize is not None and (path / 'vec_normalize.pkl').exists():
+        with open(path / 'vec_normalize.pkl', 'rb') as f:
+            saved = pickle.load(f)
+        vec_normalize.obs_rms = saved.obs_rms
+        vec_normalize.ret_rms = saved.ret_rms
+
+    model = PPO.load(path / 'model.zip', env=env)
+    if (path / 'rng_state.pkl').exists():
+        with open(path / 'rng_state.pkl', 'rb') as f:
+            set_rng_state(pickle.load(f))
+    return model
+
+class CheckpointCallback(BaseCallback):
+    """
+    Saves a checkpoint every save_freq timesteps (at the next rollout start) and at the end of training.
+    """
+    def __init__(self, checkpoint_dir, save_freq: int, keep: int = None, settings: dict = None, verbose: int = 1):
+        super().__init__(verbose)
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.save_freq = save_freq
+        self.keep = keep
+        self.settings = settings
+        self._last_save = None
+
+    def _on_training_start(self):
+        self._last_save = self.model.num_timesteps
+
+    def _on_rollout_start(self):
+        if self.save_freq > 0 and self.model.num_timesteps - self._last_save >= self.save_freq:
+            self._save()
+
+    def _on_step(self):
+        return True
+
+    def _on_training_end(self):
+        if self.model.num_timesteps > self._last_save:
+            self._save()
+
+    def _save(self):
+        path = save_checkpoint(self.model, self.checkpoint_dir, keep=self.keep, settings=self.settings)
+        self._last_save = self.model.num_timesteps
+        if self.verbose:
+            print(f"Checkpoint saved to {path}")
+
+# --- Evaluation ---
+
+def evaluate_policy_episode(schema_path, model_path, vec_normalize_path=None, observation_names=None,
+                            reward_function=None, reward_function_kwargs=None, episode_time_steps=None, features=None, cyclic_features=(), central_agent=False):
+    """
+    Runs one deterministic episode with a saved policy, on the first building or, for a central
+    agent, the district.
+    Executed in a separate process, so everything it needs is passed explicitly.
+
+    Returns:
+        dict: Episode reward, steps and the net electricity consumption of the controlled building(s).
+    """
+    from ppo_agent import make_training_env, load_observation_normalizer
+    th.set_num_threads(1) # Leave the cores to training
+
+    wrapped_env = make_training_env(
+        schema_path,
+        observation_names=observation_names,
+        reward_function=reward_function,
+        reward_function_kwargs=reward_function_kwargs,
+        features=features,
+        cyclic_features=cyclic_features,
+        episode_time_steps=episode_time_steps,
+        central_agent=central_agent
+    )
+    env = wrapped_env.unwrapped
+    normalize = load_observation_normalizer(vec_normalize_path) if vec_normalize_path is not None else (lambda obs: obs)
+
+    model = PPO.load(model_path)
+    observations, _ = wrapped_env.reset()
+    episode_reward, steps = 0.0, 0
+    while not wrapped_env.terminated:
+        actions, _ = model.predict(normalize(observations), deterministic=True)
+        observations, reward, _, _, _ = wrapped_env.step(actions)
+        episode_reward += float(reward)
+        steps += 1
+
+    return {
+        'episode_reward': episode_reward,
+        'steps': steps,
+        'net_electricity_consumption': float(sum(np.sum(b.net_electricity_consumption) for b in env.buildings)),
+    }
+
+class AsyncEvalCallback(BaseCallback):
+    """
+    Evaluates a snapshot of the policy every eval_freq timesteps in a separate process while
+    training continues. Results are logged to the SB3 logger (eval/...) and appended to
+    eval_log.csv in log_dir as they come in.
+
+    At most one evaluation runs at a time: if the previous one is still running when the next
+    is due, that evaluation is skipped.
+    """
+    def __init__(self, schema_path, log_dir, eval_freq: int, observation_names=None, reward_function=None, reward_function_kwargs=None,
+                 episode_time_steps=None, features=None, cyclic_features=(), central_agent=False, verbose: int = 1):
+        super().__init__(verbose)
+        self.schema_path = schema_path
+        self.log_dir = Path(log_dir)
+        self.eval_freq = eval_freq
+        self.evaluation_kwargs = {
+            'observation_names': observation_names,
+            'reward_function': reward_function,
+            'reward_function_kwargs': reward_function_kwargs,
+            'episode_time_steps': episode_time_steps,
+            'features': features,
+            'cyclic_features': cyclic_features,
+            'central_agent': central_agent,
+        }
+        self._executor = None
+        self._pending = None
+        self._last_eval = None
+
+    def _on_training_start(self):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        # spawn: forking a process that already runs torch threads is unsafe
+        self._executor = ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'))
+        self._last_eval = self.model.num_timesteps
+
+    def _on_step(self):
+        self._collect()
+        if self.eval_freq > 0 and self.num_timesteps - self._last_eval >= self.eval_freq:
+            self._last_eval = self.num_timesteps
+            if self._pending is None:
+                self._submit()
+            elif self.verbose:
+                print(f"Skipping evaluation at {self.num_timesteps} timesteps, the previous one is still running")
+        return True
+
+    def _on_training_end(self):
+        if self._pending is not None:
+            self._collect(wait=True)
+        self._executor.shutdown()
+        self._executor = None
+
+    def _submit(self):
+        snapshot_dir = self.log_dir / 'snapshots'
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        model_path = snapshot_dir / f'model_{self.num_timesteps:09d}.zip'
+        self.model.save(model_path)
+
+        vec_normalize_path = None
+        vec_normalize = unwrap_vec_normalize(self.model.get_env())
+        if vec_normalize is not None:
+            vec_normalize_path = snapshot_dir / f'vec_normalize_{self.num_timesteps:09d}.pkl'
+            vec_normalize.save(vec_normalize_path)
+
+        future = self._executor.submit(
+            evaluate_policy_episode, self.schema_path, model_path, vec_normalize_path, **self.evaluation_kwargs
+        )
+        self._pending = (future, self.num_timesteps, time.perf_counter(), [model_path, vec_normalize_path])
+
+    def _collect(self, wait: bool = False):
+        if self._pending is None:
+            return
+        future, timesteps, start, snapshot_files = self._pending
+        if not wait and not future.done():
+            return
+
+        self._pending = None
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Evaluation at {timesteps} timesteps failed: {e}")
+            return
+        finally:
+            for path in snapshot_files:
+                if path is not None:
+                    Path(path).unlink(missing_ok=True)
+
+        row = {'timesteps': timesteps, **result, 'eval_time_s': time.perf_counter() - start}
+        log_file = self.log_dir / 'eval_log.csv'
+        pd.DataFrame([row]).to_csv(log_file, mode='a', header=not log_file.exists(), index=False)
+        for key, value in result.items():
+            self.logger.record(f'eval/{key}', value)
+        if self.verbose:
+            print(f"Evaluation at {timesteps} timesteps: episode reward {result['episode_reward']:.2f}")
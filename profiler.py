@@ -0,0 +1,152 @@
+import time
+import cProfile
+import pstats
+from collections import defaultdict
+from pathlib import Path
+import pandas as pd
+import config
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+def max_rss_mb():
+    """
+    Returns the memory high-water mark of the current process in MB, or None if unknown.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0 # kB on Linux
+
+class _PhaseTimer:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.totals[self.name] += time.perf_counter() - self.start
+        self.profiler.calls[self.name] += 1
+
+class _NoTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_NO_TIMER = _NoTimer()
+
+class StepProfiler:
+    """
+    Records the wall time of the phases of a simulation loop:
+
+        profiler.start()
+        while not env.terminated:
+            with profiler.phase('predict'):
+                ...
+            profiler.step()
+        profiler.stop()
+        profiler.save(kpi_output_dir)
+
+    When disabled, phase() returns a no-op context manager and nothing is saved.
+    """
+    def __init__(self, name: str = 'simulation', enabled: bool = True, cprofile: bool = False):
+        """
+        Args:
+            name (str): Prefix of the saved files.
+            enabled (bool): Record anything at all.
+            cprofile (bool): Also run cProfile between start() and stop().
+        """
+        self.name = name
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.steps = 0
+        self.wall_time = 0.0
+        self._start = None
+        self._cprofile = cProfile.Profile() if enabled and cprofile else None
+
+    def phase(self, name: str):
+        """
+        Returns a context manager that adds its wall time to the given phase.
+        """
+        return _PhaseTimer(self, name) if self.enabled else _NO_TIMER
+
+    def step(self):
+        self.steps += 1
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._start is not None:
+            self.wall_time += time.perf_counter() - self._start
+            self._start = None
+
+    def summary(self):
+        """
+        Returns the run statistics: steps, wall time, steps/second and memory high-water mark.
+        """
+        return {
+            'steps': self.steps,
+            'wall_time_s': self.wall_time,
+            'steps_per_second': self.steps/self.wall_time if self.wall_time > 0 else float('nan'),
+            'untracked_time_s': self.wall_time - sum(self.totals.values()),
+            'max_rss_mb': max_rss_mb(),
+        }
+
+    def phases(self):
+        """
+        Returns a DataFrame with the total, mean and share of the wall time of every phase.
+        """
+        rows = [{
+            'phase': name,
+            'calls': self.calls[name],
+            'total_s': total,
+            'mean_ms': 1000.0*total/self.calls[name],
+            'share': total/self.wall_time if self.wall_time > 0 else float('nan'),
+        } for name, total in self.totals.items()]
+        return pd.DataFrame(rows, columns=['phase', 'calls', 'total_s', 'mean_ms', 'share'])
+
+    def report(self):
+        summary = self.summary()
+        shares = ', '.join(f"{row.phase} {100*row.share:.0f}%" for row in self.phases().itertuples())
+        print(f"{self.name}: {summary['steps']} steps in {summary['wall_time_s']:.2f} s "
+              f"({summary['steps_per_second']:.1f} steps/s); {shares}")
+
+    def save(self, output_dir: Path):
+        """
+        Writes {name}_profile.csv (run statistics), {name}_phases.csv (per-phase times) and,
+        if cProfile was enabled, {name}.prof plus the 40 most expensive functions in {name}_cprofile.txt.
+        """
+        if not self.enabled:
+            return
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame([self.summary()]).to_csv(output_dir / f'{self.name}_profile.csv', index=False)
+        self.phases().to_csv(output_dir / f'{self.name}_phases.csv', index=False)
+
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(output_dir / f'{self.name}.prof')
+            with open(output_dir / f'{self.name}_cprofile.txt', 'w') as f:
+                pstats.Stats(self._cprofile, stream=f).sort_stats('cumulative').print_stats(40)
+
+        self.report()
+        print(f"Profile saved to {output_dir}")
+
+def make_profiler(name: str):
+    """
+    Creates a StepProfiler with the profiling settings from config.
+    """
+    return StepProfiler(name, enabled=config.PROFILE_SIMULATION, cprofile=config.PROFILE_CPROFILE)
@@ -1,7 +1,10 @@
 import numpy as np
 from pathlib import Path
-from citylearn.citylearn import CityLearnEnv
+from dataset_cache import make_env
+from custom_rewards import get_reward_settings
 from translation_layer import TranslationLayer
+from kpi_accumulator import make_kpi_accumulator
+from profiler import make_profiler
 import config # Import config
 
 class SimpleRBC:
@@ -30,9 +33,76 @@ class SimpleRBC:
         
         return action
 
-def run_rbc_simulation(schema_path, episode_time_steps: int, central_agent: bool):
+def rbc_electrical_action(hour, charge_start_hour=7, discharge_start_hour=16, discharge_end_hour=20,
+                          charge_action=1.0, discharge_action=-1.0):
+    """
+    The time-of-day battery rule shared by the RBC implementations, for any broadcastable inputs.
+    Returns the standardized electrical storage action: charge during the day, discharge in the evening.
+    """
+    return np.where(
+        (charge_start_hour <= hour) & (hour < discharge_start_hour), charge_action,
+        np.where((discharge_start_hour <= hour) & (hour < discharge_end_hour), discharge_action, 0.0)
+    )
+
+class VectorizedRBC:
+    """
+    The SimpleRBC time-of-day rule evaluated for all buildings at once.
+    Thresholds and action magnitudes can be scalars or one value per building.
+    """
+    def __init__(self, n_buildings, hour_index=2, charge_start_hour=7, discharge_start_hour=16, discharge_end_hour=20,
+                 charge_action=1.0, discharge_action=-1.0):
+        self.hour_index = hour_index
+        shape = (n_buildings,)
+        self.charge_start_hour = np.broadcast_to(np.asarray(charge_start_hour, dtype=float), shape)
+        self.discharge_start_hour = np.broadcast_to(np.asarray(discharge_start_hour, dtype=float), shape)
+        self.discharge_end_hour = np.broadcast_to(np.asarray(discharge_end_hour, dtype=float), shape)
+        self.charge_action = np.broadcast_to(np.asarray(charge_action, dtype=float), shape)
+        self.discharge_action = np.broadcast_to(np.asarray(discharge_action, dtype=float), shape)
+
+        # Standard actions: [cooling, dhw, electrical], only the electrical column is ever written
+        self._actions = np.zeros((n_buildings, 3))
+
+    def predict(self, observations):
+        """
+        Returns the (n_buildings, 3) standardized action matrix.
+
+        Args:
+            observations (np.array or list): An (n_buildings, n_observations) matrix, or the
+                per-building observation lists returned by the environment (these may differ
+                in length between buildings, the hour is at the same index in all of them).
+
+        Returns:
+            np.array: The action matrix. It is reused on the next call.
+        """
+        if isinstance(observations, np.ndarray):
+            hour = observations[:, self.hour_index]
+        else:
+            hour = np.array([obs[self.hour_index] for obs in observations], dtype=float)
+
+        self._actions[:, 2] = rbc_electrical_action(
+            hour, self.charge_start_hour, self.discharge_start_hour, self.discharge_end_hour,
+            self.charge_action, self.discharge_action
+        )
+        return self._actions
+
+def make_rbc(env):
+    """
+    Creates a VectorizedRBC for the environment's buildings using the RBC settings in config.
+    """
+    return VectorizedRBC(
+        len(env.buildings),
+        hour_index=env.observation_names[0].index('hour'),
+        charge_start_hour=config.RBC_CHARGE_START_HOUR,
+        discharge_start_hour=config.RBC_DISCHARGE_START_HOUR,
+        discharge_end_hour=config.RBC_DISCHARGE_END_HOUR,
+        charge_action=config.RBC_CHARGE_ACTION,
+        discharge_action=config.RBC_DISCHARGE_ACTION
+    )
+
+def run_rbc_simulation(schema_path, episode_time_steps: int, central_agent: bool, simulation_start_time_step: int = None, simulation_end_time_step: int = None):
     """
     Runs a CityLearn simulation with the given parameters using an RBC agent.
+    The simulation period defaults to the schema's.
     """
     output_dir = Path(config.BASE_OUTPUT_DIR) # Base output directory
     kpi_output_dir = Path(config.KPI_OUTPUT_DIR)
@@ -47,11 +117,14 @@ def run_rbc_simulation(schema_path, episode_time_steps: int, central_agent: bool
                 shutil.rmtree(item)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    env = CityLearnEnv(
+    env = make_env(
         schema_path,
         central_agent=central_agent,
         episode_time_steps=episode_time_steps,
-        render_mode='end',
+        simulation_start_time_step=simulation_start_time_step,
+        simulation_end_time_step=simulation_end_time_step,
+        **get_reward_settings(schema_path=schema_path), # Recorded trajectories carry the rewards PPO is trained on
+        render_mode='end' if config.RENDER_EXPORTS else 'none',
         render_directory=Path.cwd() / output_dir, # Files go directly here
         render_session_name='' # Empty string = no subdirectory
     )
@@ -59,24 +132,58 @@ def run_rbc_simulation(schema_path, episode_time_steps: int, central_agent: bool
     # Initialize the translation layer
     translator = TranslationLayer(env.buildings)
 
-    # Initialize agents
-    agents = [SimpleRBC(building.action_space) for building in env.buildings]
+    # Initialize the district-wide agent
+    agent = make_rbc(env)
+
+    # Running KPIs, updated after every step
+    accumulator = make_kpi_accumulator(kpi_output_dir) if config.KPI_STREAMING else None
+
+    # (observation, action, reward) trajectories, e.g. for behavior cloning
+    recorder = None
+    if config.RECORD_TRAJECTORIES:
+        from trajectory_recorder import make_trajectory_recorder
+        recorder = make_trajectory_recorder(
+            env, schema_path, episode_time_steps, simulation_start_time_step, simulation_end_time_step
+        )
+
+    # Per-phase wall time of the simulation loop
+    profiler = make_profiler('rbc_simulation')
+    profiler.start()
+
+    with profiler.phase('reset'):
+        observations, _ = env.reset()
 
-    observations, _ = env.reset()
     while not env.terminated:
-        # Get standardized actions from agents
-        standard_actions = [agent.predict(obs) for agent, obs in zip(agents, observations)]
+        # Get standardized actions for all buildings
+        with profiler.phase('predict'):
+            standard_actions = agent.predict(observations)
         
         # Translate actions for the environment
-        env_actions = translator.translate_actions(standard_actions)
+        with profiler.phase('translate'):
+            env_actions = translator.translate_batch(standard_actions)
         
-        observations, _, _, _, _ = env.step(env_actions)
+        with profiler.phase('env_step'):
+            next_observations, rewards, _, _, _ = env.step(env_actions)
+
+        if recorder is not None:
+            with profiler.phase('record'):
+                recorder.record(observations, standard_actions, rewards)
+        observations = next_observations
+
+        if accumulator is not None:
+            with profiler.phase('kpi_update'):
+                accumulator.update(env)
+
+        profiler.step()
     
-    env.close() # Ensure environment is closed to finalize output files
+    with profiler.phase('close_and_render'):
+        env.close() # Ensure environment is closed to finalize output files
+    if recorder is not None:
+        recorder.close()
 
     # CityLearn might create a timestamp subdirectory even with render_session_name=''
     # So we need to move files from any subdirectories to the main output_dir
-    if output_dir.exists():
+    if config.RENDER_EXPORTS and output_dir.exists():
         for subdir in output_dir.iterdir():
             if subdir.is_dir():
                 # Found a subdirectory (likely timestamp-based)
@@ -94,6 +201,14 @@ def run_rbc_simulation(schema_path, episode_time_steps: int, central_agent: bool
 
     # Files are already in the right location, no need to copy
 
-    # Process the simulation output to calculate and save custom KPIs
-    from kpi_calculator import calculate_and_save_kpis
-    calculate_and_save_kpis(output_dir, kpi_output_dir, env)
\ No newline at end of file
+    with profiler.phase('kpi_postprocess'):
+        if accumulator is not None:
+            summary = accumulator.finish()
+        else:
+            # Process the simulation output to calculate and save custom KPIs
+            from kpi_calculator import calculate_and_save_kpis
+            summary = calculate_and_save_kpis(output_dir, kpi_output_dir, env)
+
+    profiler.stop()
+    profiler.save(kpi_output_dir)
+    return summary
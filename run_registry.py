@@ -0,0 +1,351 @@
+"""
+Persistent index of every run, so that runs can be compared after their output directories
+have been overwritten by the next one.
+
+Each experiment is registered in a SQLite database (config.RUN_REGISTRY_PATH) with:
+- its settings (every config value) and the commit it ran on;
+- its summary KPIs, one row per KPI in run_kpis, so comparisons are plain SQL queries;
+- the location of its KPI files, by default a copy under config.RUN_ARCHIVE_DIR/<run_id>, since
+  config.KPI_OUTPUT_DIR is rewritten by every run.
+
+The comparison page (gui/runs.html, see write_comparison_page) is built from the index alone:
+the summary KPIs of every run are embedded in the page, no KPI file is read.
+
+    python run_registry.py                  # list the runs and write the comparison page
+    python run_registry.py --compare ID ID  # summary KPIs of runs side by side
+"""
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import uuid
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created TEXT NOT NULL,
+    agent_type TEXT,
+    label TEXT,
+    schema_path TEXT,
+    reward_function TEXT,
+    episode_time_steps INTEGER,
+    commit_hash TEXT,
+    kpi_dir TEXT,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS run_kpis (
+    run_id TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created);
+CREATE INDEX IF NOT EXISTS run_kpis_name ON run_kpis(name);
+"""
+
+# Columns of the runs table returned by list_runs, before the KPIs
+RUN_COLUMNS = ['run_id', 'created', 'agent_type', 'label', 'schema_path', 'reward_function', 'episode_time_steps', 'commit_hash', 'kpi_dir']
+
+def connect(registry_path=None):
+    """
+    Opens the registry database, creating it if needed.
+    Sweep workers register concurrently, hence the write-ahead log and the lock timeout.
+    """
+    registry_path = Path(config.RUN_REGISTRY_PATH if registry_path is None else registry_path)
+    registry_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(registry_path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA foreign_keys=ON')
+    connection.executescript(SCHEMA)
+    return connection
+
+def config_snapshot():
+    """
+    Returns every config value, JSON-serializable.
+    """
+    return {
+        name: json.loads(json.dumps(getattr(config, name), default=str))
+        for name in dir(config) if name.isupper()
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- Registration ---
+
+def register_run(summary: dict, agent_type: str, schema_path, kpi_output_dir=None, label: str = None, archive: bool = None,
+                 registry_path=None):
+    """
+    Adds a finished run to the registry.
+
+    Args:
+        summary (dict): The run's summary KPIs.
+        agent_type (str): The agent that ran ('RBC' or 'PPO'), which may differ from config.AGENT_TYPE.
+        schema_path (str): The schema it ran on, which may differ from config.SCHEMA_PATH.
+        kpi_output_dir (str, optional): Directory of its KPI files, defaults to config.KPI_OUTPUT_DIR.
+        label (str, optional): Free-form name of the run, defaults to config.RUN_LABEL.
+        archive (bool, optional): Copy the KPI files to config.RUN_ARCHIVE_DIR/<run_id>, defaults to config.RUN_ARCHIVE.
+        registry_path (str, optional): Defaults to config.RUN_REGISTRY_PATH.
+
+    Returns:
+        str: The run id.
+    """
+    kpi_output_dir = Path(config.KPI_OUTPUT_DIR if kpi_output_dir is None else kpi_output_dir)
+    label = config.RUN_LABEL if label is None else label
+    archive = config.RUN_ARCHIVE if archive is None else archive
+
+    created = datetime.now()
+    run_id = f"{created:%Y%m%d_%H%M%S}_{agent_type.lower()}_{uuid.uuid4().hex[:6]}"
+
+    kpi_dir = None
+    if kpi_output_dir.exists():
+        kpi_dir = kpi_output_dir
+        if archive:
+            kpi_dir = Path(config.RUN_ARCHIVE_DIR) / run_id
+            shutil.copytree(kpi_output_dir, kpi_dir)
+        kpi_dir = str(kpi_dir.resolve())
+
+    kpis = [(run_id, name, None if value is None else float(value)) for name, value in summary.items()]
+    settings = {**config_snapshot(), 'AGENT_TYPE': agent_type, 'SCHEMA_PATH': str(schema_path)}
+    with closing(connect(registry_path)) as connection, connection:
+        connection.execute(
+            'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_id, created.isoformat(timespec='seconds'), agent_type, label, str(schema_path),
+             config.REWARD_FUNCTION, config.EPISODE_TIME_STEPS, _git_commit(), kpi_dir, json.dumps(settings))
+        )
+        connection.executemany('INSERT INTO run_kpis VALUES (?, ?, ?)', kpis)
+
+    print(f"Run registered as {run_id}")
+    return run_id
+
+def delete_run(run_id: str, registry_path=None):
+    """
+    Removes a run from the registry, and its KPI files if they were archived.
+    """
+    with closing(connect(registry_path)) as connection, connection:
+        row = connection.execute('SELECT kpi_dir FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown run '{run_id}'")
+        connection.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+
+    archive_dir = Path(config.RUN_ARCHIVE_DIR).resolve()
+    if row[0] is not None and Path(row[0]).parent == archive_dir:
+        shutil.rmtree(row[0], ignore_errors=True)
+
+# --- Queries ---
+
+def list_runs(agent_type: str = None, label: str = None, limit: int = None, registry_path=None):
+    """
+    Returns the registered runs, newest first, with one column per summary KPI.
+
+    Args:
+        agent_type (str, optional): Only runs of this agent type.
+        label (str, optional): Only runs with this label (SQL LIKE pattern, e.g. 'sweep%').
+        limit (int, optional): Only the newest limit runs.
+
+    Returns:
+        pd.DataFrame: One row per run, indexed by run_id.
+    """
+    where, parameters = [], []
+    if agent_type is not None:
+        where.append('agent_type = ?')
+        parameters.append(agent_type)
+    if label is not None:
+        where.append('label LIKE ?')
+        parameters.append(label)
+    query = f"SELECT {', '.join(RUN_COLUMNS)} FROM runs"
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += ' ORDER BY created DESC, run_id DESC'
+    if limit:
+        query += f' LIMIT {int(limit)}'
+
+    with closing(connect(registry_path)) as connection:
+        runs = pd.read_sql_query(query, connection, params=parameters).set_index('run_id')
+        kpis = pd.read_sql_query(
+            f"SELECT run_id, name, value FROM run_kpis WHERE run_id IN (SELECT run_id FROM ({query}))",
+            connection, params=parameters
+        )
+
+    if not kpis.empty:
+        kpis = kpis.pivot(index='run_id', columns='name', values='value')
+        runs = runs.join(kpis)
+    return runs
+
+def get_settings(run_id: str, registry_path=None):
+    """
+    Returns the config values a run was made with.
+    """
+    with closing(connect(registry_path)) as connection:
+        row = connection.execute('SELECT settings FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"Unknown run '{run_id}'")
+    return json.loads(row[0])
+
+def compare_runs(run_ids, registry_path=None):
+    """
+    Returns the summary KPIs of the given runs side by side (one column per run, in the given
+    order), followed by the config values that differ between them.
+    """
+    run_ids = list(run_ids)
+    placeholders = ', '.join('?'*len(run_ids))
+    with closing(connect(registry_path)) as connection:
+        kpis = pd.read_sql_query(
+            f"SELECT run_id, name, value FROM run_kpis WHERE run_id IN ({placeholders})", connection, params=run_ids
+        )
+    unknown = [run_id for run_id in run_ids if run_id not in set(kpis['run_id'])]
+    if unknown:
+        raise ValueError(f"Unknown run(s) {', '.join(unknown)}")
+    comparison = kpis.pivot(index='name', columns='run_id', values='value')[run_ids]
+
+    settings = pd.DataFrame({run_id: get_settings(run_id, registry_path) for run_id in run_ids}).astype(str)
+    settings = settings[settings.nunique(axis=1) > 1]
+    return pd.concat([comparison.astype(object), settings])
+
+# --- Comparison page ---
+
+PAGE_TEMPLATE = """<html>
+<head>
+<meta charset="utf-8">
+<title>Run Comparison</title>
+<script src="plots/plotly.min.js"></script>
+<style>
+body { font-family: sans-serif; margin: 20px; }
+table { border-collapse: collapse; font-size: 13px; }
+th, td { border: 1px solid #ccc; padding: 3px 6px; text-align: right; }
+th { background: paleturquoise; }
+td.text { text-align: left; }
+#filter { margin-bottom: 8px; width: 300px; }
+</style>
+</head>
+<body>
+<h1>Run Comparison</h1>
+<p>Select runs to compare their summary KPIs. Bars are relative to the first selected run (= 100).
+<a href="index.html">Latest run plots</a></p>
+<input id="filter" placeholder="Filter by id, agent or label" oninput="renderTable()">
+<div id="chart" style="height: 500px;"></div>
+<h2>Selected runs</h2>
+<div id="comparison"></div>
+<h2>All runs</h2>
+<div id="runs"></div>
+<script>
+const DATA = __DATA__;
+const selected = new Set(DATA.runs.slice(0, 2).map(run => run.run_id));
+
+function format(value) {
+  return value === null || value === undefined ? '' : (typeof value === 'number' ? value.toPrecision(6) : value);
+}
+
+function renderTable() {
+  const filter = document.getElementById('filter').value.toLowerCase();
+  let html = '<table><tr><th></th>' + DATA.columns.concat(DATA.kpis).map(c => `<th>${c}</th>`).join('') + '</tr>';
+  for (const run of DATA.runs) {
+    if (filter && !DATA.columns.some(c => String(run[c]).toLowerCase().includes(filter))) continue;
+    const checked = selected.has(run.run_id) ? 'checked' : '';
+    html += `<tr><td><input type="checkbox" ${checked} onchange="toggle('${run.run_id}', this.checked)"></td>`;
+    html += DATA.columns.map(c => `<td class="text">${format(run[c])}</td>`).join('');
+    html += DATA.kpis.map(k => `<td>${format(run.kpis[k])}</td>`).join('') + '</tr>';
+  }
+  document.getElementById('runs').innerHTML = html + '</table>';
+}
+
+function toggle(runId, checked) {
+  if (checked) { selected.add(runId); } else { selected.delete(runId); }
+  renderComparison();
+}
+
+function renderComparison() {
+  const runs = DATA.runs.filter(run => selected.has(run.run_id));
+  let html = '<table><tr><th>KPI</th>' + runs.map(run => `<th>${run.run_id}<br>${format(run.label)}</th>`).join('') + '</tr>';
+  for (const k of DATA.kpis) {
+    html += `<tr><td class="text">${k}</td>` + runs.map(run => `<td>${format(run.kpis[k])}</td>`).join('') + '</tr>';
+  }
+  document.getElementById('comparison').innerHTML = html + '</table>';
+
+  const baseline = runs.length ? runs[0].kpis : {};
+  const traces = runs.map(run => ({
+    type: 'bar',
+    name: run.label ? `${run.run_id} (${run.label})` : run.run_id,
+    x: DATA.kpis,
+    y: DATA.kpis.map(k => baseline[k] ? 100*run.kpis[k]/baseline[k] : null),
+    customdata: DATA.kpis.map(k => run.kpis[k]),
+    hovertemplate: '%{x}: %{customdata:.6g} (%{y:.1f})',
+  }));
+  Plotly.react('chart', traces, {barmode: 'group', yaxis: {title: 'relative to first selected run'}});
+}
+
+renderTable();
+renderComparison();
+</script>
+</body>
+</html>
+"""
+
+def write_comparison_page(output_dir=None, registry_path=None):
+    """
+    Writes runs.html to the GUI directory: every registered run with its summary KPIs, and a
+    side-by-side chart and table of the selected runs.
+
+    Args:
+        output_dir (str, optional): Defaults to config.PLOT_OUTPUT_DIR.
+        registry_path (str, optional): Defaults to config.RUN_REGISTRY_PATH.
+
+    Returns:
+        Path: The page's path.
+    """
+    output_dir = Path(config.PLOT_OUTPUT_DIR if output_dir is None else output_dir)
+    plots_dir = output_dir / 'plots'
+    plots_dir.mkdir(parents=True, exist_ok=True)
+    if not (plots_dir / 'plotly.min.js').exists():
+        from plot_kpis import write_plotlyjs
+        write_plotlyjs(plots_dir)
+
+    runs = list_runs(registry_path=registry_path)
+    kpi_names = [column for column in runs.columns if column not in RUN_COLUMNS]
+    columns = [column for column in RUN_COLUMNS if column != 'kpi_dir']
+    records = runs.reset_index()
+    records = records.astype(object).where(records.notna(), None).to_dict('records')
+    data = {
+        'columns': columns,
+        'kpis': kpi_names,
+        'runs': [{**{column: row[column] for column in columns}, 'kpis': {name: row[name] for name in kpi_names}} for row in records],
+    }
+
+    # Labels are free text: a '</script>' in them must not end the page's script
+    data_json = json.dumps(data, default=str).replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+    path = output_dir / 'runs.html'
+    tmp_path = Path(f'{path}.{os.getpid()}.tmp')
+    tmp_path.write_text(PAGE_TEMPLATE.replace('__DATA__', data_json), encoding='utf-8')
+    os.replace(tmp_path, path)
+    print(f"Run comparison page with {len(runs)} runs written to '{path}'")
+    return path
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='List and compare the registered runs.')
+    parser.add_argument('--compare', nargs='+', default=None, metavar='RUN_ID', help='Print the KPIs of these runs side by side')
+    parser.add_argument('--agent', default=None, help='Only list runs of this agent type')
+    parser.add_argument('--label', default=None, help='Only list runs with this label (SQL LIKE pattern)')
+    parser.add_argument('--limit', type=int, default=20, help='Number of runs listed (0 = all)')
+    parser.add_argument('--delete', nargs='+', default=None, metavar='RUN_ID', help='Remove these runs from the registry')
+    args = parser.parse_args()
+
+    if args.delete:
+        for run_id in args.delete:
+            delete_run(run_id)
+    if args.compare:
+        print(compare_runs(args.compare).to_string())
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', 12):
+            print(list_runs(args.agent, args.label, args.limit or None).to_string())
+    write_comparison_page()
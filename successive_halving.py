@@ -0,0 +1,171 @@
+"""
+Successive halving over PPO configurations: many configurations are trained with a small budget,
+evaluated, and only the best 1/eta of them are trained further, with an eta times larger budget,
+until the survivors reach config.PPO_TRAINING_TIMESTEPS:
+
+    python successive_halving.py grid.json --samples 27 --eta 3 --workers 8
+
+grid.json maps config names to the values to try, like for sweep.py, e.g.
+    {"PPO_NORMALIZE_REWARD": [true, false], "REWARD_FUNCTION": ["cost", "carbon", "peak_penalty"]}
+
+Every configuration keeps its run directory across rungs, so a promoted configuration resumes
+from the checkpoint of its previous rung instead of training from scratch (the directories are
+cleared before the first rung, which always trains from scratch). After each rung, the
+configurations are evaluated on a short episode (config.HALVING_EVAL_TIME_STEPS) and ranked by a
+summary KPI (config.HALVING_METRIC, lower is better). The configurations of a rung train
+concurrently in worker processes. halving_results.csv has one row per configuration and rung.
+"""
+import argparse
+import json
+import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import config
+from sweep import apply_overrides, expand_grid, run_configuration, sample_grid
+
+def train_and_evaluate(schema_path):
+    """
+    Trains PPO up to config.PPO_TRAINING_TIMESTEPS (resuming from the latest checkpoint) in a
+    worker process and evaluates it on an episode of config.HALVING_EVAL_TIME_STEPS.
+
+    Returns:
+        dict: The timesteps trained so far and the evaluation's summary KPIs.
+    """
+    import torch
+    torch.set_num_threads(1) # The workers already use every core
+    from experiment import evaluate_ppo
+    from ppo_agent import run_ppo_training
+
+    agent = run_ppo_training(schema_path)
+    overrides = {} if config.HALVING_EVAL_TIME_STEPS is None else {'EPISODE_TIME_STEPS': config.HALVING_EVAL_TIME_STEPS}
+    previous = apply_overrides(overrides)
+    try:
+        summary = evaluate_ppo(schema_path)
+    finally:
+        apply_overrides(previous)
+    return {'timesteps': agent.model.num_timesteps, **summary}
+
+def rank_configurations(scores: dict):
+    """
+    Returns the configuration indices of {index: score} from best (lowest) to worst, NaN last.
+    """
+    return sorted(scores, key=lambda i: (np.isnan(scores[i]), scores[i]))
+
+def rung_overrides(overrides: dict, budget: int, rung: int):
+    """
+    Returns the config overrides of a configuration trained up to budget timesteps in a rung.
+    """
+    return {
+        **overrides,
+        'AGENT_TYPE': 'PPO',
+        'PPO_TRAINING_TIMESTEPS': int(budget),
+        'PPO_RESUME': rung > 0, # Continue from the previous rung's checkpoint
+        'RUN_REGISTRY': False, # Rung evaluations are intermediate results
+    }
+
+def run_successive_halving(configurations, schema_path=None, min_timesteps: int = None, max_timesteps: int = None, eta: int = None,
+                           metric: str = None, output_dir=None, max_workers: int = None):
+    """
+    Runs successive halving over the configurations.
+
+    Args:
+        configurations (list of dict): Config overrides, one dict per configuration.
+        schema_path (str, optional): Defaults to config.SCHEMA_PATH.
+        min_timesteps (int, optional): Budget of the first rung, defaults to config.HALVING_MIN_TIMESTEPS.
+        max_timesteps (int, optional): Budget of the last rung, defaults to config.PPO_TRAINING_TIMESTEPS.
+        eta (int, optional): Reduction factor, defaults to config.HALVING_ETA.
+        metric (str, optional): Summary KPI to minimize, defaults to config.HALVING_METRIC.
+        output_dir (str, optional): Defaults to config.HALVING_OUTPUT_DIR.
+        max_workers (int, optional): Number of worker processes, defaults to config.HALVING_MAX_WORKERS.
+
+    Returns:
+        pd.DataFrame: One row per configuration and rung with its overrides, budget, timesteps,
+            summary KPIs, error (if any) and whether it was promoted.
+    """
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+    min_timesteps = config.HALVING_MIN_TIMESTEPS if min_timesteps is None else min_timesteps
+    max_timesteps = config.PPO_TRAINING_TIMESTEPS if max_timesteps is None else max_timesteps
+    eta = config.HALVING_ETA if eta is None else eta
+    metric = config.HALVING_METRIC if metric is None else metric
+    output_dir = Path(config.HALVING_OUTPUT_DIR if output_dir is None else output_dir)
+    max_workers = config.HALVING_MAX_WORKERS if max_workers is None else max_workers
+    if eta < 2:
+        raise ValueError(f"eta must be at least 2, got {eta}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Checkpoints of an earlier search must not be resumed
+    for i in range(len(configurations)):
+        shutil.rmtree(output_dir / f'config_{i:04d}', ignore_errors=True)
+
+    rows = []
+    survivors = list(range(len(configurations)))
+    budget = min(min_timesteps, max_timesteps)
+    rung = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            print(f"Rung {rung}: training {len(survivors)} configuration(s) up to {budget} timesteps")
+            futures = {
+                executor.submit(
+                    run_configuration, output_dir / f'config_{i:04d}',
+                    {**rung_overrides(configurations[i], budget, rung), 'SCHEMA_PATH': schema_path}, train_and_evaluate
+                ): i
+                for i in survivors
+            }
+            scores, rung_rows = {}, {}
+            for future in as_completed(futures):
+                i = futures[future]
+                row = rung_rows[i] = {'config_id': f'config_{i:04d}', 'rung': rung, 'budget': budget, **configurations[i]}
+                try:
+                    row.update(future.result())
+                    row['error'] = None
+                    scores[i] = row[metric]
+                    print(f"Rung {rung}: config_{i:04d} {metric} = {row[metric]:.4f} ({len(scores)}/{len(survivors)})")
+                except Exception:
+                    row['error'] = traceback.format_exc(limit=1).strip().splitlines()[-1]
+                    print(f"Rung {rung}: config_{i:04d} failed: {row['error']}")
+                rows.append(row)
+
+            if not scores:
+                raise RuntimeError(f"Every configuration of rung {rung} failed, see the errors above.")
+            if budget >= max_timesteps:
+                best = rank_configurations(scores)[0]
+                break
+
+            # Keep the best 1/eta; the last survivor goes straight to the full budget
+            survivors = rank_configurations(scores)[:max(len(scores)//eta, 1)]
+            for i, row in rung_rows.items():
+                row['promoted'] = i in survivors
+            budget = max_timesteps if len(survivors) == 1 else min(budget*eta, max_timesteps)
+            rung += 1
+            pd.DataFrame(rows).to_csv(output_dir / 'halving_results.csv', index=False)
+
+    results = pd.DataFrame(rows).sort_values(['rung', metric]).reset_index(drop=True)
+    results.to_csv(output_dir / 'halving_results.csv', index=False)
+
+    trained = results.groupby('config_id')['timesteps'].max().sum()
+    print(f"Successive halving finished. Best: config_{best:04d} with {metric} = {scores[best]:.4f} ({json.dumps(configurations[best])})")
+    print(f"{int(trained)} timesteps trained in total, {len(configurations)*max_timesteps} for a full sweep. "
+          f"Results saved to {output_dir / 'halving_results.csv'}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Successive halving over a grid of PPO config overrides.')
+    parser.add_argument('grid', help='JSON file mapping config names to lists of values')
+    parser.add_argument('--samples', type=int, default=None, help='Randomly sample this many combinations instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for --samples')
+    parser.add_argument('--min-timesteps', type=int, default=None, help='Defaults to config.HALVING_MIN_TIMESTEPS')
+    parser.add_argument('--max-timesteps', type=int, default=None, help='Defaults to config.PPO_TRAINING_TIMESTEPS')
+    parser.add_argument('--eta', type=int, default=None, help='Defaults to config.HALVING_ETA')
+    parser.add_argument('--metric', default=None, help='Defaults to config.HALVING_METRIC')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--output', default=None, help='Defaults to config.HALVING_OUTPUT_DIR')
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    configurations = expand_grid(grid) if args.samples is None else sample_grid(grid, args.samples, args.seed)
+    run_successive_halving(configurations, min_timesteps=args.min_timesteps, max_timesteps=args.max_timesteps, eta=args.eta,
+                           metric=args.metric, output_dir=args.output, max_workers=args.workers)
@@ -0,0 +1,135 @@
+"""
+Runs a grid (or random sample) of config overrides concurrently in a process pool.
+
+Every run gets its own directory with its CityLearn output, KPIs and model, and the
+summary KPIs of all runs are collected into one results table:
+
+    python sweep.py grid.json --samples 20 --workers 8
+
+where grid.json maps config names to the values to try, e.g.
+    {"AGENT_TYPE": ["RBC"], "RBC_CHARGE_START_HOUR": [6, 7, 8], "EPISODE_TIME_STEPS": [1000, 8760]}
+SCHEMA_PATH may be a schema.json path or a CityLearn dataset name.
+"""
+import argparse
+import itertools
+import json
+import random
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+import config
+
+def expand_grid(grid: dict):
+    """
+    Returns every combination of the grid values as a list of override dicts.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+def sample_grid(grid: dict, num_samples: int, seed: int = 0):
+    """
+    Returns num_samples distinct combinations drawn at random from the grid.
+    """
+    combinations = expand_grid(grid)
+    return random.Random(seed).sample(combinations, min(num_samples, len(combinations)))
+
+def apply_overrides(overrides: dict):
+    """
+    Sets the given config values and returns the previous ones so they can be restored.
+    """
+    unknown = [name for name in overrides if not hasattr(config, name)]
+    if unknown:
+        raise KeyError(f"Unknown config parameter(s): {', '.join(unknown)}")
+
+    previous = {name: getattr(config, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return previous
+
+def run_configuration(run_dir, overrides: dict, function=None):
+    """
+    Runs one experiment with the given config overrides and isolated output directories.
+    Executed in a worker process; config is restored afterwards since workers are reused.
+
+    Args:
+        function (callable, optional): Called with the schema path, defaults to experiment.run_experiment.
+
+    Returns:
+        dict: The run's summary KPIs.
+    """
+    if function is None:
+        from experiment import run_experiment as function
+
+    run_dir = Path(run_dir).resolve()
+    run_dir.mkdir(parents=True, exist_ok=True)
+    with open(run_dir / 'overrides.json', 'w') as f:
+        json.dump(overrides, f, indent=2)
+
+    isolated = {
+        'BASE_OUTPUT_DIR': str(run_dir / 'citylearn_output'),
+        'KPI_OUTPUT_DIR': str(run_dir / 'calculated_kpis'),
+        'PPO_MODEL_PATH': str(run_dir / 'ppo_model.zip'),
+        'PPO_CHECKPOINT_DIR': str(run_dir / 'ppo_checkpoints'),
+        'TRAJECTORY_DIR': str(run_dir / 'trajectories'),
+        'RUN_LABEL': f'{run_dir.parent.name}/{run_dir.name}',
+        'RUN_ARCHIVE': False, # The run directory is kept
+    }
+    previous = apply_overrides({**isolated, **overrides})
+    try:
+        return function(config.SCHEMA_PATH)
+    finally:
+        apply_overrides(previous)
+
+def run_sweep(configurations, output_dir=None, max_workers=None):
+    """
+    Runs the configurations concurrently and aggregates their summary KPIs.
+
+    Args:
+        configurations (list of dict): Config overrides, one dict per run.
+        output_dir (str, optional): Sweep directory, defaults to config.SWEEP_OUTPUT_DIR.
+        max_workers (int, optional): Number of worker processes, defaults to config.SWEEP_MAX_WORKERS.
+
+    Returns:
+        pd.DataFrame: One row per run with its overrides, summary KPIs and error (if any).
+    """
+    output_dir = Path(config.SWEEP_OUTPUT_DIR if output_dir is None else output_dir)
+    max_workers = config.SWEEP_MAX_WORKERS if max_workers is None else max_workers
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_configuration, output_dir / f'run_{i:04d}', overrides): (i, overrides)
+            for i, overrides in enumerate(configurations)
+        }
+        for future in as_completed(futures):
+            i, overrides = futures[future]
+            row = {'run_id': f'run_{i:04d}', **overrides}
+            try:
+                row.update(future.result())
+                row['error'] = None
+                print(f"Sweep run {row['run_id']} finished ({len(rows) + 1}/{len(configurations)})")
+            except Exception:
+                row['error'] = traceback.format_exc(limit=1).strip().splitlines()[-1]
+                print(f"Sweep run {row['run_id']} failed: {row['error']}")
+            rows.append(row)
+
+    results = pd.DataFrame(rows).sort_values('run_id').reset_index(drop=True)
+    results.to_csv(output_dir / 'sweep_results.csv', index=False)
+    print(f"Sweep finished. Results saved to {output_dir / 'sweep_results.csv'}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a grid of config overrides in parallel.')
+    parser.add_argument('grid', help='JSON file mapping config names to lists of values')
+    parser.add_argument('--samples', type=int, default=None, help='Randomly sample this many combinations instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for --samples')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--output', default=None, help='Sweep output directory')
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    configurations = expand_grid(grid) if args.samples is None else sample_grid(grid, args.samples, args.seed)
+    run_sweep(configurations, output_dir=args.output, max_workers=args.workers)
@@ -0,0 +1,330 @@
+"""
+What-if electricity tariffs and carbon intensities over the results of a finished simulation.
+
+kpi_calculator prices the grid consumption at the static ELECTRICITY_PRICE; comparing another
+tariff would mean running the simulation again, although the controller's consumption does not
+depend on it. This module prices the (T steps, N buildings) grid consumption of a saved run under
+M tariffs at once:
+
+    energy     import_price (M, T) @ imports (T, N) + export_price (M, T) @ exports (T, N)
+    tiers      block adders on the imported energy of every billing period, (M, K, P, N)
+    demand     demand_charge (M,) * peak import power of every billing period, (U, P, N) for
+               the U distinct sets of demand hours
+
+and the emissions of S carbon intensity series with one (S, T) @ (T, N) product, or an einsum
+over (S, T, N) when the intensity differs per building (the schema's).
+
+A tariff file (config.TARIFF_FILE) is a JSON object with 'tariffs' and 'carbon_intensities':
+
+    {
+        "tariffs": [
+            {"name": "flat", "energy_price": 0.25},
+            {"name": "tou", "energy_price": [0.2, ..., 0.2], "export_price": 0.05},
+            {"name": "tiered", "energy_price": 0.2, "tiers": [[500, 0.05], [1000, 0.1]]},
+            {"name": "demand", "energy_price": 0.15, "demand_charge": 12.0, "demand_hours": [16, 17, 18, 19, 20]},
+            {"name": "spot", "energy_price": {"file": "pricing.csv", "column": "electricity_pricing"}}
+        ],
+        "carbon_intensities": [
+            {"name": "grid_2030", "intensity": 0.2}
+        ]
+    }
+
+Prices and intensities are a scalar, 24 hourly values (the hour the time step starts in), one
+value per time step of the year, or a column of a CSV file (relative to the tariff file). The
+export price defaults to the energy price (net metering, like kpi_calculator). Tiers are
+[threshold_kWh, adder] pairs: the adder applies to the energy imported in a billing period above
+the threshold. The demand charge is per kW of the highest import in a billing period, within
+demand_hours if given. The schema's building pricing files are added as 'schema:<file>' tariffs and
+its carbon intensity series as 'schema'; 'baseline' is the static ELECTRICITY_PRICE, so its cost
+is the run's total_cost.
+"""
+import json
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import config
+
+BILLING_PERIODS = ('month', 'episode')
+
+class Tariff:
+    """
+    Definition of one electricity tariff, see the module docstring for the value formats.
+    """
+    def __init__(self, name: str, energy_price=0.0, export_price=None, tiers=None, demand_charge: float = 0.0,
+                 demand_hours=None, base_dir=None):
+        """
+        Args:
+            name (str): Name of the tariff in the results.
+            energy_price: Import price per kWh.
+            export_price (optional): Price per kWh of the energy fed into the grid, defaults to energy_price.
+            tiers (list, optional): [threshold_kWh, adder] pairs per billing period.
+            demand_charge (float): Price per kW of the billing period's peak import.
+            demand_hours (list of int, optional): Hours of the day the peak is measured in, defaults to all.
+            base_dir (str, optional): Directory CSV files are relative to.
+        """
+        self.name = name
+        self.energy_price = energy_price
+        self.export_price = energy_price if export_price is None else export_price
+        self.tiers = sorted((float(threshold), float(adder)) for threshold, adder in (tiers or []))
+        self.demand_charge = float(demand_charge)
+        self.demand_hours = None if demand_hours is None else [int(hour) for hour in demand_hours]
+        self.base_dir = base_dir
+
+    @classmethod
+    def from_dict(cls, definition: dict, base_dir=None):
+        unknown = set(definition) - {'name', 'energy_price', 'export_price', 'tiers', 'demand_charge', 'demand_hours'}
+        if 'name' not in definition or unknown:
+            raise ValueError(f"Invalid tariff {definition}: needs a name, unknown keys: {', '.join(sorted(unknown)) or 'none'}")
+        return cls(**definition, base_dir=base_dir)
+
+def time_series(value, time_steps, seconds_per_time_step: float = 3600.0, base_dir=None):
+    """
+    Expands a price or intensity definition to one value per time step.
+
+    Args:
+        value: A scalar, 24 hourly values, one value per time step of the year, or
+            {'file': path, 'column': name} (a CSV file with one row per time step of the year).
+        time_steps (np.ndarray): Simulation time steps to return the values of.
+        base_dir (str, optional): Directory a relative file path is resolved in.
+    """
+    from dataset_cache import read_data_file
+
+    if isinstance(value, dict):
+        path = Path(value['file'])
+        path = path if path.is_absolute() or base_dir is None else Path(base_dir)/path
+        value = read_data_file(path)[value.get('column', 'electricity_pricing')].to_numpy()
+    elif np.isscalar(value):
+        return np.full(len(time_steps), float(value))
+
+    values = np.asarray(value, dtype=float)
+    if values.ndim != 1:
+        raise ValueError(f"Expected a scalar or a list of values, got an array of shape {values.shape}")
+    if len(values) == 24:
+        hours = (time_steps*seconds_per_time_step//3600).astype(int) % 24
+        return values[hours]
+    if len(values) <= time_steps.max():
+        raise ValueError(f"{len(values)} values do not cover time step {time_steps.max()}")
+    return values[time_steps]
+
+def billing_periods(time_steps, seconds_per_time_step: float = 3600.0, billing_period: str = None, year: int = 2024):
+    """
+    Returns the index of the first time step of every billing period ('month' or 'episode').
+    """
+    billing_period = config.TARIFF_BILLING_PERIOD if billing_period is None else billing_period
+    if billing_period not in BILLING_PERIODS:
+        raise ValueError(f"Unknown billing period '{billing_period}'. Available: {', '.join(BILLING_PERIODS)}")
+    if billing_period == 'episode':
+        return np.array([0])
+    # Month the time step starts in
+    starts = pd.Timestamp(year=year, month=1, day=1) + pd.to_timedelta(time_steps*seconds_per_time_step, unit='s')
+    months = starts.year.to_numpy()*12 + starts.month.to_numpy()
+    return np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+
+def compile_tariffs(tariffs, time_steps, seconds_per_time_step: float = 3600.0):
+    """
+    Stacks the tariffs into the arrays evaluate_tariffs broadcasts over.
+
+    Returns:
+        dict: import_price and export_price (M, T), tier_thresholds (M, K + 1), tier_adders (M, K),
+            demand_charge (M,), the U distinct demand_masks (U, T) and demand_mask_index (M,),
+            the row of each tariff's demand hours in demand_masks.
+    """
+    hours = (time_steps*seconds_per_time_step//3600).astype(int) % 24
+    num_tiers = max([len(tariff.tiers) for tariff in tariffs] + [0])
+    # Missing thresholds are the largest float, so the blocks above them are empty
+    tier_thresholds = np.full((len(tariffs), num_tiers + 1), np.finfo(float).max)
+    tier_adders = np.zeros((len(tariffs), num_tiers))
+    for i, tariff in enumerate(tariffs):
+        for k, (threshold, adder) in enumerate(tariff.tiers):
+            tier_thresholds[i, k], tier_adders[i, k] = threshold, adder
+    # Distinct demand hours, in order of appearance (None = all hours)
+    demand_hours = list(dict.fromkeys(None if t.demand_hours is None else tuple(sorted(t.demand_hours)) for t in tariffs))
+
+    return {
+        'import_price': np.stack([time_series(t.energy_price, time_steps, seconds_per_time_step, t.base_dir) for t in tariffs]),
+        'export_price': np.stack([time_series(t.export_price, time_steps, seconds_per_time_step, t.base_dir) for t in tariffs]),
+        'tier_thresholds': tier_thresholds,
+        'tier_adders': tier_adders,
+        'demand_charge': np.array([tariff.demand_charge for tariff in tariffs]),
+        'demand_masks': np.stack([np.ones(len(time_steps), dtype=bool) if h is None else np.isin(hours, h) for h in demand_hours]),
+        'demand_mask_index': np.array([
+            demand_hours.index(None if t.demand_hours is None else tuple(sorted(t.demand_hours))) for t in tariffs
+        ]),
+    }
+
+def evaluate_tariffs(consumption, compiled: dict, period_starts, seconds_per_time_step: float = 3600.0):
+    """
+    Prices the grid consumption of N buildings under M compiled tariffs.
+
+    Args:
+        consumption (np.ndarray): (T, N) net grid consumption in kWh, negative when exporting.
+        compiled (dict): Arrays returned by compile_tariffs.
+        period_starts (np.ndarray): First time step index of every billing period, see billing_periods.
+
+    Returns:
+        dict: (M, N) 'energy', 'tiers', 'demand' and 'total' costs.
+    """
+    imports = np.maximum(consumption, 0.0)
+    exports = np.minimum(consumption, 0.0)
+    energy = compiled['import_price'] @ imports + compiled['export_price'] @ exports
+
+    # Imported energy per billing period (P, N), split into the blocks between consecutive thresholds (M, K, P, N)
+    period_imports = np.add.reduceat(imports, period_starts, axis=0)
+    lower = compiled['tier_thresholds'][:, :-1, None, None]
+    upper = compiled['tier_thresholds'][:, 1:, None, None]
+    block_energy = np.clip(period_imports - lower, 0.0, upper - lower)
+    tiers = np.einsum('mk,mkpn->mn', compiled['tier_adders'], block_energy)
+
+    # Peak import power in the demand hours of every billing period (U, P, N), once per distinct
+    # set of demand hours (imports are non-negative, so masked steps count as zero)
+    masked_imports = compiled['demand_masks'][:, :, None]*imports
+    peaks = np.maximum.reduceat(masked_imports, period_starts, axis=1)/(seconds_per_time_step/3600.0)
+    demand = compiled['demand_charge'][:, None]*peaks.sum(axis=1)[compiled['demand_mask_index']]
+
+    return {'energy': energy, 'tiers': tiers, 'demand': demand, 'total': energy + tiers + demand}
+
+def evaluate_carbon(consumption, intensities):
+    """
+    Returns the (S, N) emissions of the (T, N) grid consumption under S carbon intensity series,
+    given as (S, T) or per building as (S, T, N).
+    """
+    if intensities.ndim == 3:
+        return np.einsum('stn,tn->sn', intensities, consumption)
+    return intensities @ consumption
+
+# --- Loading ---
+
+def load_tariff_file(path=None):
+    """
+    Reads the tariffs and carbon intensity definitions of a tariff file (config.TARIFF_FILE by default).
+
+    Returns:
+        tuple: (list of Tariff, list of carbon intensity dicts), empty if path is None and there is no file.
+    """
+    path = config.TARIFF_FILE if path is None else path
+    if path is None or not Path(path).exists():
+        return [], []
+    with open(path) as f:
+        definitions = json.load(f)
+    base_dir = Path(path).parent
+    tariffs = [Tariff.from_dict(definition, base_dir) for definition in definitions.get('tariffs', [])]
+    intensities = [{'base_dir': base_dir, **definition} for definition in definitions.get('carbon_intensities', [])]
+    return tariffs, intensities
+
+def schema_pricing_tariffs(schema_path):
+    """
+    Returns one tariff per distinct pricing file of the schema's buildings ('schema:<file>').
+    """
+    from utils import get_building_names, load_schema
+
+    schema = load_schema(schema_path)
+    root_directory = Path(schema.get('root_directory') or Path(schema_path).parent)
+    files = dict.fromkeys(schema['buildings'][name].get('pricing') for name in get_building_names(schema))
+    return [
+        Tariff(f'schema:{file}', energy_price={'file': str(root_directory/file), 'column': 'electricity_pricing'})
+        for file in files if file is not None
+    ]
+
+def schema_carbon_intensity(schema_path, time_steps):
+    """
+    Returns the (T, N) carbon intensity of the schema's buildings (zero for buildings without one).
+    """
+    from dataset_cache import read_data_file
+    from utils import get_building_names, load_schema
+
+    schema = load_schema(schema_path)
+    root_directory = Path(schema.get('root_directory') or Path(schema_path).parent)
+    columns = []
+    for name in get_building_names(schema):
+        file = schema['buildings'][name].get('carbon_intensity')
+        columns.append(np.zeros(len(time_steps)) if file is None else
+                       read_data_file(root_directory/file)['carbon_intensity'].to_numpy()[time_steps])
+    return np.stack(columns, axis=1)
+
+def load_consumption(kpi_dir=None, seconds_per_time_step: float = 3600.0):
+    """
+    Returns the grid consumption DataFrame of a saved run and its simulation time steps.
+    """
+    from kpi_storage import get_storage
+    from utils import time_steps_from_timestamps
+
+    kpi_dfs, _ = get_storage().load(Path(config.KPI_OUTPUT_DIR if kpi_dir is None else kpi_dir))
+    consumption = kpi_dfs['grid_consumption']
+    return consumption, time_steps_from_timestamps(consumption.index, seconds_per_time_step)
+
+# --- What-if analysis ---
+
+def run_tariff_analysis(kpi_dir=None, tariff_file=None, schema_path=None, billing_period=None, save: bool = True):
+    """
+    Prices a saved run under the baseline, schema and tariff file tariffs and computes its
+    emissions under the schema and tariff file carbon intensities.
+
+    Args:
+        kpi_dir (str, optional): KPI directory of the run, defaults to config.KPI_OUTPUT_DIR.
+        tariff_file (str, optional): Defaults to config.TARIFF_FILE.
+        schema_path (str, optional): Schema the run was simulated with, defaults to config.SCHEMA_PATH.
+        billing_period (str, optional): Defaults to config.TARIFF_BILLING_PERIOD.
+        save (bool): Write tariff_costs.csv and carbon_emissions_whatif.csv to the KPI directory.
+
+    Returns:
+        tuple: (costs, emissions) DataFrames with one row per tariff (series) and one column per
+            building, the total and, for the costs, the energy, tier and demand components.
+    """
+    from kpi_calculator import ELECTRICITY_PRICE
+    from utils import load_schema
+
+    kpi_dir = Path(config.KPI_OUTPUT_DIR if kpi_dir is None else kpi_dir)
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+    seconds_per_time_step = load_schema(schema_path)['seconds_per_time_step']
+    consumption_df, time_steps = load_consumption(kpi_dir, seconds_per_time_step)
+    consumption = consumption_df.to_numpy(dtype=float)
+    file_tariffs, file_intensities = load_tariff_file(tariff_file)
+    tariffs = [Tariff('baseline', ELECTRICITY_PRICE)] + schema_pricing_tariffs(schema_path) + file_tariffs
+
+    compiled = compile_tariffs(tariffs, time_steps, seconds_per_time_step)
+    period_starts = billing_periods(time_steps, seconds_per_time_step, billing_period)
+    schema_intensity = schema_carbon_intensity(schema_path, time_steps)
+    intensities = np.concatenate([
+        schema_intensity[None],
+        *[np.broadcast_to(time_series(d['intensity'], time_steps, seconds_per_time_step, d['base_dir'])[None, :, None],
+                          (1, *schema_intensity.shape)) for d in file_intensities]
+    ])
+
+    start = time.perf_counter()
+    costs = evaluate_tariffs(consumption, compiled, period_starts, seconds_per_time_step)
+    emissions = evaluate_carbon(consumption, intensities)
+    elapsed = time.perf_counter() - start
+
+    def frame(values, names, components=None):
+        df = pd.DataFrame(values, index=pd.Index(names, name='name'), columns=consumption_df.columns)
+        df['total'] = values.sum(axis=1)
+        for component, component_values in (components or {}).items():
+            df[component] = component_values.sum(axis=1)
+        return df
+
+    costs_df = frame(costs['total'], [t.name for t in tariffs], {k: costs[k] for k in ('energy', 'tiers', 'demand')})
+    emissions_df = frame(emissions, ['schema'] + [d['name'] for d in file_intensities])
+    print(f"{len(tariffs)} tariffs and {len(intensities)} carbon intensity series evaluated over "
+          f"{consumption.shape[0]} steps x {consumption.shape[1]} buildings in {elapsed*1000:.1f} ms")
+
+    if save:
+        for name, df in (('tariff_costs', costs_df), ('carbon_emissions_whatif', emissions_df)):
+            tmp_path = kpi_dir/f'.{name}.csv.tmp'
+            df.to_csv(tmp_path)
+            tmp_path.replace(kpi_dir/f'{name}.csv')
+        print(f"What-if costs and emissions saved to {kpi_dir}")
+    return costs_df, emissions_df
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Price a saved run under other tariffs and carbon intensities.')
+    parser.add_argument('--kpi-dir', default=None, help='Defaults to config.KPI_OUTPUT_DIR')
+    parser.add_argument('--tariffs', default=None, help='Defaults to config.TARIFF_FILE')
+    parser.add_argument('--schema', default=None, help='Defaults to config.SCHEMA_PATH')
+    parser.add_argument('--billing-period', default=None, choices=BILLING_PERIODS, help='Defaults to config.TARIFF_BILLING_PERIOD')
+    args = parser.parse_args()
+    costs, emissions = run_tariff_analysis(args.kpi_dir, args.tariffs, args.schema, args.billing_period)
+    with pd.option_context('display.width', 200, 'display.max_columns', 14):
+        print(costs[['total', 'energy', 'tiers', 'demand']].to_string())
+        print(emissions[['total']].to_string())
@@ -0,0 +1,11 @@
+from pathlib import Path
+from offline_simulator import validate_against_env
+
+SCHEMA_PATH = Path(__file__).resolve().parents[1] / 'schema.json'
+TOLERANCE = 1e-3
+
+def test_offline_simulator_matches_env():
+    errors = validate_against_env(str(SCHEMA_PATH), episode_time_steps=1000)
+
+    assert errors['soc'].max() < TOLERANCE
+    assert errors['net_electricity_consumption'].max() < TOLERANCE
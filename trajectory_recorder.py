@@ -0,0 +1,208 @@
+"""
+Records (observation, standardized action, reward) trajectories of a controller into
+preallocated float32 memory-mapped .npy files, e.g. as behavior-cloning data for PPO (see
+behavior_cloning.py):
+
+    trajectories/
+        observations.npy  (steps, n_buildings, n_observations), every building in one shared layout
+        actions.npy       (steps, n_buildings, 3), standardized [cooling, dhw, electrical] actions
+        rewards.npy       (steps, n_rewards), one reward per building (one for a central agent)
+        metadata.json     steps recorded, building and observation names, reward function, ...
+
+The arrays are allocated for the whole episode when recording starts and filled row by row, so
+recording never copies or grows them; load_trajectories memory-maps them back read-only.
+Observations a building does not have are zero, like in the PPO wrappers.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import config
+
+class TrajectoryRecorder:
+    """
+    Writes one row per environment step into the memory-mapped arrays of a trajectory directory.
+    The directory is written under a temporary name and renamed on close().
+    """
+    def __init__(self, directory, num_steps: int, env, metadata: dict = None):
+        """
+        Args:
+            directory (str): Trajectory directory, replaced on close() if it exists.
+            num_steps (int): Rows to allocate, at least the number of steps recorded.
+            env (CityLearnEnv): The recorded environment (building and observation names).
+            metadata (dict, optional): Extra entries of metadata.json.
+        """
+        from ppo_agent import ObservationBatcher
+
+        self.directory = Path(directory)
+        self._tmp_directory = self.directory.with_name(f'.{self.directory.name}.{os.getpid()}.tmp')
+        if self._tmp_directory.exists():
+            shutil.rmtree(self._tmp_directory)
+        self._tmp_directory.mkdir(parents=True)
+
+        building_observation_names = [list(b.observations().keys()) for b in env.buildings]
+        # Union of the buildings' observations, in order of appearance
+        self.observation_names = list(dict.fromkeys(name for names in building_observation_names for name in names))
+        self.batcher = ObservationBatcher(
+            building_observation_names, self.observation_names,
+            shared_observations=env.shared_observations if env.central_agent else None
+        )
+        num_buildings = len(env.buildings)
+        num_rewards = 1 if env.central_agent else num_buildings
+        self.metadata = {
+            'building_names': [b.name for b in env.buildings],
+            'observation_names': self.observation_names,
+            'building_observation_names': building_observation_names,
+            'central_agent': bool(env.central_agent),
+            **(metadata or {}),
+        }
+
+        open_memmap = np.lib.format.open_memmap
+        self.observations = open_memmap(self._tmp_directory / 'observations.npy', mode='w+', dtype=np.float32,
+                                        shape=(num_steps, num_buildings, len(self.observation_names)))
+        self.actions = open_memmap(self._tmp_directory / 'actions.npy', mode='w+', dtype=np.float32, shape=(num_steps, num_buildings, 3))
+        self.rewards = open_memmap(self._tmp_directory / 'rewards.npy', mode='w+', dtype=np.float32, shape=(num_steps, num_rewards))
+        self.steps = 0
+
+    def record(self, observations, actions, rewards):
+        """
+        Writes one step: the observations the actions were taken on, the (n_buildings, 3)
+        standardized actions and the rewards returned by env.step.
+        """
+        if self.steps >= len(self.actions):
+            raise ValueError(f"The recorder was allocated for {len(self.actions)} steps")
+        self.observations[self.steps] = self.batcher(observations)
+        self.actions[self.steps] = actions
+        self.rewards[self.steps] = rewards
+        self.steps += 1
+
+    def close(self):
+        """
+        Flushes the arrays, writes metadata.json and moves the files to the trajectory directory.
+
+        Returns:
+            Path: The trajectory directory.
+        """
+        for array in (self.observations, self.actions, self.rewards):
+            array.flush()
+        self.observations = self.actions = self.rewards = None # Releases the memory maps
+        with open(self._tmp_directory / 'metadata.json', 'w') as f:
+            json.dump({'steps': self.steps, **self.metadata}, f, indent=2)
+
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        os.replace(self._tmp_directory, self.directory)
+        print(f"{self.steps} steps of trajectories saved to {self.directory}")
+        return self.directory
+
+def recording_settings(schema_path, episode_time_steps: int, simulation_start_time_step: int = None, simulation_end_time_step: int = None):
+    """
+    Returns the settings a recording of an episode with these simulation settings depends on,
+    stored in its metadata.json.
+    """
+    from custom_rewards import get_reward_settings
+    return {
+        'schema_path': str(schema_path),
+        'episode_time_steps': episode_time_steps,
+        'simulation_start_time_step': simulation_start_time_step,
+        'simulation_end_time_step': simulation_end_time_step,
+        'reward_function': config.REWARD_FUNCTION,
+        'reward_function_kwargs': get_reward_settings(schema_path=schema_path)['reward_function_kwargs'],
+        'rbc': [config.RBC_CHARGE_START_HOUR, config.RBC_DISCHARGE_START_HOUR, config.RBC_DISCHARGE_END_HOUR,
+                config.RBC_CHARGE_ACTION, config.RBC_DISCHARGE_ACTION],
+    }
+
+def make_trajectory_recorder(env, schema_path, episode_time_steps: int, simulation_start_time_step: int = None,
+                             simulation_end_time_step: int = None, directory=None):
+    """
+    Creates a recorder for one episode of env in config.TRAJECTORY_DIR (or directory). The
+    simulation settings env was created with are stored in the metadata, see recording_settings.
+    """
+    return TrajectoryRecorder(
+        config.TRAJECTORY_DIR if directory is None else directory,
+        env.time_steps,
+        env,
+        metadata={
+            'agent_type': config.AGENT_TYPE,
+            **recording_settings(schema_path, episode_time_steps, simulation_start_time_step, simulation_end_time_step)
+        }
+    )
+
+def load_trajectories(directory=None):
+    """
+    Memory-maps the recorded trajectories (read-only), trimmed to the steps recorded.
+
+    Returns:
+        tuple: (observations, actions, rewards, metadata)
+    """
+    directory = Path(config.TRAJECTORY_DIR if directory is None else directory)
+    with open(directory / 'metadata.json') as f:
+        metadata = json.load(f)
+    steps = metadata['steps']
+    arrays = [np.load(directory / f'{name}.npy', mmap_mode='r')[:steps] for name in ('observations', 'actions', 'rewards')]
+    return (*arrays, metadata)
+
+def record_rbc_trajectories(schema_path=None, directory=None):
+    """
+    Runs one RBC episode with the settings in config (without writing KPIs) and records its trajectories.
+
+    Returns:
+        Path: The trajectory directory.
+    """
+    from custom_rewards import get_reward_settings
+    from dataset_cache import make_env
+    from rbc_agent import make_rbc
+    from translation_layer import TranslationLayer
+
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+    env = make_env(
+        schema_path,
+        episode_time_steps=config.EPISODE_TIME_STEPS,
+        simulation_start_time_step=config.SIMULATION_START_TIME_STEP,
+        simulation_end_time_step=config.SIMULATION_END_TIME_STEP,
+        **get_reward_settings(schema_path=schema_path)
+    )
+    translator = TranslationLayer(env.buildings)
+    agent = make_rbc(env)
+    recorder = make_trajectory_recorder(
+        env, schema_path, config.EPISODE_TIME_STEPS, config.SIMULATION_START_TIME_STEP, config.SIMULATION_END_TIME_STEP,
+        directory=directory
+    )
+
+    observations, _ = env.reset()
+    while not env.terminated:
+        standard_actions = agent.predict(observations)
+        next_observations, rewards, _, _, _ = env.step(translator.translate_batch(standard_actions))
+        recorder.record(observations, standard_actions, rewards)
+        observations = next_observations
+    return recorder.close()
+
+def ensure_rbc_trajectories(schema_path=None, directory=None):
+    """
+    Returns the trajectory directory, recording an RBC episode first if there is no recording
+    with the current schema, simulation period and reward function.
+    """
+    directory = Path(config.TRAJECTORY_DIR if directory is None else directory)
+    if (directory / 'metadata.json').exists():
+        with open(directory / 'metadata.json') as f:
+            metadata = json.load(f)
+        settings = recording_settings(
+            config.SCHEMA_PATH if schema_path is None else schema_path,
+            config.EPISODE_TIME_STEPS,
+            config.SIMULATION_START_TIME_STEP,
+            config.SIMULATION_END_TIME_STEP
+        )
+        settings = json.loads(json.dumps(settings))
+        if all(metadata.get(key) == value for key, value in settings.items()):
+            return directory
+    print(f"Recording RBC trajectories to {directory}")
+    return record_rbc_trajectories(schema_path, directory)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Record the trajectories of one RBC episode.')
+    parser.add_argument('--schema', default=None, help='Defaults to config.SCHEMA_PATH')
+    parser.add_argument('--output', default=None, help='Defaults to config.TRAJECTORY_DIR')
+    args = parser.parse_args()
+    record_rbc_trajectories(args.schema, args.output)
@@ -1,5 +1,8 @@
 import numpy as np
 
+# Order of the entries in a standardized action vector
+STANDARD_ACTION_KEYS = ('cooling_storage', 'dhw_storage', 'electrical_storage')
+
 class TranslationLayer:
     """
     This class is responsible for translating standardized actions from the agents
@@ -8,8 +11,51 @@ class TranslationLayer:
     def __init__(self, buildings):
         """
         Initializes the TranslationLayer with the metadata of the buildings' action spaces.
+
+        The metadata is turned into an (n_buildings, 3) boolean mask once, together with the
+        flat indices of its active entries, so translating a step is a single gather.
         """
         self.action_metadata = [b.action_metadata for b in buildings]
+        self.action_mask = np.array(
+            [[bool(metadata[key]) for key in STANDARD_ACTION_KEYS] for metadata in self.action_metadata],
+            dtype=bool
+        ).reshape(-1, len(STANDARD_ACTION_KEYS))
+        self.action_indices = np.flatnonzero(self.action_mask)
+
+        # Preallocated output: one flat buffer and a per-building view into it
+        self._output_buffer = np.zeros(len(self.action_indices))
+        self._output_views = np.split(self._output_buffer, np.cumsum(self.action_mask.sum(axis=1))[:-1])
+
+    def translate_batch(self, standard_actions):
+        """
+        Translates a matrix of standardized actions into environment-compatible actions.
+
+        Args:
+            standard_actions (np.array): An (n_buildings, 3) array of standardized actions.
+
+        Returns:
+            list of np.array: Per-building action arrays that can be passed to env.step().
+                The arrays are views into a buffer that is reused on the next call, so copy
+                them if they need to outlive the step.
+        """
+        standard_actions = np.asarray(standard_actions, dtype=self._output_buffer.dtype)
+        if standard_actions.shape != self.action_mask.shape:
+            raise ValueError(f"Expected standardized actions of shape {self.action_mask.shape}, got {standard_actions.shape}")
+        # The shape is checked, so the indices are in range ('raise' would buffer the output)
+        np.take(standard_actions.reshape(-1), self.action_indices, out=self._output_buffer, mode='clip')
+        return self._output_views
+
+    def translate_central(self, standard_actions):
+        """
+        Translates a matrix of standardized actions into the single action vector of a
+        central-agent environment (all buildings' actions concatenated in building order).
+
+        Returns:
+            list of np.array: A one-element list that can be passed to env.step(). The array is
+                reused on the next call.
+        """
+        self.translate_batch(standard_actions)
+        return [self._output_buffer]
 
     def translate_actions(self, standard_actions):
         """
@@ -22,18 +68,4 @@ class TranslationLayer:
         Returns:
             list of np.array: A list of action arrays that can be passed to env.step().
         """
-        translated_actions = []
-        for i, standard_action in enumerate(standard_actions):
-            building_action = []
-            metadata = self.action_metadata[i]
-            
-            if metadata['cooling_storage']:
-                building_action.append(standard_action[0])
-            if metadata['dhw_storage']:
-                building_action.append(standard_action[1])
-            if metadata['electrical_storage']:
-                building_action.append(standard_action[2])
-            
-            translated_actions.append(np.array(building_action))
-            
-        return translated_actions
+        return [action.copy() for action in self.translate_batch(standard_actions)]
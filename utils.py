@@ -1,4 +1,5 @@
 
+import json
 import shutil
 from pathlib import Path
 import citylearn
@@ -114,4 +115,59 @@ def print_schema_details(env):
         
     print("\n--- End of Schema Details ---")
 
+def load_schema(schema_path):
+    """
+    Loads a CityLearn schema from a schema.json path or a built-in dataset name.
+    """
+    if Path(schema_path).is_file():
+        with open(schema_path) as f:
+            return json.load(f)
+
+    from citylearn.data import DataSet
+    return DataSet().get_schema(schema_path)
+
+def get_building_names(schema):
+    """
+    Returns the names of the buildings that are included in the simulation.
+    """
+    return [name for name, building in schema['buildings'].items() if building.get('include', True)]
+
+def get_observation_names(schema):
+    """
+    Returns the names of the active observations in the order they are declared in the schema.
+    This is the superset of every building's observation vector.
+    """
+    return [name for name, observation in schema['observations'].items() if observation['active']]
+
+def split_episode_windows(start_time_step: int, end_time_step: int, num_windows: int, align: int = 1):
+    """
+    Splits the inclusive time step range [start, end] into contiguous windows.
+
+    Args:
+        align (int): Windows start a multiple of align time steps after start_time_step (e.g. 24
+            for whole days); fewer windows are returned if there are not enough multiples.
+
+    Returns:
+        list of (int, int): Inclusive (start, end) time steps of each window.
+    """
+    bounds = np.linspace(start_time_step, end_time_step + 1, num_windows + 1)
+    bounds = start_time_step + np.round((bounds - start_time_step)/align).astype(int)*align
+    bounds[-1] = end_time_step + 1
+    bounds = np.unique(np.minimum(bounds, end_time_step + 1))
+    return [(int(bounds[i]), int(bounds[i + 1]) - 1) for i in range(len(bounds) - 1)]
 
+def make_timestamps(start_time_step: int, time_steps: int, seconds_per_time_step: float = 3600.0, year: int = 2024):
+    """
+    Builds ISO timestamps for simulation time steps in the same format as the CityLearn exports
+    (time step 0 of the year is reported at the end of the first interval, e.g. 2024-01-01T01:00:00).
+    """
+    offsets = pd.to_timedelta((np.arange(start_time_step, start_time_step + time_steps) + 1)*seconds_per_time_step, unit='s')
+    index = pd.Timestamp(year=year, month=1, day=1) + offsets
+    return pd.Index(index.strftime('%Y-%m-%dT%H:%M:%S'), name='timestamp')
+
+def time_steps_from_timestamps(timestamps, seconds_per_time_step: float = 3600.0, year: int = 2024):
+    """
+    Returns the simulation time steps of timestamps built by make_timestamps (its inverse).
+    """
+    offsets = pd.to_datetime(pd.Index(timestamps)) - pd.Timestamp(year=year, month=1, day=1)
+    return np.round(offsets.total_seconds().to_numpy()/seconds_per_time_step).astype(int) - 1
@@ -0,0 +1,151 @@
+"""
+Evaluates the agent selected by config.AGENT_TYPE on K windows of the simulation period in
+parallel worker processes and aggregates their KPIs:
+
+    python window_evaluation.py --windows 12 --workers 6
+
+Every window is an independent episode, so the batteries start each window from their initial
+state of charge. The KPI files in config.KPI_OUTPUT_DIR cover the whole period (the windows'
+time series concatenated, with the overall summary), next to window_kpis.csv (one row per
+window) and window_kpi_statistics.csv (mean, std, min and max over the windows).
+"""
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+import config
+from sweep import run_configuration
+from utils import load_schema, split_episode_windows
+
+def evaluate(schema_path):
+    """
+    Runs the evaluation of config.AGENT_TYPE in a worker process and returns its summary KPIs.
+    """
+    import torch
+    torch.set_num_threads(1) # The workers already use every core
+
+    if config.AGENT_TYPE == 'RBC':
+        from experiment import run_rbc
+        return run_rbc(schema_path)
+    elif config.AGENT_TYPE == 'PPO':
+        from experiment import evaluate_ppo
+        return evaluate_ppo(schema_path)
+    else:
+        raise ValueError(f"Unknown AGENT_TYPE '{config.AGENT_TYPE}'. Use 'RBC' or 'PPO'.")
+
+def window_overrides(schema_path, num_windows: int):
+    """
+    Returns the config overrides that restrict a run to each window.
+
+    Windows start at whole days: CityLearn sizes the DHW heater assuming the storage tank can
+    cover peaks, so an episode starting with an empty tank at a high-demand hour fails.
+    An episode of N time steps applies N - 1 actions, so every window but the last is simulated
+    one time step longer to act on all of its own time steps.
+    """
+    schema = load_schema(schema_path)
+    start = schema['simulation_start_time_step'] if config.SIMULATION_START_TIME_STEP is None else config.SIMULATION_START_TIME_STEP
+    end = schema['simulation_end_time_step'] if config.SIMULATION_END_TIME_STEP is None else config.SIMULATION_END_TIME_STEP
+
+    day = max(int(round(86400/schema['seconds_per_time_step'])), 1)
+
+    overrides = []
+    for window_start, window_end in split_episode_windows(start, end, num_windows, align=day):
+        simulation_end = min(window_end + 1, end)
+        overrides.append({
+            'SIMULATION_START_TIME_STEP': window_start,
+            'SIMULATION_END_TIME_STEP': simulation_end,
+            'EPISODE_TIME_STEPS': simulation_end - window_start + 1,
+            'PPO_MODEL_PATH': str(Path(config.PPO_MODEL_PATH).resolve()),
+            'RUN_REGISTRY': False, # Only the aggregated evaluation is registered
+        })
+    return overrides
+
+def aggregate_summaries(summaries):
+    """
+    Combines the summary KPIs of consecutive windows: maxima for the peak KPIs, sums otherwise.
+    """
+    return {
+        key: max(summary[key] for summary in summaries) if key.startswith('max_') else sum(summary[key] for summary in summaries)
+        for key in summaries[0]
+    }
+
+def run_window_evaluation(schema_path=None, num_windows: int = None, max_workers: int = None, output_dir=None):
+    """
+    Evaluates the windows concurrently and saves the aggregated KPIs to config.KPI_OUTPUT_DIR.
+
+    Args:
+        schema_path (str, optional): Defaults to config.SCHEMA_PATH.
+        num_windows (int, optional): Defaults to config.EVAL_NUM_WINDOWS.
+        max_workers (int, optional): Defaults to config.EVAL_MAX_WORKERS.
+        output_dir (str, optional): Directory of the per-window runs, defaults to BASE_OUTPUT_DIR/windows.
+
+    Returns:
+        dict: The overall summary KPIs.
+    """
+    from kpi_calculator import save_kpis
+    from kpi_storage import get_storage
+
+    schema_path = config.SCHEMA_PATH if schema_path is None else schema_path
+    num_windows = config.EVAL_NUM_WINDOWS if num_windows is None else num_windows
+    max_workers = config.EVAL_MAX_WORKERS if max_workers is None else max_workers
+    output_dir = Path(config.BASE_OUTPUT_DIR) / 'windows' if output_dir is None else Path(output_dir)
+    kpi_output_dir = Path(config.KPI_OUTPUT_DIR)
+    configurations = window_overrides(schema_path, num_windows)
+
+    summaries = [None]*len(configurations)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_configuration, output_dir / f'window_{i:03d}', overrides, evaluate): i
+            for i, overrides in enumerate(configurations)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                summaries[i] = future.result()
+                print(f"Window {i} finished ({sum(summary is not None for summary in summaries)}/{len(configurations)})")
+            except Exception:
+                print(f"Window {i} failed: {traceback.format_exc(limit=1).strip().splitlines()[-1]}")
+
+    if any(summary is None for summary in summaries):
+        raise RuntimeError('Not all windows could be evaluated, see the errors above.')
+
+    # Per-window table and statistics
+    window_df = pd.DataFrame(summaries)
+    window_df.insert(0, 'window', range(len(configurations)))
+    window_df.insert(1, 'start_time_step', [overrides['SIMULATION_START_TIME_STEP'] for overrides in configurations])
+    window_df.insert(2, 'end_time_step', [overrides['SIMULATION_END_TIME_STEP'] for overrides in configurations])
+    statistics_df = window_df[list(summaries[0])].agg(['mean', 'std', 'min', 'max'])
+    summary = aggregate_summaries(summaries)
+
+    # Whole-period KPI time series from the windows' files
+    storage = get_storage()
+    kpi_dfs = {}
+    for i in range(len(configurations)):
+        window_kpi_dfs, _ = storage.load(output_dir / f'window_{i:03d}' / 'calculated_kpis')
+        for kpi_name, df in window_kpi_dfs.items():
+            kpi_dfs.setdefault(kpi_name, []).append(df)
+    kpi_dfs = {kpi_name: pd.concat(dfs) for kpi_name, dfs in kpi_dfs.items()}
+
+    if kpi_dfs:
+        save_kpis(kpi_dfs, kpi_output_dir, summary, storage=storage)
+    else:
+        kpi_output_dir.mkdir(parents=True, exist_ok=True)
+        storage.save_summary(summary, kpi_output_dir)
+
+    window_df.to_csv(kpi_output_dir / 'window_kpis.csv', index=False)
+    statistics_df.to_csv(kpi_output_dir / 'window_kpi_statistics.csv', index_label='statistic')
+    print(f"Window evaluation finished. {len(configurations)} windows aggregated in {kpi_output_dir}")
+
+    if config.RUN_REGISTRY:
+        from run_registry import register_run
+        register_run(summary, config.AGENT_TYPE, schema_path, kpi_output_dir, label=config.RUN_LABEL or f'{len(configurations)} windows')
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate config.AGENT_TYPE on parallel windows of the simulation period.')
+    parser.add_argument('--schema', default=None, help='Defaults to config.SCHEMA_PATH')
+    parser.add_argument('--windows', type=int, default=None, help='Number of windows, defaults to config.EVAL_NUM_WINDOWS')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+    run_window_evaluation(args.schema, num_windows=args.windows, max_workers=args.workers)